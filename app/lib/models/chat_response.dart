@@ -3,8 +3,10 @@ import 'chat_reference.dart';
 class ChatApiResponse {
   final String response;
   final List<ChatReference> references;
+  final String? sessionId;
 
-  const ChatApiResponse({required this.response, this.references = const []});
+  const ChatApiResponse(
+      {required this.response, this.references = const [], this.sessionId});
 
   factory ChatApiResponse.fromJson(Map<String, dynamic> json) =>
       ChatApiResponse(
@@ -13,5 +15,6 @@ class ChatApiResponse {
                 ?.map((e) => ChatReference.fromJson(e as Map<String, dynamic>))
                 .toList() ??
             [],
+        sessionId: json['session_id'] as String?,
       );
 }
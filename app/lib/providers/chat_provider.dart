@@ -13,12 +13,15 @@ class ChatState {
   final bool isSending;
   final String? selectedPostId;
   final String? selectedPostTitle;
+  // Server-side conversation, so follow-up questions keep their context
+  final String? sessionId;
 
   const ChatState({
     this.messages = const [],
     this.isSending = false,
     this.selectedPostId,
     this.selectedPostTitle,
+    this.sessionId,
   });
 
   ChatState copyWith({
@@ -26,6 +29,7 @@ class ChatState {
     bool? isSending,
     String? selectedPostId,
     String? selectedPostTitle,
+    String? sessionId,
     bool clearPost = false,
   }) {
     return ChatState(
@@ -34,6 +38,7 @@ class ChatState {
       selectedPostId: clearPost ? null : (selectedPostId ?? this.selectedPostId),
       selectedPostTitle:
           clearPost ? null : (selectedPostTitle ?? this.selectedPostTitle),
+      sessionId: sessionId ?? this.sessionId,
     );
   }
 }
@@ -68,6 +73,7 @@ class ChatNotifier extends StateNotifier<ChatState> {
       final response = await ChatService().chatWithAgent(
         text,
         postId: state.selectedPostId,
+        sessionId: state.sessionId,
       );
       final aiMsg = ChatMessage(
         role: MessageRole.assistant,
@@ -77,6 +83,7 @@ class ChatNotifier extends StateNotifier<ChatState> {
       state = state.copyWith(
         messages: [...state.messages, aiMsg],
         isSending: false,
+        sessionId: response.sessionId,
       );
     } catch (e) {
       final locale = ref.read(localeProvider);
@@ -5,12 +5,14 @@ class ChatService {
   final _dio = DioClient().dio;
 
   Future<ChatApiResponse> chatWithAgent(String message,
-      {String? postId}) async {
+      {String? postId, String? sessionId}) async {
     final data = <String, dynamic>{
       'agent_name': 'knowledge',
       'message': message,
     };
     if (postId != null) data['post_id'] = postId;
+    // Continue the conversation the server returned for the previous message
+    if (sessionId != null) data['session_id'] = sessionId;
 
     final response = await _dio.post('/api/chat', data: data);
     return ChatApiResponse.fromJson(response.data as Map<String, dynamic>);
@@ -3,7 +3,9 @@ ADK Agent — Knowledge Base Agent
 使用 Google ADK (Agent Development Kit) 创建知识库 AI 代理
 """
 
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+import threading
+from google.adk import Runner
 from google.adk.agents import Agent
 from knowledge_base_agent import create_knowledge_base_agent
 from database import get_current_model
@@ -20,11 +22,17 @@ def _build_registry() -> Dict[str, Agent]:
 
 AGENT_REGISTRY: Dict[str, Agent] = _build_registry()
 
+# Runners are reused across requests; keyed by (agent name, model)
+_RUNNERS: Dict[Tuple[str, str], Runner] = {}
+_runners_lock = threading.Lock()
+
 
 def rebuild_agents():
     """Rebuild all agents (e.g. after model change)."""
     global AGENT_REGISTRY
     AGENT_REGISTRY = _build_registry()
+    with _runners_lock:
+        _RUNNERS.clear()
     print(f"Agents rebuilt with model: {get_current_model()}")
 
 
@@ -35,6 +43,25 @@ def get_agent(agent_name: str) -> Optional[Agent]:
     return AGENT_REGISTRY.get(agent_name.lower())
 
 
+def get_runner(agent_name: str, app_name: str, session_service) -> Optional[Runner]:
+    """
+    Get the shared runner for an agent, creating it on first use / 获取代理的共享运行器
+
+    Runners hold no per-request state, so one per (agent, model) serves all
+    chats; rebuild_agents() drops them along with the old agents.
+    """
+    agent = get_agent(agent_name)
+    if agent is None:
+        return None
+    key = (agent_name.lower(), str(agent.model))
+    with _runners_lock:
+        runner = _RUNNERS.get(key)
+        if runner is None or runner.agent is not agent:
+            runner = Runner(app_name=app_name, agent=agent, session_service=session_service)
+            _RUNNERS[key] = runner
+        return runner
+
+
 def list_agents() -> List[str]:
     """
     List all available agent names / 列出所有可用的代理名称
@@ -5,12 +5,13 @@ Admin API endpoints for managing API keys and posts
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import asyncio
 import uuid
 from datetime import datetime
 
 from database import (
     get_db, APIKey, Post, AdminUser, sync_api_keys_to_env,
-    get_current_model, set_current_model, AVAILABLE_MODELS,
+    get_current_model, set_current_model, AVAILABLE_MODELS, bump_kb_version,
 )
 from models import (
     R,
@@ -184,6 +185,8 @@ async def create_api_key(
     db.commit()
     db.refresh(api_key)
     sync_api_keys_to_env()
+    if api_key.key_type == "openai":
+        _reload_embeddings()
 
     resp = APIKeyResponse(
         id=api_key.id,
@@ -249,6 +252,8 @@ async def update_api_key(
     db.commit()
     db.refresh(api_key)
     sync_api_keys_to_env()
+    if api_key.key_type == "openai":
+        _reload_embeddings()
 
     resp = APIKeyResponse(
         id=api_key.id,
@@ -275,12 +280,25 @@ async def delete_api_key(
     if not api_key:
         raise HTTPException(status_code=404, detail="API key not found")
 
+    key_type = api_key.key_type
     db.delete(api_key)
     db.commit()
     sync_api_keys_to_env()
+    if key_type == "openai":
+        _reload_embeddings()
     return R.ok()
 
 
+def _reload_embeddings():
+    """Re-create the knowledge base embeddings with the new key, here and in the other workers"""
+    try:
+        from knowledge_base_agent import _index_worker
+        _index_worker.submit_reload()
+    except Exception as e:
+        print(f"Warning: Failed to reload embeddings: {e}")
+    _bump_kb_version()
+
+
 def mask_api_key(key_value: str) -> str:
     """Mask API key for display (show first 4 and last 4 characters)"""
     if len(key_value) <= 8:
@@ -336,8 +354,83 @@ async def update_model(
     return R.ok({"model": model_id})
 
 
+# ==================== Knowledge Base ====================
+
+@router.get("/knowledge-base/stats")
+async def get_knowledge_base_stats(
+    current_admin: AdminUser = Depends(get_current_admin),
+):
+    """Get knowledge base index size and cache statistics"""
+    from knowledge_base_agent import _knowledge_base, _index_worker, _kb_sync
+    data = _knowledge_base.stats()
+    data["index_worker"] = _index_worker.stats()
+    data["sync"] = _kb_sync.stats()
+    return R.ok(data)
+
+
+@router.get("/chat-sessions/stats")
+async def get_chat_session_stats(
+    current_admin: AdminUser = Depends(get_current_admin),
+):
+    """Get chat session store size, memory use and eviction counters"""
+    from main import _session_service
+    return R.ok(_session_service.stats())
+
+
+@router.get("/knowledge-base/recall")
+async def get_knowledge_base_recall(
+    sample: int = 50,
+    top_k: int = 10,
+    current_admin: AdminUser = Depends(get_current_admin),
+):
+    """Measure search recall@k of the live index (approximate / quantized) against exact search"""
+    from knowledge_base_agent import _knowledge_base
+    return R.ok(await asyncio.to_thread(_knowledge_base.recall_at_k, sample, top_k))
+
+
+@router.post("/knowledge-base/rebuild")
+async def rebuild_knowledge_base(
+    current_admin: AdminUser = Depends(get_current_admin),
+):
+    """Reload all posts and rebuild the vector index in the background"""
+    from knowledge_base_agent import _index_worker
+    job = _index_worker.submit_rebuild()
+    return R.ok(job.model_dump())
+
+
+@router.get("/knowledge-base/jobs")
+async def list_index_jobs(
+    limit: int = 50,
+    current_admin: AdminUser = Depends(get_current_admin),
+):
+    """List recent index jobs, newest first"""
+    from knowledge_base_agent import _index_worker
+    return R.ok([job.model_dump() for job in _index_worker.list_jobs(limit)])
+
+
+@router.get("/knowledge-base/jobs/{job_id}")
+async def get_index_job(
+    job_id: str,
+    current_admin: AdminUser = Depends(get_current_admin),
+):
+    """Get the status and progress of an index job"""
+    from knowledge_base_agent import _index_worker
+    job = _index_worker.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Index job not found")
+    return R.ok(job.model_dump())
+
+
 # ==================== Post Management ====================
 
+def _bump_kb_version():
+    """Signal the other API workers that posts changed"""
+    try:
+        bump_kb_version()
+    except Exception as e:
+        print(f"Warning: Failed to bump knowledge base version: {e}")
+
+
 @router.get("/posts")
 async def list_posts(
     skip: int = 0,
@@ -395,20 +488,14 @@ async def create_post(
     db.commit()
     db.refresh(post)
 
-    # Trigger RAG update
-    from knowledge_base_agent import _knowledge_base
+    # Trigger RAG update in the background; searches use the old index until it is ready
+    index_job_id = None
     try:
-        from knowledge_base_agent import Post as KBPost
-        kb_post = KBPost(
-            id=post.id,
-            title=post.title,
-            content=post.content,
-            tags=post_data.tags,
-            language=post_data.language,
-        )
-        _knowledge_base.add_post(kb_post)
+        from knowledge_base_agent import Post as KBPost, _index_worker
+        index_job_id = _index_worker.submit_upsert(KBPost.from_db(post)).id
     except Exception as e:
         print(f"Warning: Failed to update RAG vector store: {e}")
+    _bump_kb_version()
 
     resp = PostResponse(
         id=post.id,
@@ -420,7 +507,7 @@ async def create_post(
         updated_at=post.updated_at,
         is_active=post.is_active
     )
-    return R.ok(resp.model_dump())
+    return R.ok({**resp.model_dump(), "index_job_id": index_job_id})
 
 
 @router.get("/posts/{post_id}")
@@ -475,13 +562,17 @@ async def update_post(
     db.commit()
     db.refresh(post)
 
-    # Trigger RAG update: reload posts from MySQL first, then rebuild vectors
-    from knowledge_base_agent import _knowledge_base
+    # Trigger RAG update: re-embed only this post (or drop it if deactivated)
+    index_job_id = None
     try:
-        _knowledge_base.load_posts()
-        _knowledge_base._generate_all_embeddings()
+        from knowledge_base_agent import Post as KBPost, _index_worker
+        if post.is_active:
+            index_job_id = _index_worker.submit_upsert(KBPost.from_db(post)).id
+        else:
+            index_job_id = _index_worker.submit_delete(post.id).id
     except Exception as e:
         print(f"Warning: Failed to update RAG vector store: {e}")
+    _bump_kb_version()
 
     tags = post.tags.split(",") if post.tags else []
     resp = PostResponse(
@@ -494,7 +585,7 @@ async def update_post(
         updated_at=post.updated_at,
         is_active=post.is_active
     )
-    return R.ok(resp.model_dump())
+    return R.ok({**resp.model_dump(), "index_job_id": index_job_id})
 
 
 @router.delete("/posts/{post_id}")
@@ -511,23 +602,17 @@ async def delete_post(
     db.delete(post)
     db.commit()
 
-    # Trigger RAG update: reload posts and rebuild vectors
-    from knowledge_base_agent import _knowledge_base
+    # Trigger RAG update: drop this post's vectors from the index
+    index_job_id = None
     try:
-        _knowledge_base.load_posts()
-        _knowledge_base._generate_all_embeddings()
+        from knowledge_base_agent import _index_worker
+        index_job_id = _index_worker.submit_delete(post_id).id
     except Exception as e:
         print(f"Warning: Failed to update RAG vector store: {e}")
+    _bump_kb_version()
 
-    # Clear knowledge agent session so stale chat history won't affect future answers
-    try:
-        from main import _session_service
-        _session_service.delete_session_sync(
-            user_id="api_user",
-            session_id="api_knowledge",
-            app_name="agents"
-        )
-    except Exception as e:
-        print(f"Warning: Failed to clear knowledge session: {e}")
+    # Chat sessions are left alone. New searches no longer return the post,
+    # but search results and answers already in a conversation (and its
+    # rolling summary) still quote it until they age out of the history budget
 
-    return R.ok()
+    return R.ok({"index_job_id": index_job_id})
@@ -0,0 +1,187 @@
+"""
+Bounded chat history for agent sessions
+
+Each chat session keeps its recent turns verbatim and folds older turns into
+a short rolling summary, so prompt size (and LLM latency) stays flat however
+long a conversation runs:
+
+- compact_session: once a session holds more than CHAT_MAX_EVENTS events,
+  older turns are summarized into session state and dropped from the
+  session, so stored history and per-request session loading stay bounded
+- trim_history: agent before_model_callback that keeps the newest turns
+  within CHAT_MAX_TOKENS of prompt history and passes everything older to
+  the model as the summary instead
+
+Summaries are extractive (the user's question and the start of the answer
+per turn), so they cost no extra LLM calls.
+"""
+
+from typing import List, Optional, Tuple
+import os
+import re
+
+CHAT_MAX_EVENTS = int(os.getenv("CHAT_MAX_EVENTS", "40"))
+CHAT_MAX_TOKENS = int(os.getenv("CHAT_MAX_TOKENS", "4000"))
+CHAT_SUMMARY_CHARS = int(os.getenv("CHAT_SUMMARY_CHARS", "2000"))
+
+# Session state key holding the summary of turns dropped from the session
+SUMMARY_STATE_KEY = "history_summary"
+
+_QUESTION_CHARS = 200
+_ANSWER_CHARS = 300
+_WHITESPACE_RE = re.compile(r"\s+")
+_ARTICLE_QUESTION = "User question:"
+_LANGUAGE_NOTE = "\n\n[IMPORTANT: You MUST respond in"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: about 4 characters per token, one per CJK/non-ASCII character"""
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return (len(text) - non_ascii) // 4 + non_ascii + 1
+
+
+def _content_text(content) -> str:
+    if content is None or not content.parts:
+        return ""
+    return "\n".join(part.text for part in content.parts if part.text and not getattr(part, "thought", False))
+
+
+def _content_tokens(content) -> int:
+    if content is None or not content.parts:
+        return 1
+    tokens = 0
+    for part in content.parts:
+        if part.text:
+            tokens += estimate_tokens(part.text)
+        elif part.function_call:
+            tokens += estimate_tokens(str(part.function_call.args or ""))
+        elif part.function_response:
+            tokens += estimate_tokens(str(part.function_response.response or ""))
+    return tokens or 1
+
+
+def _starts_turn(content) -> bool:
+    """A user message, as opposed to a tool response (also sent with the user role)"""
+    if content is None or content.role != "user" or not content.parts:
+        return False
+    return any(part.text for part in content.parts) and not any(part.function_response for part in content.parts)
+
+
+def _clip(text: str, limit: int) -> str:
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def _question(text: str) -> str:
+    """The user's own words, without the article context and language note main.py adds"""
+    if _ARTICLE_QUESTION in text:
+        text = text.split(_ARTICLE_QUESTION, 1)[1]
+    return text.split(_LANGUAGE_NOTE, 1)[0]
+
+
+def summarize_contents(contents: List) -> List[str]:
+    """One 'User: ...' line per turn and one 'Assistant: ...' line per answer"""
+    lines = []
+    answer = ""
+    for content in contents:
+        if _starts_turn(content):
+            if answer:
+                lines.append("Assistant: " + _clip(answer, _ANSWER_CHARS))
+                answer = ""
+            lines.append("User: " + _clip(_question(_content_text(content)), _QUESTION_CHARS))
+        elif content is not None and content.role == "model":
+            # The final text of a turn is the answer; tool-call chatter is skipped
+            answer = _content_text(content) or answer
+    if answer:
+        lines.append("Assistant: " + _clip(answer, _ANSWER_CHARS))
+    return lines
+
+
+def merge_summary(summary: Optional[str], lines: List[str], limit: Optional[int] = None) -> str:
+    """Append lines to a rolling summary, dropping its oldest lines past the character limit"""
+    limit = CHAT_SUMMARY_CHARS if limit is None else limit
+    merged = (summary.split("\n") if summary else []) + lines
+    while merged and sum(len(line) + 1 for line in merged) > limit:
+        merged.pop(0)
+    return "\n".join(merged)
+
+
+def _split_point(contents: List, keep_from: int) -> int:
+    """Move a cut forward to the next turn start so no turn is split"""
+    for i in range(keep_from, len(contents)):
+        if _starts_turn(contents[i]):
+            return i
+    return len(contents)
+
+
+def trim_history(callback_context, llm_request):
+    """
+    before_model_callback: bound the history sent to the model
+
+    The current turn is always kept whole. Earlier turns are kept newest
+    first while they fit in CHAT_MAX_TOKENS; the rest, plus the summary of
+    turns already compacted out of the session, go into the system
+    instruction as a short summary.
+    """
+    contents = llm_request.contents or []
+    current = len(contents)
+    while current > 0 and not _starts_turn(contents[current - 1]):
+        current -= 1
+    current = max(current - 1, 0)
+
+    budget = CHAT_MAX_TOKENS - sum(_content_tokens(content) for content in contents[current:])
+    keep_from = current
+    for i in range(current - 1, -1, -1):
+        budget -= _content_tokens(contents[i])
+        if budget < 0:
+            break
+        if _starts_turn(contents[i]):
+            keep_from = i
+
+    summary = callback_context.state.get(SUMMARY_STATE_KEY)
+    if keep_from > 0:
+        summary = merge_summary(summary, summarize_contents(contents[:keep_from]))
+        llm_request.contents = contents[keep_from:]
+    if summary:
+        llm_request.append_instructions([
+            "Summary of the earlier conversation with this user (older turns, condensed):\n" + summary
+        ])
+    return None
+
+
+async def compact_session(session_service, app_name: str, user_id: str, session_id: str,
+                          max_events: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Fold old turns of an over-budget session into its rolling summary
+
+    Keeps the newest turns within half of max_events, so compaction runs once
+    every few turns rather than on every request. The session is recreated
+    with the merged summary in its state and the kept events replayed.
+
+    Returns:
+        (events before, events after)
+    """
+    max_events = CHAT_MAX_EVENTS if max_events is None else max_events
+    session = await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+    if session is None or len(session.events) <= max_events:
+        count = len(session.events) if session else 0
+        return count, count
+
+    events = session.events
+    contents = [event.content for event in events]
+    cut = _split_point(contents, len(events) - max(max_events // 2, 1))
+    if cut >= len(events):
+        # The newest turn alone is over budget: keep just that turn
+        cut = max((i for i, content in enumerate(contents) if _starts_turn(content)), default=0)
+    if cut == 0:
+        return len(events), len(events)
+
+    state = dict(session.state)
+    state[SUMMARY_STATE_KEY] = merge_summary(state.get(SUMMARY_STATE_KEY), summarize_contents(contents[:cut]))
+    await session_service.delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+    compacted = await session_service.create_session(
+        app_name=app_name, user_id=user_id, session_id=session_id, state=state
+    )
+    for event in events[cut:]:
+        await session_service.append_event(compacted, event)
+    return len(events), len(events) - cut
@@ -0,0 +1,199 @@
+"""
+Token-aware chunking of posts for chunk-level indexing
+
+Posts are split at markdown headings, then paragraphs, and paragraphs are
+packed into chunks up to a token budget. Consecutive chunks of a section
+overlap: each starts with the last KB_CHUNK_OVERLAP tokens of the previous
+one, cut from the text itself, so the overlap holds whether the split fell
+between paragraphs, sentences or character windows (long CJK runs).
+Chunk offsets refer to the post content so search hits can point at the
+exact text that matched.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import os
+import re
+
+from pydantic import BaseModel
+
+
+# ==================== Configuration ====================
+
+CHUNK_TOKENS = int(os.getenv("KB_CHUNK_TOKENS", "500"))
+CHUNK_OVERLAP = int(os.getenv("KB_CHUNK_OVERLAP", "50"))
+# How chunk hits are merged into a post score: "max" or "sum"
+CHUNK_SCORE_MODE = os.getenv("KB_CHUNK_SCORE", "max").lower()
+
+
+# Bumped when the chunking algorithm changes, so saved indexes are rebuilt
+CHUNKER_VERSION = 2
+
+
+def chunk_config() -> Dict:
+    """Settings that affect indexed documents (stored in the index manifest)"""
+    return {"tokens": CHUNK_TOKENS, "overlap": CHUNK_OVERLAP, "version": CHUNKER_VERSION}
+
+
+# ==================== Token Counting ====================
+
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+_encoding = None
+_encoding_failed = False
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens with tiktoken when available, otherwise estimate
+
+    The estimate counts each CJK character as one token and roughly four
+    characters per token for everything else.
+    """
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding_failed = True
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+# ==================== Chunking ====================
+
+class Chunk(BaseModel):
+    """A slice of a post's content"""
+    index: int
+    start: int
+    end: int
+    text: str
+
+
+_HEADING_RE = re.compile(r"^#{1,6}\s", re.MULTILINE)
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[。！？!?.;；])\s*")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _split_spans(text: str, start: int, end: int, pattern: re.Pattern) -> List[Tuple[int, int]]:
+    """Split text[start:end] at pattern matches, dropping empty spans"""
+    spans = []
+    pos = start
+    for m in pattern.finditer(text, start, end):
+        if m.start() > pos:
+            spans.append((pos, m.start()))
+        pos = max(pos, m.end())
+    if end > pos:
+        spans.append((pos, end))
+    return [(s, e) for s, e in spans if text[s:e].strip()]
+
+
+def _split_long(text: str, start: int, end: int, max_tokens: int) -> List[Tuple[int, int]]:
+    """Split an over-budget span at sentence boundaries, then by characters"""
+    units = []
+    for s, e in _split_spans(text, start, end, _SENTENCE_RE):
+        if count_tokens(text[s:e]) <= max_tokens:
+            units.append((s, e))
+            continue
+        # A single sentence over budget: cut by a character window
+        ratio = max(1, (e - s) // max(1, count_tokens(text[s:e])))
+        step = max(1, max_tokens * ratio)
+        for i in range(s, e, step):
+            units.append((i, min(e, i + step)))
+    return units
+
+
+def _units(text: str, max_tokens: int) -> List[Tuple[int, int, bool]]:
+    """
+    Atomic spans to pack into chunks
+
+    Returns:
+        (start, end, starts_section) tuples; a new section forces a chunk boundary
+    """
+    section_starts = [m.start() for m in _HEADING_RE.finditer(text)]
+    bounds = sorted(set([0] + section_starts + [len(text)]))
+    units = []
+    for s, e in zip(bounds, bounds[1:]):
+        first = True
+        for ps, pe in _split_spans(text, s, e, _PARAGRAPH_RE):
+            pieces = [(ps, pe)] if count_tokens(text[ps:pe]) <= max_tokens else _split_long(text, ps, pe, max_tokens)
+            for us, ue in pieces:
+                units.append((us, ue, first))
+                first = False
+    return units
+
+
+def _overlap_start(text: str, start: int, end: int, overlap_tokens: int) -> int:
+    """
+    Start of the longest tail of text[start:end] within overlap_tokens
+
+    The tail is moved forward to a word boundary when one is close, so
+    overlaps do not begin mid-word (CJK text has none and is cut anywhere).
+    """
+    lo, hi = start, end
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if count_tokens(text[mid:end]) <= overlap_tokens:
+            hi = mid
+        else:
+            lo = mid + 1
+    if start < lo < end and not text[lo - 1].isspace():
+        m = _SPACE_RE.search(text, lo, end)
+        if m and m.end() - lo <= (end - lo) // 4:
+            return m.end()
+    return lo
+
+
+def split_text(text: str, max_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None) -> List[Chunk]:
+    """
+    Split text into chunks by headings, paragraphs and a token budget
+
+    Args:
+        text: Text to split (usually a post's content)
+        max_tokens: Token budget per chunk (default: KB_CHUNK_TOKENS)
+        overlap_tokens: Tokens of the previous chunk's tail repeated at the
+            start of the next chunk in the same section (default: KB_CHUNK_OVERLAP)
+
+    Returns:
+        Chunks in document order, with offsets into text
+    """
+    max_tokens = max_tokens or CHUNK_TOKENS
+    overlap_tokens = CHUNK_OVERLAP if overlap_tokens is None else overlap_tokens
+
+    # Units leave room for the overlap, so an overlap plus one unit fits the budget
+    units = _units(text, max_tokens - overlap_tokens if overlap_tokens < max_tokens else max_tokens)
+    if not units:
+        return [Chunk(index=0, start=0, end=len(text), text=text)] if text else []
+
+    # Tokens of each unit, counting the separator before it (spaces, blank lines)
+    tokens = [count_tokens(text[units[n - 1][1] if n else s:e]) for n, (s, e, _) in enumerate(units)]
+    chunks: List[Chunk] = []
+    i = 0
+    start = units[0][0]
+    while i < len(units):
+        j = i
+        budget = count_tokens(text[start:units[i][0]]) if start < units[i][0] else 0
+        while j < len(units) and (j == i or (not units[j][2] and budget + tokens[j] <= max_tokens)):
+            budget += tokens[j]
+            j += 1
+        end = units[j - 1][1]
+        chunks.append(Chunk(index=len(chunks), start=start, end=end, text=text[start:end]))
+        if j >= len(units):
+            break
+
+        # The next chunk repeats the tail of this one, within the section
+        i = j
+        start = units[j][0]
+        if overlap_tokens > 0 and not units[j][2]:
+            start = _overlap_start(text, chunks[-1].start, end, overlap_tokens)
+    return chunks
+
+
+def merge_scores(scores: List[float], mode: Optional[str] = None) -> float:
+    """Combine chunk scores of one post into a post score ("max" or "sum")"""
+    mode = mode or CHUNK_SCORE_MODE
+    if mode == "sum":
+        return float(sum(scores))
+    return float(max(scores))
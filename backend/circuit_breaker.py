@@ -0,0 +1,152 @@
+"""
+Circuit breaker for embedding provider calls
+
+After KB_BREAKER_FAILURES consecutive failures the breaker opens: embedding
+calls fail immediately instead of each waiting on a provider that is down,
+and searches fall back to keyword search. Once KB_BREAKER_RESET_SECONDS
+have passed, one trial call is let through; if it succeeds the breaker
+closes again, otherwise it stays open for another period.
+"""
+
+from typing import Dict, List, Optional
+import os
+import threading
+import time
+
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:
+    try:
+        from langchain.embeddings.base import Embeddings
+    except ImportError:
+        Embeddings = object
+
+FAILURE_THRESHOLD = int(os.getenv("KB_BREAKER_FAILURES", "3"))
+RESET_TIMEOUT = float(os.getenv("KB_BREAKER_RESET_SECONDS", "30"))
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the provider while the breaker is open"""
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open trial -> closed"""
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.name = name
+        self.failure_threshold = max(1, FAILURE_THRESHOLD if failure_threshold is None else failure_threshold)
+        self.reset_timeout = RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.rejected = 0
+        self.trips = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """
+        Admit a call or reject it
+
+        Raises:
+            CircuitOpenError: While open, or while a half-open trial is in flight
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"{self.name} unavailable (circuit open): {self.last_error}")
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"{self.name} recovered, circuit closed")
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if self._trial or (self.opened_at is None and self.failures >= self.failure_threshold):
+                if self.opened_at is None:
+                    self.trips += 1
+                    print(f"Warning: {self.name} failing ({error}), circuit open for {self.reset_timeout:g}s")
+                # A failed trial restarts the wait
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+    def release(self):
+        """End an admitted call that neither succeeded nor failed (e.g. cancelled)"""
+        with self._lock:
+            self._trial = False
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+            "failure_threshold": self.failure_threshold,
+            "reset_seconds": self.reset_timeout,
+        }
+
+
+class GuardedEmbeddings(Embeddings):
+    """Embeddings wrapper that sends every provider call through a circuit breaker"""
+
+    def __init__(self, embeddings, breaker: CircuitBreaker):
+        self.embeddings = embeddings
+        self.breaker = breaker
+        # Keeps cache keys and saved index manifests tied to the real model
+        self.model = getattr(embeddings, "model", None) or type(embeddings).__name__
+
+    def _call(self, fn, *args):
+        self.breaker.before_call()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            self.breaker.record_failure(e)
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def _acall(self, fn, *args):
+        self.breaker.before_call()
+        try:
+            result = await fn(*args)
+        except BaseException as e:
+            # Cancellation says nothing about the provider, but must end a trial
+            if isinstance(e, Exception):
+                self.breaker.record_failure(e)
+            else:
+                self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._call(self.embeddings.embed_documents, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call(self.embeddings.embed_query, text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._acall(self.embeddings.aembed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self._acall(self.embeddings.aembed_query, text)
@@ -0,0 +1,57 @@
+"""
+Pytest configuration for the backend tests
+
+Tests run offline: no API keys, MySQL or LLM calls are needed. The
+database is a throwaway SQLite file, embeddings are the deterministic
+local hashed n-gram backend, and caches go to a temporary directory.
+"""
+
+import os
+import tempfile
+
+import pytest
+
+# Scripts that drive the live agent (LLM and database), run by hand
+collect_ignore = ["test_knowledge_agent.py", "knowledge_base_example.py"]
+
+# Set before any backend module is imported: configuration is read at import
+_TMP_DIR = tempfile.mkdtemp(prefix="kb-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP_DIR}/test.db"
+os.environ["KB_CACHE_DIR"] = os.path.join(_TMP_DIR, "cache")
+os.environ["KB_EMBEDDING_BACKEND"] = "local"
+os.environ["KB_SIDECAR_SOCKET"] = ""
+os.environ["KB_SYNC_INTERVAL"] = "0"
+os.environ["CHAT_SESSION_PERSIST"] = "false"
+os.environ.pop("OPENAI_API_KEY", None)
+
+import database  # noqa: E402
+
+# create_all rather than init_db: the SQL scripts are MySQL-only
+database.Base.metadata.create_all(database.engine)
+
+
+@pytest.fixture
+def db():
+    """A database session; posts, the version epoch and stored chat sessions are cleared after the test"""
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.query(database.Post).delete()
+        session.query(database.SystemConfig).delete()
+        session.query(database.ChatSession).delete()
+        session.commit()
+        session.close()
+
+
+@pytest.fixture
+def kb(tmp_path, monkeypatch):
+    """An empty JSON-backed knowledge base with local embeddings, in a temporary directory"""
+    from embedders import HashedNgramEmbeddings
+    from knowledge_base_agent import KnowledgeBase
+
+    monkeypatch.chdir(tmp_path)
+    # Its own embedding cache and saved index
+    monkeypatch.setenv("KB_CACHE_DIR", str(tmp_path / "cache"))
+    return KnowledgeBase(use_mysql=False, embeddings=HashedNgramEmbeddings())
@@ -3,6 +3,7 @@ Database configuration and models
 """
 
 from sqlalchemy import create_engine, Column, String, Text, DateTime, Integer, Boolean, ForeignKey
+from sqlalchemy.dialects.mysql import MEDIUMTEXT
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -84,6 +85,17 @@ class SystemConfig(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class ChatSession(Base):
+    """Chat session evicted from memory, kept so the conversation can be restored"""
+    __tablename__ = "chat_sessions"
+
+    app_name = Column(String(100), primary_key=True)
+    user_id = Column(String(128), primary_key=True)
+    session_id = Column(String(128), primary_key=True)
+    data = Column(Text().with_variant(MEDIUMTEXT(), "mysql"), nullable=False)  # Session JSON
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+
 # ==================== Database Utilities ====================
 
 def get_db():
@@ -256,6 +268,56 @@ def set_current_model(model_id: str):
         db.close()
 
 
+KB_VERSION_KEY = "kb_version"
+
+
+def get_kb_version() -> Optional[int]:
+    """Get the knowledge base version epoch from system_config (None if the database is unavailable)."""
+    try:
+        db = SessionLocal()
+        try:
+            config = db.query(SystemConfig).filter(
+                SystemConfig.config_key == KB_VERSION_KEY
+            ).first()
+            if config and config.config_value:
+                return int(config.config_value)
+            return 0
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"Warning: Could not load knowledge base version from database: {e}")
+    return None
+
+
+def bump_kb_version() -> int:
+    """Increment the knowledge base version epoch after posts change.
+
+    Every API worker polls this value and applies the changed posts to its
+    own index when it moves.
+    """
+    db = SessionLocal()
+    try:
+        config = db.query(SystemConfig).filter(
+            SystemConfig.config_key == KB_VERSION_KEY
+        ).with_for_update().first()
+        if config:
+            version = int(config.config_value or 0) + 1
+            config.config_value = str(version)
+            config.updated_at = datetime.utcnow()
+        else:
+            version = 1
+            config = SystemConfig(
+                config_key=KB_VERSION_KEY,
+                config_value=str(version),
+                description="Knowledge base version epoch, bumped on every post change",
+            )
+            db.add(config)
+        db.commit()
+        return version
+    finally:
+        db.close()
+
+
 def sync_api_keys_to_env():
     """Load active API keys from database and set as environment variables.
 
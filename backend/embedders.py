@@ -0,0 +1,120 @@
+"""
+Embedding backends for the knowledge base
+
+KB_EMBEDDING_BACKEND selects the embedder:
+- openai (default): OpenAI embeddings through LangChain; needs a key and network
+- local: deterministic hashed n-gram features in NumPy; no key, no network,
+  so CI, tests and load tests can run the full index pipeline offline
+
+Any LangChain Embeddings object can also be passed to KnowledgeBase directly.
+Local vectors only capture word and character overlap, so semantic search
+quality is far below a trained model; use it for pipelines, not production.
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import math
+import os
+
+import numpy as np
+
+from lexical_index import tokenize
+
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:
+    try:
+        from langchain.embeddings.base import Embeddings
+    except ImportError:
+        Embeddings = object
+
+EMBEDDING_BACKEND = os.getenv("KB_EMBEDDING_BACKEND", "openai").lower()
+LOCAL_EMBEDDING_DIM = int(os.getenv("KB_LOCAL_EMBEDDING_DIM", "512"))
+
+EMBEDDING_BACKENDS = ("openai", "local")
+
+
+@lru_cache(maxsize=65536)
+def _slot(feature: str, dim: int) -> Tuple[int, float]:
+    """Stable (index, sign) of a feature; signed hashing keeps collisions unbiased"""
+    h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+    return h % dim, (1.0 if h >> 63 else -1.0)
+
+
+def _features(text: str) -> Dict[str, float]:
+    """Weighted n-gram features: tokens, adjacent token pairs and word character trigrams"""
+    tokens = tokenize(text)
+    features: Dict[str, float] = {}
+
+    def add(feature: str, weight: float):
+        features[feature] = features.get(feature, 0.0) + weight
+
+    for token in tokens:
+        add("t:" + token, 1.0)
+        if token.isascii() and len(token) > 3:
+            # Subword trigrams tolerate inflections and typos
+            padded = f"<{token}>"
+            for i in range(len(padded) - 2):
+                add("c:" + padded[i:i + 3], 0.25)
+    for first, second in zip(tokens, tokens[1:]):
+        add(f"p:{first} {second}", 0.5)
+    if not features:
+        add("empty", 1.0)
+    return features
+
+
+class HashedNgramEmbeddings(Embeddings):
+    """Deterministic local embeddings: hashed n-gram features, L2-normalized"""
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim or LOCAL_EMBEDDING_DIM
+        # Identifies the vectors in the embedding cache and the saved index
+        self.model = f"hashed-ngram-{self.dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in _features(text).items():
+            index, sign = _slot(feature, self.dim)
+            # Sublinear term frequency, as in tf-idf
+            vector[index] += sign * (1.0 + math.log(weight)) if weight >= 1.0 else sign * weight
+        norm = float(np.linalg.norm(vector))
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def create_embeddings(openai_api_key: Optional[str] = None, backend: Optional[str] = None):
+    """
+    Build the configured embedder
+
+    Raises:
+        ValueError: If the backend is unknown, or OpenAI is selected without a key
+        ImportError: If langchain-openai is not installed for the OpenAI backend
+    """
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    if backend == "local":
+        return HashedNgramEmbeddings()
+    if backend != "openai":
+        raise ValueError(f"Unknown KB_EMBEDDING_BACKEND {backend!r}; expected one of {', '.join(EMBEDDING_BACKENDS)}")
+    if not openai_api_key:
+        raise ValueError(
+            "OPENAI_API_KEY not found. Please set it in the admin panel or environment variable."
+        )
+    try:
+        from langchain_openai import OpenAIEmbeddings
+    except ImportError:
+        from langchain.embeddings import OpenAIEmbeddings
+    return OpenAIEmbeddings(openai_api_key=openai_api_key)
@@ -0,0 +1,95 @@
+"""
+Micro-batching of concurrent query embeddings
+
+Queries that arrive within a short window (KB_QUERY_BATCH_WINDOW_MS, or
+until KB_QUERY_BATCH_SIZE are queued) are sent to the provider as one
+batched embeddings request, and the vectors are fanned back out to the
+waiting searches. This cuts provider round trips and rate-limit pressure
+at peak load.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import os
+import threading
+
+
+class QueryEmbeddingBatcher:
+    """
+    Collects concurrent async query embeddings into batched requests
+
+    The wrapped embeddings must return the same vector from
+    aembed_documents([text]) as from aembed_query(text), which holds for
+    OpenAI embedding models.
+    """
+
+    def __init__(self, embeddings, window_ms: Optional[float] = None, max_batch: Optional[int] = None):
+        self.embeddings = embeddings
+        self.window = (
+            float(os.getenv("KB_QUERY_BATCH_WINDOW_MS", "5")) if window_ms is None else window_ms
+        ) / 1000.0
+        self.max_batch = int(os.getenv("KB_QUERY_BATCH_SIZE", "32")) if max_batch is None else max_batch
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 and self.max_batch > 1
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed one query, possibly together with other concurrent queries"""
+        if not self.enabled:
+            return await self.embeddings.aembed_query(text)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            self._pending.append((text, future))
+            if len(self._pending) >= self.max_batch:
+                self._flush_locked(loop)
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush, loop)
+        return await future
+
+    def _flush(self, loop: asyncio.AbstractEventLoop):
+        with self._lock:
+            self._flush_locked(loop)
+
+    def _flush_locked(self, loop: asyncio.AbstractEventLoop):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            loop.create_task(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        # Identical queries in the same window share one input
+        unique: Dict[str, int] = {}
+        for text, _ in batch:
+            unique.setdefault(text, len(unique))
+        self.batches += 1
+        self.queries += len(batch)
+        try:
+            vectors = await self.embeddings.aembed_documents(list(unique))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[unique[text]])
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "window_ms": self.window * 1000.0,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0,
+        }
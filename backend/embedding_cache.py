@@ -0,0 +1,224 @@
+"""
+Embedding caches
+
+- EmbeddingCache / CachedEmbeddings: document embeddings stored on disk,
+  keyed by (embedding model, content hash), so unchanged posts are never
+  sent to the embedding provider again across restarts and admin edits.
+- QueryEmbeddingCache: in-process LRU of normalized query text -> vector
+  with a TTL, so popular searches skip the embedding call entirely.
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:
+    try:
+        from langchain.embeddings.base import Embeddings
+    except ImportError:
+        Embeddings = object
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".kb_cache")
+
+
+def get_cache_dir() -> str:
+    """Directory for on-disk knowledge base artifacts (KB_CACHE_DIR, default: backend/.kb_cache)"""
+    return os.getenv("KB_CACHE_DIR", DEFAULT_CACHE_DIR)
+
+
+def text_hash(text: str) -> str:
+    """Stable content hash used as the cache key"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed store of embedding vectors
+
+    SQLite (WAL mode) is used so several uvicorn workers can share one cache
+    file safely. Vectors are stored as raw float32 bytes.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            path = os.path.join(get_cache_dir(), "embeddings.sqlite3")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """Return cached vectors for the given hashes (missing hashes are omitted)"""
+        found: Dict[str, List[float]] = {}
+        # Stay well below SQLite's bound-parameter limit
+        batch_size = 500
+        with self._lock:
+            for i in range(0, len(hashes), batch_size):
+                batch = hashes[i:i + batch_size]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        """Store vectors keyed by content hash"""
+        rows = []
+        for h, vector in items.items():
+            arr = np.asarray(vector, dtype=np.float32)
+            rows.append((model, h, int(arr.shape[0]), arr.tobytes()))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves document vectors from an EmbeddingCache
+
+    Only texts whose (model, hash) pair is not cached are forwarded to the
+    underlying embeddings in a single call. Queries are not persisted.
+    """
+
+    def __init__(self, embeddings, cache: EmbeddingCache, model_name: Optional[str] = None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(t) for t in texts]
+        try:
+            cached = self.cache.get_many(self.model_name, list(set(hashes)))
+        except Exception as e:
+            print(f"Warning: Embedding cache read failed: {e}")
+            cached = {}
+
+        # Embed each missing text once, even if it appears several times
+        missing: Dict[str, str] = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = t
+
+        self.hits += len(texts) - sum(1 for h in hashes if h in missing)
+        self.misses += len(missing)
+
+        if missing:
+            new_vectors = self.embeddings.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), new_vectors))
+            try:
+                self.cache.put_many(self.model_name, fresh)
+            except Exception as e:
+                print(f"Warning: Embedding cache write failed: {e}")
+            cached.update(fresh)
+
+        return [list(cached[h]) for h in hashes]
+
+    def cached_vectors(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Cached vectors for texts, without calling the provider (None where missing)"""
+        hashes = [text_hash(t) for t in texts]
+        try:
+            cached = self.cache.get_many(self.model_name, list(set(hashes)))
+        except Exception as e:
+            print(f"Warning: Embedding cache read failed: {e}")
+            cached = {}
+        return [cached.get(h) for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.embeddings.aembed_query(text)
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Normalize query text so trivially different queries share a cache entry"""
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+class QueryEmbeddingCache:
+    """
+    Thread-safe in-process LRU cache of query vectors with a TTL
+
+    Size and TTL default to KB_QUERY_CACHE_SIZE (1024 entries) and
+    KB_QUERY_CACHE_TTL (3600 seconds). A size of 0 disables the cache.
+    """
+
+    def __init__(self, max_size: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_size = int(os.getenv("KB_QUERY_CACHE_SIZE", "1024")) if max_size is None else max_size
+        self.ttl = float(os.getenv("KB_QUERY_CACHE_TTL", "3600")) if ttl is None else ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, vector: List[float]):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (vector, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,134 @@
+"""
+Bulk embedding pipeline for index builds
+
+Texts are embedded in batches of KB_EMBED_BATCH_SIZE, with at most
+KB_EMBED_CONCURRENCY batches in flight. A failed batch is retried with
+exponential backoff and jitter (up to KB_EMBED_MAX_RETRIES times) instead
+of aborting the whole build. Every completed batch is written to the
+embedding cache as it finishes, which is the checkpoint: an interrupted or
+failed build resumes from the cache and only embeds the remaining texts.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+import os
+import random
+import threading
+import time
+
+from embedding_cache import CachedEmbeddings
+
+BATCH_SIZE = int(os.getenv("KB_EMBED_BATCH_SIZE", "256"))
+CONCURRENCY = int(os.getenv("KB_EMBED_CONCURRENCY", "4"))
+MAX_RETRIES = int(os.getenv("KB_EMBED_MAX_RETRIES", "5"))
+# First retry delay in seconds; doubles per attempt up to BACKOFF_MAX
+BACKOFF_BASE = float(os.getenv("KB_EMBED_BACKOFF", "1"))
+BACKOFF_MAX = float(os.getenv("KB_EMBED_BACKOFF_MAX", "60"))
+
+# progress(done, total), in unique texts
+ProgressCallback = Callable[[int, int], None]
+
+
+class EmbeddingPipeline:
+    """Batched, concurrent, retrying embedding of many texts"""
+
+    def __init__(self, embeddings, batch_size: Optional[int] = None, concurrency: Optional[int] = None,
+                 max_retries: Optional[int] = None, backoff: Optional[float] = None):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size or BATCH_SIZE)
+        self.concurrency = max(1, concurrency or CONCURRENCY)
+        self.max_retries = MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = BACKOFF_BASE if backoff is None else backoff
+        self.total = 0
+        self.done = 0
+        self.resumed = 0  # texts already in the cache when the run started
+        self.batches = 0
+        self.retries = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def embed(self, texts: List[str], progress: Optional[ProgressCallback] = None) -> List[List[float]]:
+        """
+        Embed texts, returning vectors in input order
+
+        Raises:
+            Exception: The last error of a batch that failed all its retries;
+                batches completed before it stay in the cache
+        """
+        self.started_at = time.time()
+        unique = list(dict.fromkeys(texts))
+        vectors: Dict[str, List[float]] = {}
+        if isinstance(self.embeddings, CachedEmbeddings):
+            for text, vector in zip(unique, self.embeddings.cached_vectors(unique)):
+                if vector is not None:
+                    vectors[text] = vector
+        self.total = len(unique)
+        self.done = self.resumed = len(vectors)
+        if self.resumed:
+            print(f"Embedding pipeline: {self.resumed}/{self.total} texts already embedded, resuming")
+        self._report(progress)
+
+        pending = [text for text in unique if text not in vectors]
+        batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+        if batches:
+            with ThreadPoolExecutor(
+                max_workers=min(self.concurrency, len(batches)), thread_name_prefix="kb-embed"
+            ) as pool:
+                futures = {pool.submit(self._embed_batch, batch): batch for batch in batches}
+                try:
+                    for future in as_completed(futures):
+                        batch = futures[future]
+                        vectors.update(zip(batch, future.result()))
+                        with self._lock:
+                            self.done += len(batch)
+                            self.batches += 1
+                        self._report(progress)
+                except Exception as e:
+                    for other in futures:
+                        other.cancel()
+                    self.error = str(e)
+                    self.finished_at = time.time()
+                    raise
+
+        self.finished_at = time.time()
+        return [vectors[text] for text in texts]
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                return self.embeddings.embed_documents(batch)
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                # Jitter keeps concurrent batches from retrying in lockstep
+                delay = min(BACKOFF_MAX, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                print(
+                    f"Warning: Embedding batch of {len(batch)} failed ({e}); "
+                    f"retry {attempt}/{self.max_retries} in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+    def _report(self, progress: Optional[ProgressCallback]):
+        if progress is not None:
+            progress(self.done, self.total)
+
+    def stats(self) -> Dict:
+        end = self.finished_at or time.time()
+        return {
+            "total": self.total,
+            "done": self.done,
+            "resumed": self.resumed,
+            "batches": self.batches,
+            "retries": self.retries,
+            "batch_size": self.batch_size,
+            "concurrency": self.concurrency,
+            "running": self.started_at is not None and self.finished_at is None,
+            "seconds": round(end - self.started_at, 2) if self.started_at else 0.0,
+            "error": self.error,
+        }
@@ -0,0 +1,182 @@
+"""
+On-disk persistence for the knowledge base vector index
+
+Saves the per-language FAISS indexes, their docstores and a manifest
+(embedding model, dimension, index version, per-post content hashes) so
+that a starting worker can memory-map the previous index and only reconcile
+posts that changed, instead of rebuilding everything from scratch.
+"""
+
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+
+from embedding_cache import get_cache_dir
+
+# Bump when the on-disk layout, document format or metric changes; older saves are ignored
+INDEX_VERSION = 4
+
+DOCSTORE_FILE = "docstore.json"
+MANIFEST_FILE = "manifest.json"
+
+
+def get_index_dir() -> str:
+    """Directory holding the saved index (KB_CACHE_DIR/index)"""
+    return os.path.join(get_cache_dir(), "index")
+
+
+@contextmanager
+def _dir_lock(directory: str):
+    """Serialize save/load across uvicorn workers sharing the same directory"""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _atomic_write(path: str, data: bytes):
+    """Write a file via rename so concurrent readers never see a partial file"""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _serialize_docstore(vector_store) -> Dict:
+    """JSON-serializable docstore of a LangChain FAISS vector store (tombstones saved as null)"""
+    docs = {}
+    for doc_id in vector_store.index_to_docstore_id.values():
+        doc = vector_store.docstore.search(doc_id)
+        docs[doc_id] = {"page_content": doc.page_content, "metadata": doc.metadata}
+    return {
+        "index_to_docstore_id": [
+            vector_store.index_to_docstore_id.get(i) for i in range(vector_store.index.ntotal)
+        ],
+        "docs": docs,
+    }
+
+
+def save_index(vector_stores: Dict[str, object], manifest: Dict, directory: Optional[str] = None):
+    """
+    Save per-language LangChain FAISS vector stores and their manifest
+
+    Each partition gets its own index file (index-<n>.faiss); the manifest
+    maps language -> file and is written last, so a crash mid-save leaves a
+    manifest that no longer matches and the next load falls back to a rebuild.
+    """
+    import faiss
+
+    directory = directory or get_index_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    partitions = {}
+    docstores = {}
+    index_files = {}
+    for n, (language, vector_store) in enumerate(sorted(vector_stores.items())):
+        file_name = f"index-{n}.faiss"
+        index_files[file_name] = faiss.serialize_index(vector_store.index).tobytes()
+        docstores[language] = _serialize_docstore(vector_store)
+        partitions[language] = {"file": file_name, "ntotal": int(vector_store.index.ntotal)}
+
+    manifest = dict(manifest, version=INDEX_VERSION, partitions=partitions)
+    with _dir_lock(directory):
+        for file_name, data in index_files.items():
+            _atomic_write(os.path.join(directory, file_name), data)
+        _atomic_write(
+            os.path.join(directory, DOCSTORE_FILE),
+            json.dumps(docstores, ensure_ascii=False).encode("utf-8"),
+        )
+        _atomic_write(
+            os.path.join(directory, MANIFEST_FILE),
+            json.dumps(manifest, ensure_ascii=False).encode("utf-8"),
+        )
+        # Remove index files of partitions that no longer exist
+        for name in os.listdir(directory):
+            if name.startswith("index-") and name.endswith(".faiss") and name not in index_files:
+                os.remove(os.path.join(directory, name))
+
+
+def load_manifest(directory: Optional[str] = None) -> Optional[Dict]:
+    """Read the saved manifest, or None if there is no usable save"""
+    directory = directory or get_index_dir()
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != INDEX_VERSION:
+        return None
+    return manifest
+
+
+def load_index(embeddings, directory: Optional[str] = None) -> Optional[Tuple[Dict[str, object], Dict]]:
+    """
+    Load saved per-language vector stores, memory-mapping the FAISS indexes
+
+    Returns:
+        ({language: FAISS vector store}, manifest), or None if nothing usable is saved
+    """
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_core.documents import Document
+    from vector_index import wrap_index
+
+    directory = directory or get_index_dir()
+    if not os.path.isdir(directory):
+        return None
+
+    with _dir_lock(directory):
+        manifest = load_manifest(directory)
+        if manifest is None:
+            return None
+
+        indexes = {}
+        for language, partition in manifest.get("partitions", {}).items():
+            index_path = os.path.join(directory, partition["file"])
+            try:
+                index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+            except RuntimeError:
+                index = None
+            if index is None or not isinstance(faiss.downcast_index(index), faiss.IndexFlat):
+                # Only flat indexes are mapped; approximate ones must support
+                # cloning and rebuilding, which mapped inverted lists do not
+                index = faiss.read_index(index_path)
+            indexes[language] = index
+
+        with open(os.path.join(directory, DOCSTORE_FILE), "r", encoding="utf-8") as f:
+            docstores = json.load(f)
+
+    vector_stores = {}
+    for language, index in indexes.items():
+        docstore = docstores.get(language, {})
+        ids: List[Optional[str]] = docstore.get("index_to_docstore_id", [])
+        if index.ntotal != len(ids) or manifest["partitions"][language]["ntotal"] != len(ids):
+            print("Warning: Saved index does not match its docstore, ignoring it")
+            return None
+
+        store = InMemoryDocstore({
+            doc_id: Document(page_content=d["page_content"], metadata=d["metadata"])
+            for doc_id, d in docstore["docs"].items()
+        })
+        vector_stores[language] = wrap_index(
+            embeddings, index, store, {n: doc_id for n, doc_id in enumerate(ids) if doc_id is not None}
+        )
+    return vector_stores, manifest
@@ -0,0 +1,148 @@
+"""
+Background reindex worker
+
+Admin edits enqueue index jobs instead of embedding inside the request. A
+single worker thread applies them in order; the knowledge base builds each
+change on copies of the affected partitions and swaps them in atomically,
+so searches keep serving the previous index until the new one is ready.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+import queue
+import threading
+import uuid
+
+from pydantic import BaseModel
+
+
+# Finished jobs kept for the progress endpoint
+JOB_HISTORY = 200
+
+
+class IndexJob(BaseModel):
+    """A queued or finished reindex job"""
+    id: str
+    kind: str  # "upsert", "delete", "sync", "rebuild" or "reload"
+    post_id: Optional[str] = None
+    status: str = "queued"  # "queued", "running", "done" or "failed"
+    total: int = 0  # posts; chunk texts while a rebuild is embedding
+    done: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class IndexWorker:
+    """Applies index jobs to a KnowledgeBase on a single daemon thread"""
+
+    def __init__(self, knowledge_base):
+        self.knowledge_base = knowledge_base
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._jobs: "OrderedDict[str, IndexJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit_upsert(self, post) -> IndexJob:
+        """Queue re-embedding of one post"""
+        return self._submit("upsert", post.id, post)
+
+    def submit_delete(self, post_id: str) -> IndexJob:
+        """Queue removal of one post's vectors"""
+        return self._submit("delete", post_id, None)
+
+    def submit_sync(self, upserts: List, deletes: List[str]) -> IndexJob:
+        """Queue a batch of changes picked up from the database by another worker's edit"""
+        return self._submit("sync", None, (upserts, deletes), total=len(upserts) + len(deletes))
+
+    def submit_rebuild(self) -> IndexJob:
+        """Queue a full reload of posts and rebuild of the index"""
+        return self._submit("rebuild", None, None)
+
+    def submit_reload(self) -> IndexJob:
+        """Queue re-creation of the embeddings after an API key change (builds a missing index)"""
+        return self._submit("reload", None, None)
+
+    def get_job(self, job_id: str) -> Optional[IndexJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, limit: int = 50) -> List[IndexJob]:
+        """Most recent jobs first"""
+        with self._lock:
+            return list(reversed(self._jobs.values()))[:limit]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"pending": self._queue.qsize(), "jobs": counts}
+
+    def _submit(self, kind: str, post_id: Optional[str], payload, total: int = 1) -> IndexJob:
+        job = IndexJob(
+            id=str(uuid.uuid4()),
+            kind=kind,
+            post_id=post_id,
+            total=total,
+            created_at=datetime.utcnow(),
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > JOB_HISTORY:
+                self._jobs.popitem(last=False)
+            self._ensure_thread()
+        self._queue.put((job, payload))
+        return job
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="kb-index-worker", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            job, payload = self._queue.get()
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            try:
+                self._execute(job, payload)
+                job.status = "done"
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                print(f"Warning: Index job {job.id} ({job.kind}) failed: {e}")
+            finally:
+                job.finished_at = datetime.utcnow()
+                self._queue.task_done()
+
+            # Persist once the queue drains rather than after every edit
+            if self._queue.empty() and job.status == "done":
+                self.knowledge_base.save_index()
+
+    def _execute(self, job: IndexJob, payload):
+        kb = self.knowledge_base
+        if job.kind == "upsert":
+            kb.apply_changes([payload], [])
+        elif job.kind == "delete":
+            kb.apply_changes([], [job.post_id])
+        elif job.kind == "sync":
+            upserts, deletes = payload
+            kb.apply_changes(upserts, deletes)
+        elif job.kind == "rebuild":
+            kb.load_posts()
+            job.total = len(kb.posts)
+
+            def progress(done: int, total: int):
+                # Counted in chunk texts once embedding starts
+                job.total, job.done = total, done
+
+            kb._generate_all_embeddings(progress=progress)
+        elif job.kind == "reload":
+            def progress(done: int, total: int):
+                job.total, job.done = total, done
+
+            kb.reload_embeddings(progress=progress)
+        job.done = job.total
@@ -0,0 +1,406 @@
+"""
+Shared retrieval sidecar
+
+One sidecar process owns the KnowledgeBase (posts, FAISS partitions,
+docstore, embedding clients) and serves search and index updates to every
+API worker over a local Unix socket. With KB_SIDECAR_SOCKET set, the API
+workers build no index of their own and knowledge_base_agent talks to the
+sidecar through the thin clients below, so index memory and embedding work
+no longer grow with the worker count.
+
+Run the sidecar with:
+
+    KB_SIDECAR_SOCKET=/run/pool_ai_knowledge/kb.sock python kb_sidecar.py
+
+Wire protocol: every message is a frame of a 1-byte opcode (requests) or
+status (responses), a 4-byte big-endian payload length and the payload.
+Strings are a 4-byte length followed by UTF-8 bytes. Search requests and
+results use a fixed binary layout; admin-only calls (jobs, stats) carry
+JSON in the payload.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import json
+import math
+import os
+import socket
+import struct
+import threading
+
+from index_worker import IndexJob
+
+
+DEFAULT_SOCKET = "/tmp/pool_ai_knowledge_kb.sock"
+
+# Opcodes
+OP_SEARCH = 1
+OP_UPSERT = 2
+OP_DELETE = 3
+OP_REBUILD = 4
+OP_JOB = 5
+OP_JOBS = 6
+OP_STATS = 7
+OP_RECALL = 8
+OP_RELOAD = 9
+
+# Response status
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+_HEADER = struct.Struct("!BI")
+_U8 = struct.Struct("!B")
+_U16 = struct.Struct("!H")
+_U32 = struct.Struct("!I")
+_F64 = struct.Struct("!d")
+
+
+# ==================== Encoding ====================
+
+def _pack_str(value: Optional[str]) -> bytes:
+    data = (value or "").encode("utf-8")
+    return _U32.pack(len(data)) + data
+
+
+def _unpack_str(buf: bytes, offset: int) -> Tuple[str, int]:
+    (length,) = _U32.unpack_from(buf, offset)
+    offset += _U32.size
+    return buf[offset:offset + length].decode("utf-8"), offset + length
+
+
+def _frame(code: int, payload: bytes = b"") -> bytes:
+    return _HEADER.pack(code, len(payload)) + payload
+
+
+def encode_search(query: str, top_k: int, language: Optional[str], min_score: Optional[float] = None) -> bytes:
+    # NaN stands for "no min_score" (use the sidecar's KB_MIN_SCORE)
+    score = math.nan if min_score is None else min_score
+    return _U16.pack(top_k) + _F64.pack(score) + _pack_str(query) + _pack_str(language)
+
+
+def decode_search(buf: bytes) -> Tuple[str, int, Optional[str], Optional[float]]:
+    (top_k,) = _U16.unpack_from(buf, 0)
+    (score,) = _F64.unpack_from(buf, _U16.size)
+    query, offset = _unpack_str(buf, _U16.size + _F64.size)
+    language, _ = _unpack_str(buf, offset)
+    return query, top_k, language or None, None if math.isnan(score) else score
+
+
+def encode_results(results: List) -> bytes:
+    parts = [_U16.pack(len(results))]
+    for r in results:
+        parts.append(_F64.pack(r.relevance_score))
+        parts.append(_U8.pack(1 if r.degraded else 0))
+        for value in (r.post_id, r.title, r.matched_content, r.reason):
+            parts.append(_pack_str(value))
+    return b"".join(parts)
+
+
+def decode_results(buf: bytes) -> List:
+    from knowledge_base_agent import SearchResult
+
+    (count,) = _U16.unpack_from(buf, 0)
+    offset = _U16.size
+    results = []
+    for _ in range(count):
+        (score,) = _F64.unpack_from(buf, offset)
+        offset += _F64.size
+        (degraded,) = _U8.unpack_from(buf, offset)
+        offset += _U8.size
+        fields = []
+        for _ in range(4):
+            value, offset = _unpack_str(buf, offset)
+            fields.append(value)
+        post_id, title, matched_content, reason = fields
+        results.append(SearchResult(
+            post_id=post_id,
+            title=title,
+            relevance_score=score,
+            matched_content=matched_content,
+            reason=reason,
+            degraded=bool(degraded),
+        ))
+    return results
+
+
+def encode_post(post) -> bytes:
+    parts = [_pack_str(value) for value in (post.id, post.title, post.content, post.language, post.created_at)]
+    parts.append(_U16.pack(len(post.tags)))
+    parts.extend(_pack_str(tag) for tag in post.tags)
+    return b"".join(parts)
+
+
+def decode_post(buf: bytes):
+    from knowledge_base_agent import Post
+
+    offset = 0
+    fields = []
+    for _ in range(5):
+        value, offset = _unpack_str(buf, offset)
+        fields.append(value)
+    post_id, title, content, language, created_at = fields
+    (tag_count,) = _U16.unpack_from(buf, offset)
+    offset += _U16.size
+    tags = []
+    for _ in range(tag_count):
+        tag, offset = _unpack_str(buf, offset)
+        tags.append(tag)
+    return Post(
+        id=post_id,
+        title=title,
+        content=content,
+        tags=tags,
+        language=language or "zh-CN",
+        created_at=created_at or None,
+    )
+
+
+def _encode_json(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+
+
+# ==================== Client ====================
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Knowledge base sidecar closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class SidecarClient:
+    """
+    Connection to the retrieval sidecar
+
+    Sync calls keep one socket per thread; async calls reuse idle stream
+    connections. A call on a reused connection that turns out to be broken
+    (e.g. after a sidecar restart) is retried once on a fresh one.
+    """
+
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        self.path = path
+        self.timeout = float(os.getenv("KB_SIDECAR_TIMEOUT", "30")) if timeout is None else timeout
+        self._local = threading.local()
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+
+    def call(self, op: int, payload: bytes = b"") -> bytes:
+        sock = getattr(self._local, "sock", None)
+        for attempt in range(2):
+            reused = sock is not None
+            if sock is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                sock.connect(self.path)
+                self._local.sock = sock
+            try:
+                sock.sendall(_frame(op, payload))
+                status, length = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+                body = _recv_exactly(sock, length)
+                break
+            except OSError as e:
+                sock.close()
+                sock = self._local.sock = None
+                if not reused or attempt or isinstance(e, socket.timeout):
+                    raise
+        return self._result(status, body)
+
+    async def acall(self, op: int, payload: bytes = b"") -> bytes:
+        for attempt in range(2):
+            reused = bool(self._idle)
+            if reused:
+                reader, writer = self._idle.pop()
+            else:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            try:
+                writer.write(_frame(op, payload))
+                await writer.drain()
+                header = await asyncio.wait_for(reader.readexactly(_HEADER.size), self.timeout)
+                status, length = _HEADER.unpack(header)
+                body = await asyncio.wait_for(reader.readexactly(length), self.timeout)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                writer.close()
+                if not reused or attempt or isinstance(e, asyncio.TimeoutError):
+                    raise
+                continue
+            except asyncio.CancelledError:
+                # The response may still arrive, so this connection cannot be reused
+                writer.close()
+                raise
+            self._idle.append((reader, writer))
+            return self._result(status, body)
+
+    @staticmethod
+    def _result(status: int, body: bytes) -> bytes:
+        if status != STATUS_OK:
+            message, _ = _unpack_str(body, 0)
+            raise RuntimeError(f"Knowledge base sidecar error: {message}")
+        return body
+
+
+class SidecarKnowledgeBase:
+    """Stand-in for KnowledgeBase in API workers when the sidecar owns the index"""
+
+    use_mysql = False
+
+    def __init__(self, client: SidecarClient):
+        self.client = client
+
+    def search_posts(self, query: str, top_k: int = 3, language: Optional[str] = None,
+                     min_score: Optional[float] = None) -> List:
+        return decode_results(self.client.call(OP_SEARCH, encode_search(query, top_k, language, min_score)))
+
+    async def asearch_posts(self, query: str, top_k: int = 3, language: Optional[str] = None,
+                            min_score: Optional[float] = None) -> List:
+        payload = encode_search(query, top_k, language, min_score)
+        return decode_results(await self.client.acall(OP_SEARCH, payload))
+
+    def upsert_post(self, post):
+        self.client.call(OP_UPSERT, encode_post(post))
+
+    add_post = upsert_post
+
+    def delete_post(self, post_id: str):
+        self.client.call(OP_DELETE, _pack_str(post_id))
+
+    def stats(self) -> Dict:
+        return json.loads(self.client.call(OP_STATS))["knowledge_base"]
+
+    def recall_at_k(self, sample: int = 50, top_k: int = 10) -> Dict:
+        return json.loads(self.client.call(OP_RECALL, _U16.pack(sample) + _U16.pack(top_k)))
+
+
+class SidecarIndexWorker:
+    """Stand-in for IndexWorker; jobs run and are tracked in the sidecar"""
+
+    def __init__(self, client: SidecarClient):
+        self.client = client
+
+    def submit_upsert(self, post) -> IndexJob:
+        return IndexJob(**json.loads(self.client.call(OP_UPSERT, encode_post(post))))
+
+    def submit_delete(self, post_id: str) -> IndexJob:
+        return IndexJob(**json.loads(self.client.call(OP_DELETE, _pack_str(post_id))))
+
+    def submit_rebuild(self) -> IndexJob:
+        return IndexJob(**json.loads(self.client.call(OP_REBUILD)))
+
+    def submit_reload(self) -> IndexJob:
+        return IndexJob(**json.loads(self.client.call(OP_RELOAD)))
+
+    def get_job(self, job_id: str) -> Optional[IndexJob]:
+        data = json.loads(self.client.call(OP_JOB, _pack_str(job_id)))
+        return IndexJob(**data) if data else None
+
+    def list_jobs(self, limit: int = 50) -> List[IndexJob]:
+        return [IndexJob(**job) for job in json.loads(self.client.call(OP_JOBS, _U16.pack(min(limit, 0xFFFF))))]
+
+    def stats(self) -> Dict:
+        return json.loads(self.client.call(OP_STATS))["index_worker"]
+
+
+class SidecarSync:
+    """Stand-in for KnowledgeBaseSync; the sidecar runs the only poller"""
+
+    def __init__(self, client: SidecarClient):
+        self.client = client
+
+    def start(self):
+        pass
+
+    def stats(self) -> Dict:
+        return json.loads(self.client.call(OP_STATS))["sync"]
+
+
+# ==================== Server ====================
+
+class SidecarServer:
+    """Serves one KnowledgeBase to API workers over a Unix socket"""
+
+    def __init__(self, knowledge_base, index_worker, kb_sync, path: str):
+        self.knowledge_base = knowledge_base
+        self.index_worker = index_worker
+        self.kb_sync = kb_sync
+        self.path = path
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        server = await asyncio.start_unix_server(self._handle, path=self.path)
+        print(f"Knowledge base sidecar listening on {self.path}")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    op, length = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                    payload = await reader.readexactly(length)
+                except asyncio.IncompleteReadError:
+                    return
+                try:
+                    response = _frame(STATUS_OK, await self._dispatch(op, payload))
+                except Exception as e:
+                    response = _frame(STATUS_ERROR, _pack_str(str(e)))
+                writer.write(response)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def _dispatch(self, op: int, payload: bytes) -> bytes:
+        if op == OP_SEARCH:
+            query, top_k, language, min_score = decode_search(payload)
+            results = await self.knowledge_base.asearch_posts(query, top_k, language=language, min_score=min_score)
+            return encode_results(results)
+        if op == OP_UPSERT:
+            return _encode_json(self.index_worker.submit_upsert(decode_post(payload)).model_dump())
+        if op == OP_DELETE:
+            post_id, _ = _unpack_str(payload, 0)
+            return _encode_json(self.index_worker.submit_delete(post_id).model_dump())
+        if op == OP_REBUILD:
+            return _encode_json(self.index_worker.submit_rebuild().model_dump())
+        if op == OP_RELOAD:
+            return _encode_json(self.index_worker.submit_reload().model_dump())
+        if op == OP_JOB:
+            job_id, _ = _unpack_str(payload, 0)
+            job = self.index_worker.get_job(job_id)
+            return _encode_json(job.model_dump() if job else None)
+        if op == OP_JOBS:
+            (limit,) = _U16.unpack_from(payload, 0)
+            return _encode_json([job.model_dump() for job in self.index_worker.list_jobs(limit)])
+        if op == OP_STATS:
+            return _encode_json({
+                "knowledge_base": self.knowledge_base.stats(),
+                "index_worker": self.index_worker.stats(),
+                "sync": self.kb_sync.stats(),
+            })
+        if op == OP_RECALL:
+            (sample,) = _U16.unpack_from(payload, 0)
+            (top_k,) = _U16.unpack_from(payload, _U16.size)
+            result = await asyncio.to_thread(self.knowledge_base.recall_at_k, sample, top_k)
+            return _encode_json(result)
+        raise ValueError(f"Unknown opcode: {op}")
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+    path = os.getenv("KB_SIDECAR_SOCKET") or DEFAULT_SOCKET
+    # This process owns the index, so knowledge_base_agent must build it
+    # locally instead of connecting to itself. Set (not unset) the variable:
+    # load_dotenv never overrides an existing value, but would restore a
+    # removed one from .env
+    os.environ["KB_SIDECAR_SOCKET"] = ""
+    from knowledge_base_agent import _knowledge_base, _index_worker, _kb_sync
+
+    _kb_sync.start()
+    asyncio.run(SidecarServer(_knowledge_base, _index_worker, _kb_sync, path).serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Cross-worker knowledge base synchronization
+
+Each uvicorn worker holds its own index, but an admin edit is handled by
+only one of them. Every post change bumps a version epoch in system_config;
+each worker polls that single row and, when it moves, reads the posts
+updated since its last sync plus the list of active post IDs, and queues
+only the posts that differ from its index on its IndexWorker.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import os
+import threading
+
+# Rows updated this long before the last seen updated_at are re-read, to
+# tolerate clock skew between workers and late commits (unchanged posts
+# are skipped by content hash, so re-reading costs no embeddings)
+SYNC_LOOKBACK = timedelta(seconds=60)
+
+
+class KnowledgeBaseSync:
+    """Polls the knowledge base version epoch and applies changed posts locally"""
+
+    def __init__(self, knowledge_base, index_worker, interval: Optional[float] = None):
+        self.knowledge_base = knowledge_base
+        self.index_worker = index_worker
+        self.interval = float(os.getenv("KB_SYNC_INTERVAL", "5")) if interval is None else interval
+        self.epoch: Optional[int] = None
+        self.watermark: Optional[datetime] = None
+        self.polls = 0
+        self.syncs = 0
+        self.last_error: Optional[str] = None
+        self._pending = None  # (job, epoch, watermark) of the sync job in flight
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.knowledge_base.use_mysql and self.interval > 0
+
+    def start(self):
+        """Start polling in a daemon thread (no-op when disabled or already running)"""
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="kb-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Warning: Knowledge base sync failed: {e}")
+
+    def poll_once(self) -> int:
+        """
+        Check the version epoch once and queue any changes
+
+        Returns:
+            Number of posts queued for upsert or delete
+        """
+        from database import SessionLocal, get_kb_version
+        from database import Post as DBPost
+        from knowledge_base_agent import Post
+
+        self.polls += 1
+        if self._pending is not None:
+            job, epoch, watermark = self._pending
+            if job.status in ("queued", "running"):
+                return 0
+            self._pending = None
+            # The epoch only moves once the change set is applied; after a
+            # failed job the next poll diffs again and requeues what is missing
+            if job.status == "done":
+                self.epoch, self.watermark = epoch, watermark
+
+        epoch = get_kb_version()
+        if epoch is None or epoch == self.epoch:
+            return 0
+
+        kb = self.knowledge_base
+        # An API key change on another worker also bumps the epoch
+        if kb.embedding_key_changed():
+            self.index_worker.submit_reload()
+        db = SessionLocal()
+        try:
+            query = db.query(DBPost).filter(DBPost.is_active == True)
+            if self.watermark is not None:
+                query = query.filter(DBPost.updated_at >= self.watermark - SYNC_LOOKBACK)
+            rows = query.all()
+            active_ids = {row[0] for row in db.query(DBPost.id).filter(DBPost.is_active == True).all()}
+        finally:
+            db.close()
+
+        watermark = max((row.updated_at for row in rows if row.updated_at), default=self.watermark)
+        # Diff against the published posts rather than the vector hashes: in
+        # keyword-only mode no vectors (and so no hashes) exist, but posts do.
+        # Missing vectors are the background catch-up's job, not the sync's.
+        published = kb.posts
+        upserts = []
+        for row in rows:
+            post = Post.from_db(row)
+            current = published.get(post.id)
+            if current is None or kb._post_hash(current) != kb._post_hash(post):
+                upserts.append(post)
+        deletes = [post_id for post_id in published if post_id not in active_ids]
+
+        if not upserts and not deletes:
+            self.epoch, self.watermark = epoch, watermark
+            return 0
+
+        print(f"Knowledge base version {epoch}: syncing {len(upserts)} changed and {len(deletes)} removed posts")
+        job = self.index_worker.submit_sync(upserts, deletes)
+        self._pending = (job, epoch, watermark)
+        self.syncs += 1
+        return len(upserts) + len(deletes)
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "interval_seconds": self.interval,
+            "epoch": self.epoch,
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+            "polls": self.polls,
+            "syncs": self.syncs,
+            "last_error": self.last_error,
+        }
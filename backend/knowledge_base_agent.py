@@ -7,9 +7,16 @@ This module implements a knowledge base agent that can:
 - Show related posts and reasoning
 """
 
-from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial, wraps
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
 import json
 import os
+import threading
+import time
+import weakref
 from pathlib import Path
 from dotenv import load_dotenv
 import numpy as np
@@ -38,6 +45,39 @@ from google.adk.agents import Agent
 from google.adk.tools import BaseTool
 from pydantic import BaseModel, Field
 from database import get_current_model
+from embedding_cache import CachedEmbeddings, EmbeddingCache, QueryEmbeddingCache, normalize_query, text_hash
+from index_store import load_index, save_index
+from chunking import Chunk, chunk_config, merge_scores, split_text
+from snippets import extract_snippet
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from chat_history import trim_history
+from circuit_breaker import CircuitBreaker, CircuitOpenError, GuardedEmbeddings
+from embedders import EMBEDDING_BACKEND, create_embeddings
+from embedding_pipeline import BATCH_SIZE as EMBED_BATCH_SIZE, EmbeddingPipeline, ProgressCallback
+from embedding_batcher import QueryEmbeddingBatcher
+from single_flight import SingleFlight
+from vector_index import (
+    RERANK_FACTOR, add_documents, cosine_scores, index_config, index_quantization, index_type, is_quantized,
+    live_count, needs_compaction, new_vector_store, rebuild_vector_store, remove_documents, search_store,
+    target_index_spec, tombstone_count, tune_index, wrap_index,
+)
+from index_worker import IndexWorker
+from kb_sync import KnowledgeBaseSync
+
+
+# Candidate chunks fetched per requested post (several chunks may share a post)
+CHUNK_FETCH_FACTOR = 4
+# Largest partition recall_at_k loads as float32 for its exact baseline
+RECALL_MAX_VECTORS = 200000
+# How long a writer waits for searches to release a retired partition copy
+# before cloning the partition instead
+SPARE_WAIT_SECONDS = 2.0
+# Threads available to async searches for FAISS queries (KB_SEARCH_THREADS)
+SEARCH_THREADS = int(os.getenv("KB_SEARCH_THREADS", "4"))
+# Default cosine similarity cutoff for search results (KB_MIN_SCORE, empty = no cutoff)
+MIN_SCORE = float(os.getenv("KB_MIN_SCORE")) if os.getenv("KB_MIN_SCORE") else None
+# Retrieval: hybrid (vector + BM25 keyword, fused by rank), vector or lexical
+SEARCH_MODE = os.getenv("KB_SEARCH_MODE", "hybrid").lower()
 
 
 # ==================== Data Models ====================
@@ -51,6 +91,18 @@ class Post(BaseModel):
     language: str = "zh-CN"
     created_at: Optional[str] = None
 
+    @classmethod
+    def from_db(cls, db_post) -> "Post":
+        """Build a knowledge base post from a database Post row"""
+        return cls(
+            id=db_post.id,
+            title=db_post.title,
+            content=db_post.content,
+            tags=db_post.tags.split(",") if db_post.tags else [],
+            language=db_post.language or "zh-CN",
+            created_at=db_post.created_at.isoformat() if db_post.created_at else None
+        )
+
 
 class SearchResult(BaseModel):
     """Search result model"""
@@ -59,6 +111,7 @@ class SearchResult(BaseModel):
     relevance_score: float
     matched_content: str
     reason: str  # Why this post is relevant
+    degraded: bool = False  # Keyword-only result while embeddings were unavailable
 
 
 # ==================== Knowledge Base Storage ====================
@@ -68,23 +121,35 @@ class KnowledgeBase:
     RAG-based knowledge base for posts with vector embeddings
     
     This implementation uses:
-    1. LangChain with OpenAI embeddings for generating embeddings
-    2. FAISS vector store for efficient similarity search
-    3. Requires OPENAI_API_KEY environment variable
+    1. LangChain with OpenAI embeddings for generating embeddings, per
+       token-bounded chunk of each post (or any LangChain Embeddings passed
+       in, or the offline hashed n-gram embedder with KB_EMBEDDING_BACKEND=local)
+    2. A persistent embedding cache so unchanged posts are never re-embedded
+    3. One FAISS vector store per language, so language-filtered searches only
+       scan that language's vectors; saved to disk and memory-mapped on
+       startup so only changed posts are reconciled
+    4. A BM25 keyword index over the posts, fused with the vector results
+       (KB_SEARCH_MODE=hybrid) so exact terms are not missed; keyword search
+       alone serves queries when the query cannot be embedded
+    5. A circuit breaker around embedding calls: while the provider is down
+       (or OPENAI_API_KEY is missing) the knowledge base still starts and
+       searches return keyword results flagged as degraded; the vector
+       index catches up in the background once the provider recovers
     
-    RAG is mandatory - keyword matching fallback is not used.
     In production, you might want to use a vector database like Chroma, Pinecone, or Vertex AI Vector Search
     """
     
-    def __init__(self, use_mysql: bool = True):
+    def __init__(self, use_mysql: bool = True, embeddings=None):
         """
         Initialize knowledge base with RAG (mandatory)
         
         Args:
             use_mysql: Whether to load posts from MySQL database (default: True)
+            embeddings: Optional LangChain Embeddings to use instead of the
+                configured backend (KB_EMBEDDING_BACKEND)
         
         Raises:
-            RuntimeError: If RAG is not available or OPENAI_API_KEY is not set
+            RuntimeError: If LangChain / FAISS are not installed
         """
         if not RAG_AVAILABLE:
             raise RuntimeError(
@@ -97,28 +162,144 @@ class KnowledgeBase:
         
         # Initialize embedding model and vector store (RAG is mandatory)
         self.embeddings = None
-        self.vector_store = None
+        # language -> FAISS vector store holding that language's chunks
+        self.vector_stores: Dict[str, FAISS] = {}
+        # post_id -> vector store document IDs, for in-place upsert/delete
+        self._doc_ids: Dict[str, List[str]] = {}
+        # post_id -> language partition its documents live in
+        self._doc_languages: Dict[str, str] = {}
+        # post_id -> content hash of the indexed version (saved in the manifest)
+        self._post_hashes: Dict[str, str] = {}
+        # Guards the vector store against concurrent mutation and search
+        self._lock = threading.RLock()
+        # Serializes index writers (index worker, outage catch-up)
+        self._write_lock = threading.RLock()
+        # Searches per vector store, so retired partitions can be reused safely
+        self._readers = _StoreReaders()
+        # language -> (retired store, published store it lags, changes to replay),
+        # the writer's private copy for the next change, see _private_store
+        self._spares: Dict[str, Tuple[FAISS, FAISS, List[Callable]]] = {}
+        # Stores built by the writer (in memory, safe to mutate once retired)
+        self._owned_stores = weakref.WeakSet()
+        # Catches the index up after embedding failures, see _schedule_index_retry
+        self._retry_thread: Optional[threading.Thread] = None
+        # Most recent bulk embedding run, for progress in stats()
+        self.ingest: Optional[EmbeddingPipeline] = None
+        # Bumped on every index change; part of the search coalescing key
+        self.version = 0
+        # Normalized query text -> vector, so repeated searches skip the embedding call
+        self.query_cache = QueryEmbeddingCache()
+        # Bounded pool for FAISS queries issued from async endpoints
+        self._search_executor = ThreadPoolExecutor(
+            max_workers=SEARCH_THREADS, thread_name_prefix="kb-search"
+        )
+        # Identical concurrent async searches share one computation
+        self.search_flight = SingleFlight()
+        # BM25 keyword index over self.posts
+        self.lexical_index = LexicalIndex()
+        # Fails embedding calls fast while the provider is down
+        self.embedding_breaker = CircuitBreaker("Embedding provider")
         
+        # Embeddings passed in are kept; configured ones follow API key changes
+        self._embeddings_injected = embeddings is not None
+        # OpenAI API key the embeddings were created with, see reload_embeddings
+        self._embedding_key: Optional[str] = None
         try:
-            # Get OpenAI API key from database or environment
-            openai_api_key = self._get_openai_api_key()
-            if not openai_api_key:
-                raise ValueError(
-                    "OPENAI_API_KEY not found. Please set it in the admin panel or environment variable."
-                )
-            self.embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
-            print("RAG enabled: Using LangChain with OpenAI embeddings for semantic search")
+            if embeddings is None:
+                # Get OpenAI API key from database or environment (OpenAI backend only)
+                openai_api_key = self._get_openai_api_key() if EMBEDDING_BACKEND == "openai" else None
+                self._embedding_key = openai_api_key
+                embeddings = create_embeddings(openai_api_key)
+            self.embeddings = self._build_embeddings(GuardedEmbeddings(embeddings, self.embedding_breaker))
+            print(f"RAG enabled: Using LangChain with {self._embedding_model_name()} embeddings for semantic search")
         except Exception as e:
-            raise RuntimeError(
-                f"Failed to initialize RAG: {e}. "
-                "RAG is required for this knowledge base. Please ensure OPENAI_API_KEY is set correctly."
-            ) from e
+            # Keep serving keyword search rather than failing the whole API
+            print(f"Warning: Failed to initialize RAG, using keyword search only: {e}")
+
+        # Concurrent async query embeddings are sent to the provider in batches
+        self.query_batcher = QueryEmbeddingBatcher(self._raw_embeddings())
         
         self.load_posts()
+        if self.embeddings is None:
+            return
         
-        # Generate embeddings for existing posts
-        self._generate_all_embeddings()
+        # Reuse the saved index when possible, otherwise embed all posts
+        reconciled = self._load_saved_index()
+        if reconciled is None:
+            try:
+                self._generate_all_embeddings()
+            except Exception as e:
+                print(f"Warning: {e} Serving keyword search until embeddings are available.")
+                self._schedule_index_retry()
+                return
+        if reconciled != 0:
+            self.save_index()
     
+    def _build_embeddings(self, embeddings):
+        """Wrap embeddings with the on-disk cache (falls back to uncached on error)"""
+        try:
+            return CachedEmbeddings(embeddings, EmbeddingCache())
+        except Exception as e:
+            print(f"Warning: Embedding cache unavailable, embeddings will not be cached: {e}")
+            return embeddings
+
+    def _raw_embeddings(self):
+        """The provider embeddings, without the document cache wrapper"""
+        if isinstance(self.embeddings, CachedEmbeddings):
+            return self.embeddings.embeddings
+        return self.embeddings
+
+    def embedding_key_changed(self) -> bool:
+        """Whether the configured OpenAI API key differs from the one the embeddings use"""
+        if self._embeddings_injected or EMBEDDING_BACKEND != "openai":
+            return False
+        key = self._get_openai_api_key()
+        return bool(key) and key != self._embedding_key
+
+    def reload_embeddings(self, progress: Optional[ProgressCallback] = None) -> bool:
+        """
+        Re-create the embedding provider after an API key change
+
+        Without a key at startup the knowledge base serves keyword search
+        only; once a key is configured the provider is created and the
+        vector index loaded or built. A replaced key keeps the existing
+        index (same model) and catches up posts changed in the meantime.
+        Run through IndexWorker.submit_reload, which saves the index after.
+
+        Returns:
+            Whether the provider was replaced
+
+        Raises:
+            Exception: If building the index fails (retried in the background)
+        """
+        if not self.embedding_key_changed():
+            return False
+        key = self._get_openai_api_key()
+        with self._write_lock:
+            try:
+                embeddings = self._build_embeddings(
+                    GuardedEmbeddings(create_embeddings(key), self.embedding_breaker)
+                )
+            except Exception as e:
+                print(f"Warning: Failed to re-create embeddings with the new API key: {e}")
+                return False
+            self.embeddings = embeddings
+            self._embedding_key = key
+            self.query_batcher.embeddings = self._raw_embeddings()
+            # Failures with the previous key say nothing about the new one
+            self.embedding_breaker.record_success()
+            print(f"Embeddings re-created with the new API key ({self._embedding_model_name()})")
+
+            try:
+                if self.vector_stores:
+                    self._reconcile_index()
+                elif self._load_saved_index() is None:
+                    self._generate_all_embeddings(progress)
+            except Exception:
+                self._schedule_index_retry()
+                raise
+        return True
+
     def _get_openai_api_key(self) -> Optional[str]:
         """Get OpenAI API key from database or environment"""
         # First try database
@@ -143,7 +324,8 @@ class KnowledgeBase:
     
     def load_posts(self):
         """Load posts from MySQL database or JSON file"""
-        self.posts = {}
+        # Fill a new dict and swap it in, so concurrent searches never see it half-loaded
+        posts: Dict[str, Post] = {}
         if self.use_mysql:
             try:
                 from database import SessionLocal
@@ -152,17 +334,9 @@ class KnowledgeBase:
                     from database import Post as DBPost
                     db_posts = db.query(DBPost).filter(DBPost.is_active == True).all()
                     for db_post in db_posts:
-                        tags = db_post.tags.split(",") if db_post.tags else []
-                        post = Post(
-                            id=db_post.id,
-                            title=db_post.title,
-                            content=db_post.content,
-                            tags=tags,
-                            language=db_post.language or "zh-CN",
-                            created_at=db_post.created_at.isoformat() if db_post.created_at else None
-                        )
-                        self.posts[post.id] = post
-                    print(f"Loaded {len(self.posts)} posts from MySQL database")
+                        post = Post.from_db(db_post)
+                        posts[post.id] = post
+                    print(f"Loaded {len(posts)} posts from MySQL database")
                 finally:
                     db.close()
             except Exception as e:
@@ -177,10 +351,14 @@ class KnowledgeBase:
                         data = json.load(f)
                         for post_data in data.get('posts', []):
                             post = Post(**post_data)
-                            self.posts[post.id] = post
-                    print(f"Loaded {len(self.posts)} posts from {storage_path}")
+                            posts[post.id] = post
+                    print(f"Loaded {len(posts)} posts from {storage_path}")
                 except Exception as e:
                     print(f"Error loading posts from JSON: {e}")
+        self.posts = posts
+        self.lexical_index.rebuild(
+            (post.id, self._lexical_text(post), post.language) for post in posts.values()
+        )
     
     def save_posts(self):
         """Save posts to MySQL database"""
@@ -212,157 +390,948 @@ class KnowledgeBase:
     def add_post(self, post: Post):
         """Add a new post"""
         self.posts[post.id] = post
+        self.lexical_index.upsert(post.id, self._lexical_text(post), post.language)
         self.save_posts()
         
         # Add to vector store (RAG is mandatory)
-        if self.embeddings and self.vector_store:
-            self._add_post_to_vector_store(post)
+        if self.embeddings:
+            self._upsert_post_vectors(post)
+
+    def upsert_post(self, post: Post):
+        """
+        Insert or replace a single post in the vector store
+
+        Only the changed post is re-embedded; the rest of the index is untouched.
+        """
+        self.posts[post.id] = post
+        self.lexical_index.upsert(post.id, self._lexical_text(post), post.language)
+        if self.embeddings:
+            self._upsert_post_vectors(post)
+
+    def delete_post(self, post_id: str):
+        """Remove a single post and its vectors from the knowledge base"""
+        self.posts.pop(post_id, None)
+        self.lexical_index.remove(post_id)
+        self._delete_post_vectors(post_id)
+
+    def save_index(self):
+        """Save the vector stores and manifest to disk for fast startup"""
+        with self._lock:
+            if not self.vector_stores:
+                return
+            manifest = {
+                "model": self._embedding_model_name(),
+                "chunking": chunk_config(),
+                "dimension": int(next(iter(self.vector_stores.values())).index.d),
+                "posts": dict(self._post_hashes),
+                "doc_ids": {k: list(v) for k, v in self._doc_ids.items()},
+                "doc_languages": dict(self._doc_languages),
+            }
+            try:
+                save_index(self.vector_stores, manifest)
+                print(f"Saved vector index ({self._vector_count()} vectors)")
+            except Exception as e:
+                print(f"Warning: Could not save vector index: {e}")
+
+    def _load_saved_index(self) -> Optional[int]:
+        """
+        Load the saved index and reconcile it with the current posts
+
+        Returns:
+            Number of posts reconciled, or None if a full build is needed
+        """
+        try:
+            loaded = load_index(self.embeddings)
+        except Exception as e:
+            print(f"Warning: Could not load saved index: {e}")
+            return None
+        if loaded is None:
+            return None
+
+        vector_stores, manifest = loaded
+        if manifest.get("model") != self._embedding_model_name():
+            print("Saved index was built with a different embedding model, rebuilding")
+            return None
+        if manifest.get("chunking") != chunk_config():
+            print("Saved index was built with different chunking settings, rebuilding")
+            return None
+
+        # Apply the current search knobs, and switch index types if the
+        # configuration or partition size calls for it (no re-embedding)
+        retyped = 0
+        for language, store in list(vector_stores.items()):
+            tune_index(store.index)
+            spec = target_index_spec(store.index)
+            if spec:
+                print(f"Rebuilding saved {language} partition as {'/'.join(spec)}")
+                vector_stores[language] = rebuild_vector_store(
+                    store, spec=spec, exact_vectors=self._exact_vectors
+                )
+                retyped += 1
+
+        with self._lock:
+            self.vector_stores = vector_stores
+            self._doc_ids = manifest.get("doc_ids", {})
+            self._doc_languages = manifest.get("doc_languages", {})
+            self._post_hashes = manifest.get("posts", {})
+            self.version += 1
+
+        changed = [
+            post for post_id, post in self.posts.items()
+            if self._post_hashes.get(post_id) != self._post_hash(post)
+        ]
+        removed = [post_id for post_id in self._post_hashes if post_id not in self.posts]
+        if changed or removed:
+            try:
+                self.apply_changes(changed, removed)
+            except Exception as e:
+                # Hashes stay stale; they are retried in the background
+                print(f"Warning: Failed to reconcile saved index: {e}")
+
+        print(
+            f"Loaded saved vector index ({self._vector_count()} vectors); "
+            f"reconciled {len(changed)} changed and {len(removed)} removed posts"
+        )
+        return len(changed) + len(removed) + retyped
+
+    def stats(self) -> Dict:
+        """Index size and cache counters, for monitoring"""
+        with self._lock:
+            stats = {
+                "version": self.version,
+                "posts": len(self.posts),
+                "vectors": self._vector_count(),
+                "partitions": {
+                    language: live_count(store) for language, store in self.vector_stores.items()
+                },
+                "tombstones": {
+                    language: tombstone_count(store) for language, store in self.vector_stores.items()
+                },
+                "index_types": {
+                    language: index_type(store.index) for language, store in self.vector_stores.items()
+                },
+                "quantization": {
+                    language: index_quantization(store.index) for language, store in self.vector_stores.items()
+                },
+            }
+        stats["index_config"] = index_config()
+        stats["min_score"] = MIN_SCORE
+        stats["embedding_model"] = self._embedding_model_name() if self.embeddings is not None else None
+        stats["ingest"] = self.ingest.stats() if self.ingest is not None else None
+        stats["search_mode"] = SEARCH_MODE
+        stats["degraded"] = not self._use_vectors() and SEARCH_MODE != "lexical"
+        stats["embedding_breaker"] = self.embedding_breaker.stats()
+        stats["lexical_index"] = self.lexical_index.stats()
+        stats["query_cache"] = self.query_cache.stats()
+        stats["query_batching"] = self.query_batcher.stats()
+        stats["search_coalescing"] = self.search_flight.stats()
+        if isinstance(self.embeddings, CachedEmbeddings):
+            stats["embedding_cache"] = {
+                "hits": self.embeddings.hits,
+                "misses": self.embeddings.misses,
+            }
+        return stats
+
+    def _vector_count(self) -> int:
+        """Total number of chunk vectors across language partitions"""
+        return sum(live_count(store) for store in self.vector_stores.values())
+
+    def _embedding_model_name(self) -> str:
+        """Name of the embedding model, used to invalidate saved indexes"""
+        if isinstance(self.embeddings, CachedEmbeddings):
+            return self.embeddings.model_name
+        return getattr(self.embeddings, "model", None) or type(self.embeddings).__name__
     
-    def search_posts(self, query: str, top_k: int = 3, language: Optional[str] = None) -> List[SearchResult]:
+    def search_posts(
+        self, query: str, top_k: int = 3, language: Optional[str] = None, min_score: Optional[float] = None
+    ) -> List[SearchResult]:
         """
-        Search posts using RAG (vector embeddings)
+        Search posts using RAG (vector embeddings) and keyword matching
 
         Args:
             query: Search query
             top_k: Number of results to return
             language: Optional language filter (e.g. "zh-CN", "en")
+            min_score: Minimum cosine similarity of a matching chunk (defaults to KB_MIN_SCORE)
 
         Returns:
             List of search results with relevance scores
 
         Raises:
-            RuntimeError: If RAG is not properly initialized
+            RuntimeError: If the index search fails (embedding failures fall back to keywords)
         """
-        if not self.vector_store:
-            raise RuntimeError(
-                "Vector store is not initialized. RAG requires a properly initialized vector store."
-            )
-        return self._search_with_rag(query, top_k, language=language)
-    
-    def _search_with_rag(self, query: str, top_k: int = 3, language: Optional[str] = None) -> List[SearchResult]:
+        query_vector = None
+        if self._use_vectors():
+            try:
+                query_vector = self._embed_query(query)
+            except Exception as e:
+                self._embedding_failed(e)
+        return self._search_with_rag(query, query_vector, top_k, language=language, min_score=min_score)
+
+    async def asearch_posts(
+        self, query: str, top_k: int = 3, language: Optional[str] = None, min_score: Optional[float] = None
+    ) -> List[SearchResult]:
         """
-        RAG-based search using LangChain FAISS vector store
+        Async variant of search_posts for use from the event loop
+
+        The query is embedded with the async embeddings client and the FAISS
+        search runs on a bounded thread pool, so neither blocks the loop.
+        Concurrent identical searches against the same index version are
+        coalesced into one computation.
+        """
+        key = (normalize_query(query), top_k, language, min_score, self.version)
+        return await self.search_flight.do(
+            key, lambda: self._asearch_posts(query, top_k, language, min_score)
+        )
+
+    async def _asearch_posts(
+        self, query: str, top_k: int, language: Optional[str], min_score: Optional[float]
+    ) -> List[SearchResult]:
+        """Embed the query and run the FAISS and keyword search off the event loop"""
+        query_vector = None
+        if self._use_vectors():
+            try:
+                query_vector = await self._aembed_query(query)
+            except Exception as e:
+                self._embedding_failed(e)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._search_executor,
+            lambda: self._search_with_rag(query, query_vector, top_k, language=language, min_score=min_score)
+        )
+
+    def _use_vectors(self) -> bool:
+        """Whether searches embed the query and scan FAISS (False when degraded to keywords)"""
+        return SEARCH_MODE != "lexical" and self.embeddings is not None and bool(self.vector_stores)
+
+    def _embedding_failed(self, error: Exception):
+        """Fall back to keyword search for this query (results are flagged as degraded)"""
+        if not isinstance(error, CircuitOpenError):
+            print(f"Warning: Query embedding failed, using keyword search only: {error}")
+
+    def _search_with_rag(
+        self, query: str, query_vector: Optional[List[float]], top_k: int = 3, language: Optional[str] = None,
+        min_score: Optional[float] = None
+    ) -> List[SearchResult]:
+        """
+        RAG-based search using LangChain FAISS vector store and the keyword index
 
         This is the core RAG implementation:
-        1. Use FAISS similarity search to find relevant documents
-        2. Optionally filter by language
-        3. Return top-k most similar posts
+        1. Use FAISS similarity search to find chunks near the query vector,
+           searching only the requested language's partition when given
+           (skipped when query_vector is None)
+        2. Drop chunks whose cosine similarity is below min_score
+        3. Merge chunk hits per post (max or sum scoring)
+        4. In hybrid mode, rank posts by BM25 keyword score as well and fuse
+           both rankings by reciprocal rank. With min_score set, only posts
+           that passed it can be returned: keyword matches re-rank them but
+           never add posts of their own
+        5. Return top-k posts
+
+        The fused rank only orders the results: relevance_score stays the
+        post's cosine similarity, so scores compare across queries. A post
+        found by keywords alone is scored from its cached chunk vectors.
+
+        Without a query vector outside lexical mode, results come from the
+        keyword index alone and are flagged as degraded. There is no cosine
+        similarity to check then, so min_score does not filter them, and
+        relevance_score is the normalized keyword rank.
         """
+        if min_score is None:
+            min_score = MIN_SCORE
+        use_keywords = SEARCH_MODE != "vector" or query_vector is None
+        degraded = query_vector is None and SEARCH_MODE != "lexical"
+        # Fusion needs candidates beyond top_k from each side
+        depth = top_k * CHUNK_FETCH_FACTOR if use_keywords else top_k
         try:
-            # Fetch more candidates when filtering by language
-            fetch_k = top_k * 3 if language else top_k
-            docs_with_scores = self.vector_store.similarity_search_with_score(query, k=fetch_k)
+            # post_id -> chunk similarity scores, and the best matching chunk
+            post_scores: Dict[str, List[float]] = {}
+            best_chunk: Dict[str, Tuple[float, Document]] = {}
+            if query_vector is not None:
+                for doc, score in self._search_vectors(query_vector, depth, language=language):
+                    # Extract post_id from document metadata
+                    post_id = doc.metadata.get('post_id')
+                    if not post_id or post_id not in self.posts:
+                        continue
+
+                    # Vectors are normalized, so the inner product is the cosine similarity
+                    similarity_score = float(score)
+                    if min_score is not None and similarity_score < min_score:
+                        continue
+
+                    post_scores.setdefault(post_id, []).append(similarity_score)
+                    if post_id not in best_chunk or similarity_score > best_chunk[post_id][0]:
+                        best_chunk[post_id] = (similarity_score, doc)
+
+            semantic = sorted(
+                ((merge_scores(scores), post_id) for post_id, scores in post_scores.items()),
+                reverse=True
+            )[:depth]
+
+            keyword_scores: Dict[str, float] = {}
+            if use_keywords:
+                keyword_scores = dict(self.lexical_index.search(query, depth, language=language))
+                if query_vector is not None and min_score is not None:
+                    # min_score is a cosine cutoff; keyword-only posts never reached it
+                    keyword_scores = {
+                        post_id: score for post_id, score in keyword_scores.items() if post_id in post_scores
+                    }
+
+            if not use_keywords:
+                ranked = semantic[:top_k]
+            else:
+                rankings = [[post_id for _, post_id in semantic]] if query_vector is not None else []
+                rankings.append(list(keyword_scores))
+                ranked = reciprocal_rank_fusion(rankings)[:top_k]
 
             results = []
-            for doc, score in docs_with_scores:
-                # Filter by language if specified
-                if language and doc.metadata.get('language', '') != language:
+            for relevance_score, post_id in ranked:
+                post = self.posts.get(post_id)
+                if post is None:
+                    # Deleted while this search was running
                     continue
-                # Extract post_id from document metadata
-                post_id = doc.metadata.get('post_id')
-                if post_id and post_id in self.posts:
-                    post = self.posts[post_id]
-                    
-                    # Convert distance to similarity score (lower distance = higher similarity)
-                    # FAISS returns distance, so we convert it to similarity
-                    similarity_score = 1.0 / (1.0 + float(score)) if score > 0 else 1.0
-                    
-                    # Extract relevant snippet
-                    matched_content = self._extract_relevant_snippet_semantic(post.content, query, max_length=200)
-                    
-                    # Generate reason based on similarity
-                    reason = f"Semantic similarity: {similarity_score:.3f}"
-                    if post.tags:
-                        reason += f"; Tags: {', '.join(post.tags)}"
-                    
-                    results.append(SearchResult(
-                        post_id=post.id,
-                        title=post.title,
-                        relevance_score=similarity_score,
-                        matched_content=matched_content,
-                        reason=reason
-                    ))
-                    if len(results) >= top_k:
-                        break
+                if post_id in post_scores:
+                    relevance_score = merge_scores(post_scores[post_id])
+                elif query_vector is not None:
+                    relevance_score = self._post_similarity(query_vector, post_id)
+                span = None
+                if post_id in best_chunk:
+                    chunk = best_chunk[post_id][1]
+                    span = (chunk.metadata.get('chunk_start', 0), chunk.metadata.get('chunk_end', len(post.content)))
+
+                # Extract relevant snippet from the chunk that matched (or the
+                # best keyword window of the whole post)
+                matched_content = self._extract_relevant_snippet_semantic(
+                    post.content, query, max_length=200, span=span
+                )
+
+                # Generate reason based on similarity and keyword matches
+                reasons = []
+                if post_id in post_scores:
+                    reason = f"Semantic similarity: {merge_scores(post_scores[post_id]):.3f}"
+                    if len(post_scores[post_id]) > 1:
+                        reason += f" ({len(post_scores[post_id])} matching sections)"
+                    reasons.append(reason)
+                if post_id in keyword_scores:
+                    reasons.append(f"Keyword match: {keyword_scores[post_id]:.3f}")
+                if post.tags:
+                    reasons.append(f"Tags: {', '.join(post.tags)}")
+
+                results.append(SearchResult(
+                    post_id=post.id,
+                    title=post.title,
+                    relevance_score=relevance_score,
+                    matched_content=matched_content,
+                    reason="; ".join(reasons),
+                    degraded=degraded
+                ))
 
             return results
         except Exception as e:
             raise RuntimeError(f"RAG search failed: {e}. Please ensure RAG is properly configured.") from e
     
     
-    def _generate_all_embeddings(self):
-        """Generate embeddings and create vector store for all posts"""
+    def _embed_query(self, query: str) -> List[float]:
+        """Embed a search query, serving repeated queries from the LRU cache"""
+        key = normalize_query(query)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(key)
+            self.query_cache.put(key, vector)
+        return vector
+
+    async def _aembed_query(self, query: str) -> List[float]:
+        """Async variant of _embed_query; cache misses go through the micro-batcher"""
+        key = normalize_query(query)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = await self.query_batcher.embed(key)
+            self.query_cache.put(key, vector)
+        return vector
+
+    def _search_vectors(
+        self, query_vector: List[float], top_k: int, language: Optional[str] = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        Nearest chunks to a query vector, restricted to one language if given
+
+        Starts with top_k * CHUNK_FETCH_FACTOR chunks and widens the search
+        until top_k distinct posts are covered or the partitions are exhausted,
+        so results stay complete when one post has many matching chunks.
+        """
+        # Partitions are never mutated while published, so one read of the
+        # dict gives a consistent snapshot; registering it keeps the writer
+        # from reusing a partition retired while this search still runs
+        with self._readers.reading(lambda: self.vector_stores) as vector_stores:
+            return self._search_snapshot(vector_stores, query_vector, top_k, language)
+
+    def _search_snapshot(
+        self, vector_stores: Dict[str, FAISS], query_vector: List[float], top_k: int, language: Optional[str]
+    ) -> List[Tuple[Document, float]]:
+        if language:
+            stores = [vector_stores[language]] if language in vector_stores else []
+        else:
+            stores = list(vector_stores.values())
+        stores = [store for store in stores if live_count(store) > 0]
+        total = sum(live_count(store) for store in stores)
+
+        k = top_k * CHUNK_FETCH_FACTOR
+        while True:
+            hits = []
+            for store in stores:
+                if RERANK_FACTOR > 0 and is_quantized(store.index):
+                    # Over-fetch from compressed codes, then re-score with exact vectors
+                    candidates = cosine_scores(store.index, search_store(store, query_vector, k * RERANK_FACTOR))
+                    hits.extend(self._rerank(query_vector, candidates)[:k])
+                else:
+                    hits.extend(cosine_scores(store.index, search_store(store, query_vector, k)))
+            # Per-partition results (all cosine similarities) merge into global results
+            hits.sort(key=lambda hit: hit[1], reverse=True)
+            hits = hits[:k]
+            if k >= total or len({doc.metadata.get('post_id') for doc, _ in hits}) >= top_k:
+                return hits
+            k *= 2
+
+    def _post_similarity(self, query_vector: List[float], post_id: str) -> float:
+        """
+        Cosine similarity of a post's chunks to a query, from the embedding cache
+
+        For posts the vector search did not return (found by keywords only);
+        0.0 when the post has no cached vectors.
+        """
+        store = self.vector_stores.get(self._doc_languages.get(post_id))
+        if store is None:
+            return 0.0
+        docs = [store.docstore.search(doc_id) for doc_id in self._doc_ids.get(post_id, [])]
+        texts = [doc.page_content for doc in docs if isinstance(doc, Document)]
+        query = _unit(np.asarray(query_vector, dtype=np.float32))
+        scores = [
+            float(np.dot(_unit(np.asarray(vector, dtype=np.float32)), query))
+            for vector in self._exact_vectors(texts) if vector is not None
+        ]
+        return merge_scores(scores) if scores else 0.0
+
+    def _exact_vectors(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Full-precision document vectors from the embedding cache (None where missing)"""
+        if not isinstance(self.embeddings, CachedEmbeddings):
+            return [None] * len(texts)
+        return self.embeddings.cached_vectors(texts)
+
+    def _rerank(
+        self, query_vector: List[float], hits: List[Tuple[Document, float]]
+    ) -> List[Tuple[Document, float]]:
+        """Replace approximate scores with exact cosine similarities where possible"""
+        exact = self._exact_vectors([doc.page_content for doc, _ in hits])
+        query = _unit(np.asarray(query_vector, dtype=np.float32))
+        reranked = []
+        for (doc, score), vector in zip(hits, exact):
+            if vector is not None:
+                score = float(np.dot(_unit(np.asarray(vector, dtype=np.float32)), query))
+            reranked.append((doc, score))
+        reranked.sort(key=lambda hit: hit[1], reverse=True)
+        return reranked
+
+    def recall_at_k(self, sample: int = 50, top_k: int = 10) -> Dict:
+        """
+        Measure search recall@k of each partition against exact search
+
+        Queries are the cached vectors of randomly sampled chunks (no
+        embedding calls). Ground truth is a brute-force scan over the exact
+        cached vectors of the partition, so very large partitions are skipped.
+        """
+        results = {}
+        rng = np.random.default_rng()
+        # Ground truth and searches use the same snapshot of the partitions
+        with self._readers.reading(lambda: self.vector_stores) as vector_stores:
+            for language, store in vector_stores.items():
+                if store.index.ntotal > RECALL_MAX_VECTORS:
+                    results[language] = {"error": f"partition larger than {RECALL_MAX_VECTORS} vectors"}
+                    continue
+                positions = sorted(store.index_to_docstore_id)
+                docs = [store.docstore.search(store.index_to_docstore_id[p]) for p in positions]
+                exact = self._exact_vectors([doc.page_content for doc in docs])
+                if not docs or any(v is None for v in exact):
+                    results[language] = {"error": "exact vectors not available in the embedding cache"}
+                    continue
+                matrix = np.asarray(exact, dtype=np.float32)
+                matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+                k = min(top_k, len(docs))
+                picks = rng.choice(len(docs), size=min(sample, len(docs)), replace=False)
+
+                def key(doc):
+                    return doc.metadata.get("post_id"), doc.metadata.get("chunk_index")
+
+                hits = 0
+                for i in picks:
+                    query = matrix[i]
+                    truth = {key(docs[j]) for j in np.argsort(-(matrix @ query))[:k]}
+                    found = self._search_snapshot(vector_stores, query.tolist(), k, language)[:k]
+                    hits += len(truth & {key(doc) for doc, _ in found})
+                results[language] = {
+                    "index_type": index_type(store.index),
+                    "quantization": index_quantization(store.index),
+                    "vectors": len(docs),
+                    "queries": len(picks),
+                    "recall": round(hits / (len(picks) * k), 4),
+                }
+        return {"top_k": top_k, "partitions": results}
+
+    @staticmethod
+    def _lexical_text(post: Post) -> str:
+        """Text indexed for keyword search: title, tags and content"""
+        return "\n".join([post.title, " ".join(post.tags), post.content])
+
+    @staticmethod
+    def _post_hash(post: Post) -> str:
+        """Hash of everything that ends up in a post's indexed documents"""
+        return text_hash(json.dumps(
+            [post.title, post.content, post.tags, post.language], ensure_ascii=False
+        ))
+
+    def _post_documents(self, post: Post) -> Tuple[List[str], List[Document]]:
+        """
+        Build vector store documents for a post, one per chunk
+
+        Document IDs are stable ("<post_id>#<chunk index>") and each chunk keeps
+        its offsets into the post content. The title is prepended to every
+        chunk so short sections keep their context.
+        """
+        # A post with empty content still gets one (title-only) document
+        chunks = split_text(post.content) or [Chunk(index=0, start=0, end=0, text="")]
+        ids = []
+        docs = []
+        for chunk in chunks:
+            ids.append(f"{post.id}#{chunk.index}")
+            docs.append(Document(
+                page_content=f"{post.title}. {chunk.text}",
+                metadata={
+                    'post_id': post.id,
+                    'title': post.title,
+                    'tags': ', '.join(post.tags) if post.tags else '',
+                    'language': post.language,
+                    'chunk_index': chunk.index,
+                    'chunk_start': chunk.start,
+                    'chunk_end': chunk.end,
+                }
+            ))
+        return ids, docs
+
+    def _generate_all_embeddings(self, progress: Optional[ProgressCallback] = None):
+        """
+        Generate embeddings and create the per-language vector stores for all posts
+
+        Args:
+            progress: Optional progress(done, total) callback, in chunk texts
+        """
         if not self.embeddings:
             return
-        
+        with self._write_lock:
+            self._build_all_vector_stores(progress)
+
+    def _build_all_vector_stores(self, progress: Optional[ProgressCallback] = None):
         print("Generating embeddings for all posts using LangChain...")
         
         # Create documents from posts
+        ids = []
         documents = []
+        doc_ids: Dict[str, List[str]] = {}
+        doc_languages: Dict[str, str] = {}
+        post_hashes: Dict[str, str] = {}
         for post_id, post in self.posts.items():
-            # Combine title and content for embedding
-            text = f"{post.title}. {post.content}"
-            doc = Document(
-                page_content=text,
-                metadata={
-                    'post_id': post.id,
-                    'title': post.title,
-                    'tags': ', '.join(post.tags) if post.tags else '',
-                    'language': post.language,
-                }
-            )
-            documents.append(doc)
+            post_doc_ids, post_docs = self._post_documents(post)
+            ids.extend(post_doc_ids)
+            documents.extend(post_docs)
+            doc_ids[post_id] = post_doc_ids
+            doc_languages[post_id] = post.language
+            post_hashes[post_id] = self._post_hash(post)
         
         if documents:
             try:
-                # Create FAISS vector store from documents
-                self.vector_store = FAISS.from_documents(documents, self.embeddings)
-                print(f"Created vector store with {len(documents)} posts")
+                texts = [doc.page_content for doc in documents]
+                vectors = self._embed_bulk(texts, progress)
+
+                # Group documents into one FAISS vector store per language
+                partitions: Dict[str, List[int]] = {}
+                for i, doc in enumerate(documents):
+                    partitions.setdefault(doc.metadata['language'], []).append(i)
+                vector_stores = {
+                    language: new_vector_store(
+                        self.embeddings,
+                        [texts[i] for i in indices],
+                        [vectors[i] for i in indices],
+                        [documents[i].metadata for i in indices],
+                        [ids[i] for i in indices],
+                    )
+                    for language, indices in partitions.items()
+                }
+                with self._lock:
+                    self.vector_stores = vector_stores
+                    self._doc_ids = doc_ids
+                    self._doc_languages = doc_languages
+                    self._post_hashes = post_hashes
+                    self.version += 1
+                self._spares.clear()
+                print(
+                    f"Created vector store with {len(documents)} chunks from {len(doc_ids)} posts "
+                    f"in {len(vector_stores)} language partition(s)"
+                )
+                if isinstance(self.embeddings, CachedEmbeddings):
+                    print(
+                        f"Embedding cache: {self.embeddings.hits} hits, "
+                        f"{self.embeddings.misses} misses"
+                    )
             except Exception as e:
                 raise RuntimeError(
                     f"Failed to create vector store: {e}. "
                     "RAG is required. Please ensure embeddings are properly initialized."
                 ) from e
+        else:
+            with self._lock:
+                self.vector_stores = {}
+                self._doc_ids = {}
+                self._doc_languages = {}
+                self._post_hashes = {}
+                self.version += 1
     
-    def _add_post_to_vector_store(self, post: Post):
-        """Add a single post to the vector store"""
-        if not self.embeddings or not self.vector_store:
+    def apply_changes(self, upserts: List[Post], deletes: List[str]):
+        """
+        Apply post upserts and deletes to the index
+
+        Changes are written to copies of the affected language partitions,
+        which are then swapped in together with the post data. Searches keep
+        using the previous partitions until the swap, so they never see a
+        half-applied change. Removed documents are tombstoned, and any
+        rebuild (index type change or compaction) also happens before the
+        swap; _lock is only held for the swap itself.
+
+        Raises:
+            Exception: If embedding fails; the live vectors are left untouched,
+                the posts and keyword index are updated and the vectors are
+                retried in the background
+        """
+        with self._write_lock:
+            self._apply_changes(upserts, deletes)
+
+    def _apply_changes(self, upserts: List[Post], deletes: List[str]):
+        prepared = []
+        vectors: List[List[float]] = []
+        if upserts:
+            texts = []
+            for post in upserts:
+                ids, docs = self._post_documents(post)
+                prepared.append((post, ids, docs))
+                texts.extend(doc.page_content for doc in docs)
+            # Embed before touching the index so a failed call keeps the old vectors
+            try:
+                if self.embeddings is None:
+                    raise RuntimeError("Embeddings are not configured")
+                if len(texts) > EMBED_BATCH_SIZE:
+                    vectors = self._embed_bulk(texts)
+                else:
+                    vectors = self.embeddings.embed_documents(texts)
+            except Exception:
+                # Keyword search stays current; the stale post hashes mark
+                # what the background catch-up has to embed
+                self._publish_posts(upserts, deletes)
+                self._schedule_index_retry()
+                raise
+
+        # Writers are serialized by _write_lock, so the new state is built
+        # outside _lock; searches keep using the published partitions
+        published = self.vector_stores
+        vector_stores = dict(published)
+        doc_ids = dict(self._doc_ids)
+        doc_languages = dict(self._doc_languages)
+        post_hashes = dict(self._post_hashes)
+        copied = set()
+        # Partitions replaced by a new store rather than changed in place
+        rebuilt = set()
+        # language -> changes applied to its private copy, replayed later on
+        # the published store once it is retired (see _private_store)
+        changes: Dict[str, List[Callable]] = {}
+
+        def write(language, change):
+            # Take a private copy of each affected partition once, on first write
+            if language not in copied:
+                vector_stores[language] = self._private_store(language, published[language])
+                copied.add(language)
+            change(vector_stores[language])
+            changes.setdefault(language, []).append(change)
+
+        # Collect old documents per partition; the language may have changed,
+        # so they are removed from the partition they were indexed in
+        removals: Dict[str, List[str]] = {}
+        for post_id in list(deletes) + [post.id for post, _, _ in prepared]:
+            ids = doc_ids.pop(post_id, [])
+            language = doc_languages.pop(post_id, None)
+            if ids and language in vector_stores:
+                removals.setdefault(language, []).extend(ids)
+        for post_id in deletes:
+            post_hashes.pop(post_id, None)
+
+        for language, ids in removals.items():
+            # Tombstoned: no index type has to be rebuilt to drop documents
+            write(language, partial(remove_documents, ids=ids))
+
+        offset = 0
+        for post, ids, docs in prepared:
+            post_vectors = vectors[offset:offset + len(docs)]
+            offset += len(docs)
+            texts = [doc.page_content for doc in docs]
+            metadatas = [doc.metadata for doc in docs]
+            if post.language in vector_stores:
+                write(post.language, partial(
+                    add_documents, texts=texts, vectors=post_vectors, metadatas=metadatas, ids=ids
+                ))
+            else:
+                vector_stores[post.language] = new_vector_store(
+                    self.embeddings, texts, post_vectors, metadatas, ids
+                )
+                copied.add(post.language)
+                rebuilt.add(post.language)
+            doc_ids[post.id] = ids
+            doc_languages[post.id] = post.language
+            post_hashes[post.id] = self._post_hash(post)
+
+        # Partitions that grew past a size threshold move to an approximate
+        # index; partitions with too many tombstones are compacted
+        for language in copied:
+            store = vector_stores[language]
+            spec = target_index_spec(store.index)
+            if spec:
+                print(f"Rebuilding {language} partition as {'/'.join(spec)} ({live_count(store)} vectors)")
+            elif needs_compaction(store):
+                print(f"Compacting {language} partition ({tombstone_count(store)} removed vectors)")
+            else:
+                continue
+            vector_stores[language] = rebuild_vector_store(store, spec=spec, exact_vectors=self._exact_vectors)
+            rebuilt.add(language)
+
+        # Publish the new state
+        with self._lock:
+            self._publish_posts(upserts, deletes)
+            self.vector_stores = vector_stores
+            self._doc_ids = doc_ids
+            self._doc_languages = doc_languages
+            self._post_hashes = post_hashes
+            self.version += 1
+
+        # The stores just retired become the private copies for the next
+        # change, once it has caught them up; partitions replaced by a new
+        # store start over with a clone
+        for language in copied:
+            self._owned_stores.add(vector_stores[language])
+            if language in published and language not in rebuilt and published[language] in self._owned_stores:
+                self._spares[language] = (published[language], vector_stores[language], changes[language])
+            else:
+                self._spares.pop(language, None)
+
+    def _private_store(self, language: str, store: FAISS) -> FAISS:
+        """
+        Writable copy of a published partition
+
+        Reuses the copy retired by the previous change to the partition:
+        once no search holds it any more, that change is replayed on it,
+        which is far cheaper than cloning the whole partition. Falls back to
+        a clone when there is no such copy (first change, a rebuild, a
+        memory-mapped index) or searches keep it busy.
+        """
+        spare = self._spares.pop(language, None)
+        if spare is not None:
+            retired, ahead, changes = spare
+            if ahead is store and self._readers.wait_idle(retired, SPARE_WAIT_SECONDS):
+                for change in changes:
+                    change(retired)
+                return retired
+        return _copy_vector_store(store)
+
+    def _embed_bulk(self, texts: List[str], progress: Optional[ProgressCallback] = None) -> List[List[float]]:
+        """Embed many texts through the batched, retrying pipeline (resumes from the cache)"""
+        pipeline = EmbeddingPipeline(self._bulk_embeddings())
+        self.ingest = pipeline
+        return pipeline.embed(texts, progress)
+
+    def _bulk_embeddings(self):
+        """
+        Cached document embeddings that bypass the circuit breaker
+
+        The pipeline backs off and retries on its own. Through the breaker, a
+        rate-limit burst would open it and every rejected call would use up
+        a retry without reaching the provider.
+        """
+        provider = self._raw_embeddings()
+        if isinstance(provider, GuardedEmbeddings):
+            provider = provider.embeddings
+        if isinstance(self.embeddings, CachedEmbeddings):
+            return CachedEmbeddings(provider, self.embeddings.cache, self.embeddings.model_name)
+        return provider
+
+    def _publish_posts(self, upserts: List[Post], deletes: List[str]):
+        """Swap in the changed posts and update the keyword index"""
+        with self._lock:
+            posts = dict(self.posts)
+            for post_id in deletes:
+                posts.pop(post_id, None)
+            for post in upserts:
+                posts[post.id] = post
+            self.posts = posts
+            for post_id in deletes:
+                self.lexical_index.remove(post_id)
+            for post in upserts:
+                self.lexical_index.upsert(post.id, self._lexical_text(post), post.language)
+
+    def _schedule_index_retry(self):
+        """Catch the vector index up in the background once embeddings work again"""
+        if self.embeddings is None:
             return
-        
+        with self._lock:
+            if self._retry_thread is not None and self._retry_thread.is_alive():
+                return
+            self._retry_thread = threading.Thread(target=self._retry_index, name="kb-index-retry", daemon=True)
+            self._retry_thread.start()
+
+    def _retry_index(self):
+        # Wake up when the breaker lets a trial call through
+        while True:
+            time.sleep(max(self.embedding_breaker.reset_timeout, 1.0))
+            try:
+                if self._reconcile_index():
+                    self.save_index()
+                return
+            except Exception as e:
+                if not isinstance(e, CircuitOpenError):
+                    print(f"Warning: Vector index catch-up failed, retrying: {e}")
+
+    def _reconcile_index(self) -> int:
+        """
+        Embed posts that are missing or stale in the vector index and drop removed ones
+
+        Returns:
+            Number of posts changed
+        """
+        with self._write_lock:
+            if not self.vector_stores:
+                if not self.posts:
+                    return 0
+                self._generate_all_embeddings()
+                print(f"Vector index built for {len(self.posts)} posts")
+                return len(self.posts)
+            changed = [
+                post for post_id, post in self.posts.items()
+                if self._post_hashes.get(post_id) != self._post_hash(post)
+            ]
+            removed = [post_id for post_id in self._post_hashes if post_id not in self.posts]
+            if changed or removed:
+                self.apply_changes(changed, removed)
+                print(f"Vector index caught up: {len(changed)} changed and {len(removed)} removed posts")
+            return len(changed) + len(removed)
+
+    def _upsert_post_vectors(self, post: Post):
+        """Replace a post's vectors in its language's vector store"""
         try:
-            # Create document from post
-            text = f"{post.title}. {post.content}"
-            doc = Document(
-                page_content=text,
-                metadata={
-                    'post_id': post.id,
-                    'title': post.title,
-                    'tags': ', '.join(post.tags) if post.tags else '',
-                    'language': post.language,
-                }
-            )
-            # Add document to existing vector store
-            self.vector_store.add_documents([doc])
+            self.apply_changes([post], [])
         except Exception as e:
             print(f"Failed to add post to vector store: {e}")
+
+    def _delete_post_vectors(self, post_id: str):
+        """Remove a post's vectors from the vector store"""
+        self.apply_changes([], [post_id])
     
-    def _extract_relevant_snippet_semantic(self, content: str, query: str, max_length: int = 200) -> str:
-        """Extract relevant snippet using semantic similarity"""
-        # Simple approach: return beginning of content
-        # In production, you might want to chunk content and find most relevant chunks
-        if len(content) > max_length:
-            return content[:max_length] + "..."
-        return content
+    def _extract_relevant_snippet_semantic(
+        self, content: str, query: str, max_length: int = 200, span: Optional[Tuple[int, int]] = None
+    ) -> str:
+        """
+        Extract the snippet that best matches the query
+
+        Uses the matched chunk offsets when known and a lexical overlap score
+        against the query (no extra embedding calls).
+        """
+        return extract_snippet(content, query, max_length=max_length, span=span)
     
 
 
+class _StoreReaders:
+    """
+    Counts the searches using each vector store
+
+    A search registers its snapshot of the published partitions under the
+    same lock the writer checks, so once a retired store has no readers no
+    search can still pick it up.
+    """
+
+    def __init__(self):
+        self._counts: Dict[int, int] = {}
+        self._idle = threading.Condition()
+
+    @contextmanager
+    def reading(self, snapshot: Callable[[], Dict[str, "FAISS"]]):
+        """Take snapshot() and hold its stores for the duration of the block"""
+        with self._idle:
+            stores = snapshot()
+            keys = [id(store) for store in stores.values()]
+            for key in keys:
+                self._counts[key] = self._counts.get(key, 0) + 1
+        try:
+            yield stores
+        finally:
+            with self._idle:
+                for key in keys:
+                    self._counts[key] -= 1
+                    if not self._counts[key]:
+                        del self._counts[key]
+                self._idle.notify_all()
+
+    def wait_idle(self, store: "FAISS", timeout: float) -> bool:
+        """Wait until no search holds store; False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: id(store) not in self._counts, timeout)
+
+
+def _copy_vector_store(store: "FAISS") -> "FAISS":
+    """Independent copy of a LangChain FAISS store (index, docstore and ID map)"""
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+
+    docstore = InMemoryDocstore({
+        doc_id: store.docstore.search(doc_id) for doc_id in store.index_to_docstore_id.values()
+    })
+    return wrap_index(
+        store.embedding_function,
+        faiss.clone_index(store.index),
+        docstore,
+        dict(store.index_to_docstore_id),
+    )
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    """Vector scaled to unit length (zero vectors are returned unchanged)"""
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
 # ==================== ADK Tool for Knowledge Base Search ====================
 
-# Global knowledge base instance (uses MySQL by default)
-_knowledge_base = KnowledgeBase(use_mysql=True)
+# Optional shared retrieval sidecar (see kb_sidecar.py); unset keeps the index in-process
+SIDECAR_SOCKET = os.getenv("KB_SIDECAR_SOCKET")
 
+if SIDECAR_SOCKET:
+    from kb_sidecar import SidecarClient, SidecarIndexWorker, SidecarKnowledgeBase, SidecarSync
+    _sidecar = SidecarClient(SIDECAR_SOCKET)
+    _knowledge_base = SidecarKnowledgeBase(_sidecar)
+    _index_worker = SidecarIndexWorker(_sidecar)
+    _kb_sync = SidecarSync(_sidecar)
+else:
+    # Global knowledge base instance (uses MySQL by default)
+    _knowledge_base = KnowledgeBase(use_mysql=True)
+    # Applies admin edits to the index in the background
+    _index_worker = IndexWorker(_knowledge_base)
+    # Picks up edits made through other API workers (started on app startup)
+    _kb_sync = KnowledgeBaseSync(_knowledge_base, _index_worker)
 
-def search_knowledge_base(query: str, top_k: int = 3, language: Optional[str] = None) -> Dict:
+
+def search_knowledge_base(
+    query: str, top_k: int = 3, language: Optional[str] = None, min_score: Optional[float] = None
+) -> Dict:
     """
     Search the knowledge base for relevant posts
 
@@ -372,12 +1341,39 @@ def search_knowledge_base(query: str, top_k: int = 3, language: Optional[str] =
         query: Search query
         top_k: Number of results to return
         language: Optional language filter (e.g. "zh-CN", "en")
+        min_score: Minimum cosine similarity (-1 to 1) a result must reach;
+            defaults to KB_MIN_SCORE
 
     Returns:
         Dictionary with search results
     """
-    results = _knowledge_base.search_posts(query, top_k, language=language)
-    
+    results = _knowledge_base.search_posts(query, top_k, language=language, min_score=min_score)
+    return _format_search_results(query, results)
+
+
+async def asearch_knowledge_base(
+    query: str, top_k: int = 3, language: Optional[str] = None, min_score: Optional[float] = None
+) -> Dict:
+    """
+    Async variant of search_knowledge_base for API endpoints
+
+    Does not block the event loop; returns the same dictionary shape.
+    """
+    results = await _knowledge_base.asearch_posts(query, top_k, language=language, min_score=min_score)
+    return _format_search_results(query, results)
+
+
+@wraps(search_knowledge_base)
+async def _search_knowledge_base_tool(
+    query: str, top_k: int = 3, language: Optional[str] = None, min_score: Optional[float] = None
+) -> Dict:
+    # The agent runs on the event loop, where a sync tool would block every
+    # other request; the model still sees search_knowledge_base's name and docs
+    return await asearch_knowledge_base(query, top_k, language=language, min_score=min_score)
+
+
+def _format_search_results(query: str, results: List[SearchResult]) -> Dict:
+    """Build the tool/API response dictionary for search results"""
     if not results:
         return {
             "status": "not_found",
@@ -390,6 +1386,8 @@ def search_knowledge_base(query: str, top_k: int = 3, language: Optional[str] =
         "status": "found",
         "query": query,
         "results_count": len(results),
+        # Keyword-only results: the embedding provider was unavailable
+        "degraded": any(r.degraded for r in results),
         "results": [
             {
                 "post_id": r.post_id,
@@ -492,7 +1490,9 @@ def create_knowledge_base_agent() -> Agent:
         Good: "Sorry, I don't have any articles about quantum physics in the knowledge base
                at the moment. You could ask the administrator to add some relevant content!"
         """,
-        tools=[search_knowledge_base]
+        tools=[_search_knowledge_base_tool],
+        # Long conversations reach the model as recent turns plus a summary
+        before_model_callback=trim_history,
     )
 
 
@@ -531,6 +1531,6 @@ def initialize_sample_posts():
 
 
 # Initialize with sample data if knowledge base is empty
-if len(_knowledge_base.posts) == 0:
+if not SIDECAR_SOCKET and len(_knowledge_base.posts) == 0:
     initialize_sample_posts()
 
@@ -0,0 +1,161 @@
+"""
+In-memory BM25 keyword index over the knowledge base posts
+
+Vector search is weak on exact terms (error codes, product names, Chinese
+proper nouns), so posts are also indexed by keyword. English and other
+space-separated text is split into words; Chinese, Japanese and Korean runs
+into overlapping character bigrams, which matches CJK words without a
+segmentation dictionary. The index is updated one post at a time and needs
+no embedding calls, so keyword search keeps working when the embedding
+provider is down.
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import heapq
+import math
+import os
+import re
+import threading
+
+BM25_K1 = float(os.getenv("KB_BM25_K1", "1.2"))
+BM25_B = float(os.getenv("KB_BM25_B", "0.75"))
+# Reciprocal rank fusion constant; larger values flatten the rank weights
+RRF_K = int(os.getenv("KB_RRF_K", "60"))
+
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_]+|[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]+")
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+
+_STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "to", "of", "in", "on",
+    "for", "and", "or", "how", "what", "why", "do", "does", "i", "you", "it",
+    "with", "can", "my", "me", "about",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words and CJK character bigrams (a lone CJK character stays a unigram)"""
+    tokens = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        elif run not in _STOPWORDS:
+            tokens.append(run)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: Optional[int] = None) -> List[Tuple[float, str]]:
+    """
+    Fuse ranked ID lists by reciprocal rank: score = sum of 1 / (k + rank)
+
+    Scores are divided by the best possible score (first in every list), so
+    they fall in (0, 1]. Returns (score, id) pairs, best first.
+    """
+    k = RRF_K if k is None else k
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    best = len(rankings) / (k + 1) if rankings else 1.0
+    return sorted(((score / best, item) for item, score in scores.items()), reverse=True)
+
+
+class LexicalIndex:
+    """BM25 inverted index of posts, updated incrementally"""
+
+    def __init__(self, k1: Optional[float] = None, b: Optional[float] = None):
+        self.k1 = BM25_K1 if k1 is None else k1
+        self.b = BM25_B if b is None else b
+        # term -> post_id -> term frequency
+        self._postings: Dict[str, Dict[str, int]] = {}
+        # post_id -> term frequencies, to remove a post's postings
+        self._terms: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._languages: Dict[str, str] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def upsert(self, post_id: str, text: str, language: Optional[str] = None):
+        """Index (or re-index) one post"""
+        tokens = tokenize(text)
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        with self._lock:
+            self._remove(post_id)
+            for term, count in counts.items():
+                self._postings.setdefault(term, {})[post_id] = count
+            self._terms[post_id] = counts
+            self._lengths[post_id] = len(tokens)
+            self._languages[post_id] = language
+            self._total_length += len(tokens)
+
+    def remove(self, post_id: str):
+        with self._lock:
+            self._remove(post_id)
+
+    def _remove(self, post_id: str):
+        counts = self._terms.pop(post_id, None)
+        if counts is None:
+            return
+        for term in counts:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(post_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(post_id, 0)
+        self._languages.pop(post_id, None)
+
+    def rebuild(self, documents: Iterable[Tuple[str, str, Optional[str]]]):
+        """Replace the whole index with (post_id, text, language) documents"""
+        with self._lock:
+            self._postings = {}
+            self._terms = {}
+            self._lengths = {}
+            self._languages = {}
+            self._total_length = 0
+            for post_id, text, language in documents:
+                self.upsert(post_id, text, language)
+
+    def search(self, query: str, top_k: int, language: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Posts matching query terms, ranked by BM25
+
+        Returns:
+            Up to top_k (post_id, score) pairs, best first; only posts that
+            contain at least one query term
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._lengths)
+            if not terms or not count:
+                return []
+            average = self._total_length / count or 1.0
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1.0 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for post_id, tf in postings.items():
+                    if language and self._languages.get(post_id) != language:
+                        continue
+                    norm = self.k1 * (1.0 - self.b + self.b * self._lengths[post_id] / average)
+                    scores[post_id] = scores.get(post_id, 0.0) + idf * tf * (self.k1 + 1.0) / (tf + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "posts": len(self._lengths),
+                "terms": len(self._postings),
+                "k1": self.k1,
+                "b": self.b,
+                "rrf_k": RRF_K,
+            }
@@ -1,12 +1,18 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import Optional, List
-from google.adk import Runner
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import AsyncGenerator, AsyncIterator, Optional, List
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import os
+import uuid
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.runners import types as runner_types
-from google.adk.sessions.in_memory_session_service import InMemorySessionService
-from adk_agents import get_agent, list_agents
+from adk_agents import get_agent, get_runner, list_agents
+from chat_history import compact_session
+from session_store import BoundedSessionService
 from admin_api import router as admin_router
 from web_api import router as web_router
 from database import init_db, sync_api_keys_to_env
@@ -59,6 +65,8 @@ class ChatRequest(BaseModel):
     post_id: Optional[str] = None
     stream: Optional[bool] = False
     language: Optional[str] = None
+    # Conversation to continue; omit to start a new one (its ID is returned)
+    session_id: Optional[str] = Field(default=None, max_length=128, pattern=r"^[A-Za-z0-9_.:-]+$")
 
 
 class ChatReference(BaseModel):
@@ -73,6 +81,7 @@ class ChatResponse(BaseModel):
     response: str
     references: List[ChatReference] = []
     status: str
+    session_id: str
 
 
 # ==================== API Endpoints API 端点 ====================
@@ -102,6 +111,21 @@ async def startup_event():
     except Exception as e:
         print(f"Warning: Database initialization failed: {e}")
 
+    # Keep this worker's index in step with edits handled by other workers
+    from knowledge_base_agent import _kb_sync
+    _kb_sync.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Persist in-memory chat sessions so conversations survive a restart"""
+    try:
+        count = await _session_service.flush()
+        if count:
+            print(f"Persisted {count} chat sessions")
+    except Exception as e:
+        print(f"Warning: Failed to persist chat sessions: {e}")
+
 
 @app.get("/health")
 async def health_check():
@@ -126,7 +150,17 @@ async def get_available_agents():
     return R.ok({"agents": agent_info, "total": len(agents)})
 
 
-_session_service = InMemorySessionService()
+# Idle TTL + LRU / memory caps; evicted sessions optionally kept in SQL
+_session_service = BoundedSessionService()
+
+CHAT_APP_NAME = "agents"
+CHAT_USER_ID = "api_user"
+
+# In-flight agent runs per worker; runs are async, so this is not tied to a thread pool.
+# Requests beyond it wait up to CHAT_QUEUE_TIMEOUT seconds for a slot, then get 503
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "256"))
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "30"))
+_chat_slots = asyncio.Semaphore(CHAT_MAX_CONCURRENCY)
 
 
 @app.post("/api/chat")
@@ -138,130 +172,84 @@ async def chat_with_agent(request: ChatRequest):
         request: Chat request with agent name and message / 包含代理名称和消息的聊天请求
     
     Returns:
-        Agent response / 代理响应
+        Agent response / 代理响应; with stream=true, a text/event-stream of
+        delta, tool, references and done (or error) events
     """
-    agent = get_agent(request.agent_name)
-    
-    if not agent:
+    # Shared runner per (agent, model), rebuilt with the agents / 每个（代理，模型）共享一个运行器，随代理重建
+    runner = get_runner(request.agent_name, CHAT_APP_NAME, _session_service)
+
+    if not runner:
         raise HTTPException(
             status_code=404,
             detail=f"Agent '{request.agent_name}' not found. Available agents: {', '.join(list_agents())}"
         )
     
     try:
-        # Get agent / 获取代理
-        agent = get_agent(request.agent_name)
-        if not agent:
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to get agent"
-            )
-        
-        # Create a fresh runner for each request to ensure session service is properly linked / 为每个请求创建新的运行器以确保会话服务正确链接
-        # This avoids potential threading issues with shared runners / 这避免了共享运行器的潜在线程问题
-        runner = Runner(
-            app_name="agents",
-            agent=agent,
-            session_service=_session_service
-        )
-        
-        # Build message with optional article context
-        message_text = request.message
-        if request.post_id:
-            from database import SessionLocal, Post as DBPost
-            db = SessionLocal()
-            try:
-                post = db.query(DBPost).filter(DBPost.id == request.post_id, DBPost.is_active == True).first()
-                if post:
-                    message_text = (
-                        f"Based on this article:\n"
-                        f"Title: {post.title}\n"
-                        f"Content: {post.content}\n\n"
-                        f"User question: {request.message}"
-                    )
-            finally:
-                db.close()
-
-        # Append language instruction if specified
-        if request.language:
-            lang_names = {"zh-CN": "Chinese (Simplified)", "en": "English"}
-            lang_name = lang_names.get(request.language, request.language)
-            message_text += f"\n\n[IMPORTANT: You MUST respond in {lang_name}.]"
-
         # Create Content object from message
-        content = runner_types.Content(parts=[{"text": message_text}], role="user")
+        content = runner_types.Content(parts=[{"text": _build_message_text(request)}], role="user")
         
         # Run the agent / 运行代理
-        # Use a fixed session ID per agent for simplicity / 为简单起见，每个代理使用固定的会话 ID
-        # In production, you might want to use user-specific sessions / 在生产环境中，您可能希望使用用户特定的会话
-        session_id = f"api_{request.agent_name}"
-        user_id = "api_user"
+        # One session per client conversation / 每个客户端会话使用独立的会话 ID
+        session_id = request.session_id or f"{request.agent_name}_{uuid.uuid4().hex}"
+        user_id = CHAT_USER_ID
         
-        # Always create session first to ensure it exists / 始终先创建会话以确保它存在
-        # Directly create session (will not fail if already exists) / 直接创建会话（如果已存在则不会失败）
+        # Continue the session (restored from storage if it was evicted), or start it
+        # 继续已有会话（若已被淘汰则从存储恢复），否则新建
         try:
-            _session_service.create_session_sync(
+            await _session_service.get_or_create_session(
                 user_id=user_id,
                 session_id=session_id,
-                app_name="agents"
+                app_name=CHAT_APP_NAME
             )
-        except Exception as create_error:
-            # If creation fails, try to get existing session / 如果创建失败，尝试获取现有会话
-            try:
-                _session_service.get_session_sync(
+        except Exception as session_error:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to create or get session: {str(session_error)}"
+            )
+        
+        if request.stream:
+            return StreamingResponse(
+                _stream_chat(request, session_id, runner.run_async(
                     user_id=user_id,
                     session_id=session_id,
-                    app_name="agents"
-                )
-            except Exception:
-                # If both fail, raise error / 如果两者都失败，抛出错误
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Failed to create or get session: {str(create_error)}"
-                )
-        
-        # Run the agent / 运行代理
-        # Use asyncio.to_thread to run sync runner.run() in a separate thread / 使用 asyncio.to_thread 在单独线程中运行同步 runner.run()
-        # This ensures the session service is accessible in the thread / 这确保会话服务在线程中可访问
-        import asyncio
-        
-        def run_agent_sync():
-            """Run agent synchronously in thread / 在线程中同步运行代理"""
+                    new_message=content,
+                    # Partial text events as the model generates / 模型生成时逐段输出
+                    run_config=RunConfig(streaming_mode=StreamingMode.SSE),
+                )),
+                media_type="text/event-stream",
+                # Keep proxies from buffering the stream
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        # Run the agent on the event loop; no thread is held while waiting on the LLM
+        # 在事件循环中异步运行代理；等待 LLM 时不占用线程
+        async with _chat_slot():
             try:
-                # Double-check session exists in thread / 在线程中再次检查会话是否存在
-                _session_service.get_session_sync(
+                events = [event async for event in runner.run_async(
                     user_id=user_id,
                     session_id=session_id,
-                    app_name="agents"
+                    new_message=content
+                )]
+                result = _extract_response_from_events(events)
+                await _compact_chat_session(session_id)
+            except Exception as run_error:
+                import traceback
+                error_details = traceback.format_exc()
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Error running agent: {str(run_error)}\nDetails: {error_details[:500]}"
                 )
-            except Exception as e:
-                raise RuntimeError(f"Session not accessible in thread: {e}")
-            
-            return list(runner.run(
-                user_id=user_id,
-                session_id=session_id,
-                new_message=content
-            ))
-        
-        try:
-            # Run in thread to avoid blocking / 在线程中运行以避免阻塞
-            events = await asyncio.to_thread(run_agent_sync)
-            result = _extract_response_from_events(events)
-        except Exception as run_error:
-            import traceback
-            error_details = traceback.format_exc()
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error running agent: {str(run_error)}\nDetails: {error_details[:500]}"
-            )
 
         return R.ok(ChatResponse(
             agent_name=request.agent_name,
             message=request.message,
             response=result["text"],
             references=[ChatReference(**ref) for ref in result["references"]],
-            status="success"
+            status="success",
+            session_id=session_id
         ).model_dump())
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -269,6 +257,163 @@ async def chat_with_agent(request: ChatRequest):
         )
 
 
+def _build_message_text(request: ChatRequest) -> str:
+    """User message with optional article context and language instruction"""
+    # Build message with optional article context
+    message_text = request.message
+    if request.post_id:
+        from database import SessionLocal, Post as DBPost
+        db = SessionLocal()
+        try:
+            post = db.query(DBPost).filter(DBPost.id == request.post_id, DBPost.is_active == True).first()
+            if post:
+                message_text = (
+                    f"Based on this article:\n"
+                    f"Title: {post.title}\n"
+                    f"Content: {post.content}\n\n"
+                    f"User question: {request.message}"
+                )
+        finally:
+            db.close()
+
+    # Append language instruction if specified
+    if request.language:
+        lang_names = {"zh-CN": "Chinese (Simplified)", "en": "English"}
+        lang_name = lang_names.get(request.language, request.language)
+        message_text += f"\n\n[IMPORTANT: You MUST respond in {lang_name}.]"
+
+    return message_text
+
+
+def _sse(event: str, data: dict) -> str:
+    """One server-sent event frame"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@asynccontextmanager
+async def _chat_slot():
+    """
+    Hold one of CHAT_MAX_CONCURRENCY in-flight chat slots
+
+    Raises:
+        HTTPException: 503 if no slot frees up within CHAT_QUEUE_TIMEOUT seconds
+    """
+    try:
+        await asyncio.wait_for(_chat_slots.acquire(), CHAT_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Too many concurrent chats, please retry shortly")
+    try:
+        yield
+    finally:
+        _chat_slots.release()
+
+
+async def _compact_chat_session(session_id: str):
+    """Keep a long conversation within the session's history budget"""
+    try:
+        await compact_session(_session_service, CHAT_APP_NAME, CHAT_USER_ID, session_id)
+    except Exception as e:
+        print(f"Warning: Failed to compact chat session {session_id}: {e}")
+
+
+async def _stream_chat(request: ChatRequest, session_id: str, events: AsyncGenerator) -> AsyncIterator[str]:
+    """
+    Translate agent events into SSE frames
+
+    Events:
+        delta: {"text"} partial model text, in order
+        tool: {"name", "status"} a tool call started or finished
+        references: {"references"} all referenced posts so far, sent as soon
+            as a search_knowledge_base response arrives
+        done: the same body as the non-streaming response
+        error: {"code", "message"} the run failed, or no chat slot was free
+            (code 503); no done event follows
+    """
+    final_events = []
+    references = []
+    seen = set()
+    streamed_text = False
+    try:
+        async with _chat_slot():
+            async for event in events:
+                parts = event.content.parts if (event.content and event.content.parts) else []
+                if getattr(event, 'partial', False):
+                    for part in parts:
+                        if part.text and not getattr(part, 'thought', False):
+                            streamed_text = True
+                            yield _sse("delta", {"text": part.text})
+                    continue
+
+                final_events.append(event)
+                for part in parts:
+                    if part.function_call:
+                        yield _sse("tool", {"name": part.function_call.name, "status": "started"})
+                    elif part.function_response:
+                        yield _sse("tool", {"name": part.function_response.name, "status": "finished"})
+                        count = len(references)
+                        for ref in _references_from_part(part):
+                            if ref["post_id"] not in seen:
+                                seen.add(ref["post_id"])
+                                references.append(ref)
+                        if len(references) > count:
+                            yield _sse("references", {"references": references})
+                    elif part.text and not streamed_text and not getattr(part, 'thought', False):
+                        # Models that do not stream send the whole text in one event
+                        yield _sse("delta", {"text": part.text})
+                # The complete event repeats the partial text that came before it
+                streamed_text = False
+
+            result = _extract_response_from_events(final_events)
+            yield _sse("done", ChatResponse(
+                agent_name=request.agent_name,
+                message=request.message,
+                response=result["text"],
+                references=[ChatReference(**ref) for ref in result["references"]],
+                status="success",
+                session_id=session_id
+            ).model_dump())
+            await _compact_chat_session(session_id)
+    except HTTPException as e:
+        yield _sse("error", {"code": e.status_code, "message": e.detail})
+    except Exception as e:
+        yield _sse("error", {"code": 500, "message": f"Error running agent: {str(e)}"})
+    finally:
+        # Ends the agent run (and its LLM call) if the client disconnects mid-stream
+        await events.aclose()
+
+
+def _references_from_part(part) -> List[dict]:
+    """Referenced posts in a search_knowledge_base function response part"""
+    references = []
+    fr = getattr(part, 'function_response', None)
+    if not fr or getattr(fr, 'name', '') != 'search_knowledge_base':
+        return references
+    try:
+        resp = fr.response if hasattr(fr, 'response') else {}
+        # ADK returns protobuf Struct, not plain dict; convert it
+        if not isinstance(resp, dict):
+            try:
+                resp = dict(resp)
+            except (TypeError, ValueError):
+                resp = {}
+        results = resp.get('results', [])
+        for r in results:
+            # Convert protobuf MapComposite to dict if needed
+            if not isinstance(r, dict):
+                try:
+                    r = dict(r)
+                except (TypeError, ValueError):
+                    continue
+            if r.get('post_id') and r.get('title'):
+                references.append({
+                    "post_id": str(r["post_id"]),
+                    "title": str(r["title"]),
+                })
+    except Exception:
+        pass
+    return references
+
+
 def _extract_response_from_events(events: List, debug: bool = False) -> dict:
     """
     Extract text response and references from agent events.
@@ -287,32 +432,7 @@ def _extract_response_from_events(events: List, debug: bool = False) -> dict:
         if not (hasattr(event, 'content') and event.content and hasattr(event.content, 'parts')):
             continue
         for part in event.content.parts:
-            if hasattr(part, 'function_response') and part.function_response:
-                fr = part.function_response
-                if getattr(fr, 'name', '') == 'search_knowledge_base':
-                    try:
-                        resp = fr.response if hasattr(fr, 'response') else {}
-                        # ADK returns protobuf Struct, not plain dict; convert it
-                        if not isinstance(resp, dict):
-                            try:
-                                resp = dict(resp)
-                            except (TypeError, ValueError):
-                                resp = {}
-                        results = resp.get('results', [])
-                        for r in results:
-                            # Convert protobuf MapComposite to dict if needed
-                            if not isinstance(r, dict):
-                                try:
-                                    r = dict(r)
-                                except (TypeError, ValueError):
-                                    continue
-                            if r.get('post_id') and r.get('title'):
-                                references.append({
-                                    "post_id": str(r["post_id"]),
-                                    "title": str(r["title"]),
-                                })
-                    except Exception:
-                        pass
+            references.extend(_references_from_part(part))
 
     # Pass 2: extract final text response
     for event in events:
@@ -142,6 +142,8 @@ class SearchRequest(BaseModel):
     query: str = Field(..., min_length=1)
     top_k: int = Field(default=3, ge=1, le=20)
     language: Optional[str] = None
+    # Minimum cosine similarity of a result; None uses KB_MIN_SCORE
+    min_score: Optional[float] = Field(default=None, ge=-1, le=1)
 
 
 class SearchResult(BaseModel):
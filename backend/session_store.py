@@ -0,0 +1,380 @@
+"""
+Bounded chat session store
+
+Wraps ADK's InMemorySessionService so memory stays bounded under real
+traffic:
+
+- idle TTL: sessions untouched for CHAT_SESSION_TTL seconds are evicted
+- LRU cap: at most CHAT_SESSION_MAX sessions, and approximately
+  CHAT_SESSION_MAX_MB of session data, are kept in memory; the least
+  recently used go first
+- persistence (CHAT_SESSION_PERSIST=true): evicted sessions are written to
+  the chat_sessions table and lazily restored the next time the client
+  sends their session_id, so returning users keep their conversation;
+  rows idle for CHAT_SESSION_PERSIST_DAYS are pruned
+
+Eviction runs on session access, so an idle server keeps its sessions
+until the next request. Memory is accounted from the JSON size of each
+session's state and events, which tracks the real footprint closely enough
+for a cap.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import json
+import os
+import threading
+import time
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+
+CHAT_SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", "1800"))
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "1000"))
+CHAT_SESSION_MAX_MB = float(os.getenv("CHAT_SESSION_MAX_MB", "256"))
+CHAT_SESSION_PERSIST = os.getenv("CHAT_SESSION_PERSIST", "false").lower() in ("1", "true", "yes")
+CHAT_SESSION_PERSIST_DAYS = float(os.getenv("CHAT_SESSION_PERSIST_DAYS", "30"))
+
+_PRUNE_INTERVAL = 3600.0
+
+SessionKey = Tuple[str, str, str]
+
+
+@dataclass
+class _Entry:
+    last_access: float
+    size: int
+
+
+def _json_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _event_size(event: Event) -> int:
+    return len(event.model_dump_json(exclude_none=True))
+
+
+class BoundedSessionService(BaseSessionService):
+    """In-memory sessions with idle TTL, LRU and memory caps, and an optional SQL tier"""
+
+    def __init__(self, ttl: Optional[float] = None, max_sessions: Optional[int] = None,
+                 max_bytes: Optional[int] = None, persist: Optional[bool] = None):
+        self.ttl = CHAT_SESSION_TTL if ttl is None else ttl
+        self.max_sessions = max(1, CHAT_SESSION_MAX if max_sessions is None else max_sessions)
+        self.max_bytes = int(CHAT_SESSION_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self.persist = CHAT_SESSION_PERSIST if persist is None else persist
+        self._memory = InMemorySessionService()
+        # Least recently used first
+        self._entries: "OrderedDict[SessionKey, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._evicted = {"ttl": 0, "lru": 0, "memory": 0}
+        self._restored = 0
+        self._persisted = 0
+        self._persist_errors = 0
+        self._last_prune = 0.0
+        # session key -> [lock, holders], serializing get-or-create per session
+        self._creating: Dict[SessionKey, list] = {}
+        # Guards the LRU bookkeeping; stats() may be read from other threads
+        self._lock = threading.Lock()
+
+    # ==================== Session API ====================
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session = await self._memory.create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id
+        )
+        self._track((app_name, user_id, session.id), _json_size(state or {}))
+        await self._evict()
+        return session
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        key = (app_name, user_id, session_id)
+        session = await self._memory.get_session(
+            app_name=app_name, user_id=user_id, session_id=session_id, config=config
+        )
+        if session is None and self.persist:
+            stored = await asyncio.to_thread(self._load, key)
+            if stored is not None:
+                await self._admit(stored)
+                with self._lock:
+                    self._restored += 1
+                session = await self._memory.get_session(
+                    app_name=app_name, user_id=user_id, session_id=session_id, config=config
+                )
+        if session is not None:
+            self._touch(key)
+        await self._evict()
+        return session
+
+    async def get_or_create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        state: Optional[Dict[str, Any]] = None,
+    ) -> Session:
+        """
+        Get a session (restoring it from storage if evicted), or create it
+
+        Idempotent: concurrent calls for one session_id create it once.
+        create_session alone would replace an existing session.
+        """
+        key = (app_name, user_id, session_id)
+        slot = self._creating.setdefault(key, [asyncio.Lock(), 0])
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                session = await self.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+                if session is None:
+                    session = await self.create_session(
+                        app_name=app_name, user_id=user_id, state=state, session_id=session_id
+                    )
+                return session
+        finally:
+            slot[1] -= 1
+            if not slot[1]:
+                self._creating.pop(key, None)
+
+    async def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+        """Sessions in memory plus, with persistence, stored ones (without events)"""
+        response = await self._memory.list_sessions(app_name=app_name, user_id=user_id)
+        if self.persist:
+            listed = {session.id for session in response.sessions}
+            for session_id in await asyncio.to_thread(self._stored_ids, app_name, user_id):
+                if session_id not in listed:
+                    response.sessions.append(Session(id=session_id, app_name=app_name, user_id=user_id))
+        return response
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        await self._memory.delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        self._untrack((app_name, user_id, session_id))
+        if self.persist:
+            await asyncio.to_thread(self._delete_stored, (app_name, user_id, session_id))
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        key = (session.app_name, session.user_id, session.id)
+        with self._lock:
+            present = key in self._entries
+        if not present:
+            # Evicted while a run was in flight: re-admit it as the run sees it
+            await self._admit(session.model_copy(deep=True))
+        event = await self._memory.append_event(session, event)
+        self._touch(key, _event_size(event))
+        return event
+
+    async def flush(self) -> int:
+        """Persist every session still in memory (e.g. on shutdown); returns the count"""
+        if not self.persist:
+            return 0
+        with self._lock:
+            keys = list(self._entries)
+        count = 0
+        for app_name, user_id, session_id in keys:
+            session = await self._memory.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+            if session is not None and await asyncio.to_thread(self._store, session):
+                count += 1
+        return count
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "memory_mb": round(self._bytes / (1024 * 1024), 2),
+                "max_sessions": self.max_sessions,
+                "max_memory_mb": round(self.max_bytes / (1024 * 1024), 2),
+                "ttl_seconds": self.ttl,
+                "evicted": dict(self._evicted),
+                "persist": self.persist,
+                "persisted": self._persisted,
+                "restored": self._restored,
+                "persist_errors": self._persist_errors,
+            }
+
+    # ==================== Accounting and eviction ====================
+
+    def _track(self, key: SessionKey, size: int):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = _Entry(time.monotonic(), size)
+            self._bytes += size
+
+    def _touch(self, key: SessionKey, added: int = 0):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.last_access = time.monotonic()
+            entry.size += added
+            self._bytes += added
+            self._entries.move_to_end(key)
+
+    def _untrack(self, key: SessionKey):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    async def _admit(self, session: Session):
+        """Put a whole session (restored or re-admitted) back into memory"""
+        events = session.events
+        restored = await self._memory.create_session(
+            app_name=session.app_name, user_id=session.user_id, state=dict(session.state), session_id=session.id
+        )
+        size = _json_size(session.state)
+        for event in events:
+            await self._memory.append_event(restored, event)
+            size += _event_size(event)
+        self._track((session.app_name, session.user_id, session.id), size)
+
+    def _pick_victims(self):
+        """Expired sessions, then least recently used ones over the count or memory cap"""
+        victims = []
+        with self._lock:
+            now = time.monotonic()
+            while self._entries:
+                key, entry = next(iter(self._entries.items()))
+                if self.ttl > 0 and now - entry.last_access > self.ttl:
+                    reason = "ttl"
+                elif len(self._entries) > self.max_sessions:
+                    reason = "lru"
+                elif self._bytes > self.max_bytes and len(self._entries) > 1:
+                    # The most recent session always stays, however large
+                    reason = "memory"
+                else:
+                    break
+                self._entries.popitem(last=False)
+                self._bytes -= entry.size
+                self._evicted[reason] += 1
+                victims.append(key)
+        return victims
+
+    async def _evict(self):
+        for app_name, user_id, session_id in self._pick_victims():
+            if self.persist:
+                session = await self._memory.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+                if session is not None:
+                    await asyncio.to_thread(self._store, session)
+            await self._memory.delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        if self.persist and time.monotonic() - self._last_prune > _PRUNE_INTERVAL:
+            self._last_prune = time.monotonic()
+            await asyncio.to_thread(self._prune)
+
+    # ==================== SQL tier ====================
+
+    def _store(self, session: Session) -> bool:
+        from database import SessionLocal, ChatSession
+        db = SessionLocal()
+        try:
+            db.merge(ChatSession(
+                app_name=session.app_name,
+                user_id=session.user_id,
+                session_id=session.id,
+                data=session.model_dump_json(exclude_none=True),
+                updated_at=datetime.utcnow(),
+            ))
+            db.commit()
+            with self._lock:
+                self._persisted += 1
+            return True
+        except Exception as e:
+            db.rollback()
+            with self._lock:
+                self._persist_errors += 1
+            print(f"Warning: Failed to persist chat session {session.id}: {e}")
+            return False
+        finally:
+            db.close()
+
+    def _load(self, key: SessionKey) -> Optional[Session]:
+        from database import SessionLocal, ChatSession
+        app_name, user_id, session_id = key
+        db = SessionLocal()
+        try:
+            row = db.query(ChatSession).filter(
+                ChatSession.app_name == app_name,
+                ChatSession.user_id == user_id,
+                ChatSession.session_id == session_id,
+            ).first()
+            return Session.model_validate_json(row.data) if row else None
+        except Exception as e:
+            with self._lock:
+                self._persist_errors += 1
+            print(f"Warning: Failed to restore chat session {session_id}: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _stored_ids(self, app_name: str, user_id: str):
+        from database import SessionLocal, ChatSession
+        db = SessionLocal()
+        try:
+            rows = db.query(ChatSession.session_id).filter(
+                ChatSession.app_name == app_name, ChatSession.user_id == user_id
+            ).all()
+            return [row.session_id for row in rows]
+        except Exception as e:
+            print(f"Warning: Failed to list stored chat sessions: {e}")
+            return []
+        finally:
+            db.close()
+
+    def _delete_stored(self, key: SessionKey):
+        from database import SessionLocal, ChatSession
+        app_name, user_id, session_id = key
+        db = SessionLocal()
+        try:
+            db.query(ChatSession).filter(
+                ChatSession.app_name == app_name,
+                ChatSession.user_id == user_id,
+                ChatSession.session_id == session_id,
+            ).delete()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Warning: Failed to delete stored chat session {session_id}: {e}")
+        finally:
+            db.close()
+
+    def _prune(self):
+        """Drop stored sessions idle for longer than CHAT_SESSION_PERSIST_DAYS"""
+        if CHAT_SESSION_PERSIST_DAYS <= 0:
+            return
+        from database import SessionLocal, ChatSession
+        cutoff = datetime.utcnow() - timedelta(days=CHAT_SESSION_PERSIST_DAYS)
+        db = SessionLocal()
+        try:
+            removed = db.query(ChatSession).filter(ChatSession.updated_at < cutoff).delete()
+            db.commit()
+            if removed:
+                print(f"Pruned {removed} stored chat sessions idle for over {CHAT_SESSION_PERSIST_DAYS:g} days")
+        except Exception as e:
+            db.rollback()
+            print(f"Warning: Failed to prune stored chat sessions: {e}")
+        finally:
+            db.close()
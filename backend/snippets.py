@@ -0,0 +1,131 @@
+"""
+Query-focused snippet extraction
+
+Picks the window of a post that best overlaps the query, using a cheap
+lexical score (English words, Chinese/Japanese/Korean character bigrams).
+No embedding calls are made, so snippet extraction does not add latency to
+search.
+"""
+
+from typing import List, Optional, Set, Tuple
+import re
+
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+|[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]+")
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+# Break snippets at sentence or line ends where possible
+_BOUNDARY_RE = re.compile(r"[。！？!?.;；\n]")
+
+_STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "to", "of", "in", "on",
+    "for", "and", "or", "how", "what", "why", "do", "does", "i", "you", "it",
+    "with", "can", "my", "me", "about",
+}
+
+
+def query_terms(text: str) -> Set[str]:
+    """Lowercased English words and CJK unigrams/bigrams of the text"""
+    terms = set()
+    for token in _WORD_RE.findall(text.lower()):
+        if _CJK_RE.match(token):
+            terms.update(token)
+            terms.update(token[i:i + 2] for i in range(len(token) - 1))
+        elif token not in _STOPWORDS:
+            terms.add(token)
+    return terms
+
+
+def _term_positions(content: str, terms: Set[str]) -> List[Tuple[int, float]]:
+    """Offsets of query-term occurrences in content, with a weight per hit"""
+    lowered = content.lower()
+    hits = []
+    for term in terms:
+        # Longer terms (words, bigrams) are stronger evidence than single characters
+        weight = 1.0 if len(term) == 1 and _CJK_RE.match(term) else 2.0
+        if _CJK_RE.match(term):
+            pattern = re.escape(term)
+        else:
+            pattern = r"(?<![a-z0-9_])" + re.escape(term) + r"(?![a-z0-9_])"
+        for m in re.finditer(pattern, lowered):
+            hits.append((m.start(), weight))
+    hits.sort()
+    return hits
+
+
+def _best_window(hits: List[Tuple[int, float]], window: int) -> Optional[int]:
+    """Start offset of the window of given width with the highest hit weight"""
+    best_start, best_score = None, 0.0
+    score = 0.0
+    j = 0
+    for start, weight in hits:
+        score += weight
+        while hits[j][0] < start - window + 1:
+            score -= hits[j][1]
+            j += 1
+        if score > best_score:
+            best_score, best_start = score, hits[j][0]
+    return best_start
+
+
+def _snap_start(content: str, start: int, lower_bound: int, lookback: int = 60) -> int:
+    """Move start back to the beginning of its sentence (or word) if one is close"""
+    floor = max(lower_bound, start - lookback)
+    snapped = None
+    for m in _BOUNDARY_RE.finditer(content, floor, start):
+        snapped = m.end()
+    if snapped is None:
+        # No sentence end nearby: at least avoid cutting an English word in half
+        space = content.rfind(" ", floor, start)
+        snapped = space + 1 if space >= 0 else start
+    return snapped
+
+
+def extract_snippet(
+    content: str,
+    query: str,
+    max_length: int = 200,
+    span: Optional[Tuple[int, int]] = None,
+) -> str:
+    """
+    Extract the most query-relevant snippet of content
+
+    Args:
+        content: Full post content
+        query: Search query
+        max_length: Maximum snippet length in characters
+        span: Optional (start, end) of the matched chunk; the window is
+            searched there first and the chunk start is used as a fallback
+
+    Returns:
+        Snippet text, with "..." marking truncation at either end
+    """
+    if not content:
+        return content
+    if len(content) <= max_length:
+        return content
+
+    region_start, region_end = span if span and span[1] > span[0] else (0, len(content))
+    region = content[region_start:region_end]
+    terms = query_terms(query)
+
+    start = None
+    if terms:
+        hits = _term_positions(region, terms)
+        best = _best_window(hits, max_length) if hits else None
+        if best is not None:
+            start = region_start + best
+    if start is None:
+        # No lexical overlap: fall back to the start of the matched chunk
+        start = region_start
+
+    # Centre a little context before the first hit, then snap to a sentence start
+    start = max(region_start, start - max_length // 5)
+    start = _snap_start(content, start, region_start)
+    start = min(start, max(0, len(content) - max_length))
+    end = min(len(content), start + max_length)
+
+    snippet = content[start:end].strip()
+    if start > 0:
+        snippet = "..." + snippet
+    if end < len(content):
+        snippet += "..."
+    return snippet
@@ -55,3 +55,14 @@ CREATE TABLE IF NOT EXISTS `system_config` (
   PRIMARY KEY (`id`),
   UNIQUE KEY `uk_config_key` (`config_key`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ==================== chat_sessions ====================
+CREATE TABLE IF NOT EXISTS `chat_sessions` (
+  `app_name`   VARCHAR(100) NOT NULL,
+  `user_id`    VARCHAR(128) NOT NULL,
+  `session_id` VARCHAR(128) NOT NULL,
+  `data`       MEDIUMTEXT   NOT NULL COMMENT 'Session JSON (state + events)',
+  `updated_at` DATETIME     DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`app_name`, `user_id`, `session_id`),
+  KEY `idx_updated_at` (`updated_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,30 @@
+"""
+Tests for the shared agent runners
+共享代理运行器测试
+"""
+
+from google.adk.sessions.in_memory_session_service import InMemorySessionService
+
+import adk_agents
+
+
+def test_runner_is_reused_across_requests():
+    service = InMemorySessionService()
+
+    first = adk_agents.get_runner("knowledge", "agents", service)
+
+    assert first is not None
+    assert adk_agents.get_runner("Knowledge", "agents", service) is first
+    assert adk_agents.get_runner("missing", "agents", service) is None
+
+
+def test_rebuilding_agents_replaces_their_runners():
+    service = InMemorySessionService()
+    old_runner = adk_agents.get_runner("knowledge", "agents", service)
+    old_agent = adk_agents.get_agent("knowledge")
+
+    adk_agents.rebuild_agents()
+
+    runner = adk_agents.get_runner("knowledge", "agents", service)
+    assert runner is not old_runner
+    assert runner.agent is adk_agents.get_agent("knowledge") is not old_agent
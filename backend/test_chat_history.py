@@ -0,0 +1,72 @@
+"""
+Tests for bounded chat history
+有界聊天历史测试
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from google.adk.events import Event
+from google.adk.models import LlmRequest
+from google.adk.sessions.in_memory_session_service import InMemorySessionService
+from google.genai import types
+
+import chat_history
+from chat_history import SUMMARY_STATE_KEY, compact_session, merge_summary, summarize_contents, trim_history
+
+
+def _turn(n, answer_words=5):
+    question = types.Content(role="user", parts=[types.Part(text=f"Question {n}?")])
+    answer = types.Content(role="model", parts=[types.Part(text=f"Answer {n}. " + "word " * answer_words)])
+    return [question, answer]
+
+
+def test_summary_has_one_line_per_question_and_answer():
+    call = types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(name="search", args={}))])
+    contents = _turn(1)[:1] + [call] + _turn(1)[1:] + _turn(2)
+
+    assert summarize_contents(contents) == [
+        "User: Question 1?", "Assistant: Answer 1. word word word word word",
+        "User: Question 2?", "Assistant: Answer 2. word word word word word",
+    ]
+
+
+def test_summary_drops_its_oldest_lines_past_the_limit():
+    merged = merge_summary("User: old\nAssistant: old answer", ["User: new", "Assistant: new answer"], limit=40)
+    assert merged == "User: new\nAssistant: new answer"
+
+
+def test_trim_history_keeps_recent_turns_within_the_budget(monkeypatch):
+    monkeypatch.setattr(chat_history, "CHAT_MAX_TOKENS", 200)
+    contents = [content for n in range(10) for content in _turn(n, answer_words=40)]
+    request = LlmRequest(contents=list(contents))
+    context = SimpleNamespace(state={SUMMARY_STATE_KEY: "User: Question from an earlier session?"})
+
+    trim_history(context, request)
+
+    kept = request.contents
+    assert kept[-2:] == contents[-2:] and len(kept) < len(contents)
+    assert kept[0].role == "user"
+    instruction = request.config.system_instruction
+    assert "Question from an earlier session?" in instruction and "User: Question 0?" in instruction
+    assert "Question 9?" not in instruction
+
+
+def test_compaction_keeps_the_newest_turns_and_summarizes_the_rest():
+    service = InMemorySessionService()
+
+    async def main():
+        session = await service.create_session(app_name="agents", user_id="u", session_id="s")
+        for n in range(10):
+            for content in _turn(n):
+                await service.append_event(session, Event(author=content.role, content=content))
+
+        counts = await compact_session(service, "agents", "u", "s", max_events=8)
+        return counts, await service.get_session(app_name="agents", user_id="u", session_id="s")
+
+    (before, after), session = asyncio.run(main())
+
+    assert (before, after) == (20, 4)
+    assert [e.content.parts[0].text for e in session.events][::2] == ["Question 8?", "Question 9?"]
+    assert session.state[SUMMARY_STATE_KEY].startswith("User: Question 0?")
+    assert "Question 7?" in session.state[SUMMARY_STATE_KEY]
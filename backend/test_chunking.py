@@ -0,0 +1,68 @@
+"""
+Tests for token-aware chunking
+分块测试
+"""
+
+from chunking import count_tokens, split_text
+
+
+def _assert_overlapping(text, chunks, overlap_tokens):
+    for prev, nxt in zip(chunks, chunks[1:]):
+        shared = text[nxt.start:prev.end]
+        assert nxt.start < prev.end, "neighbouring chunks share no text"
+        assert prev.text.endswith(shared) and nxt.text.startswith(shared)
+        assert count_tokens(shared) <= overlap_tokens
+
+
+def test_chunks_cover_text_with_offsets():
+    text = "\n\n".join(f"Paragraph {n}. " + "Some words here. " * 40 for n in range(6))
+    chunks = split_text(text, max_tokens=120, overlap_tokens=20)
+
+    assert len(chunks) > 1
+    assert [chunk.index for chunk in chunks] == list(range(len(chunks)))
+    assert chunks[0].start == 0 and chunks[-1].end == len(text.rstrip())
+    for chunk in chunks:
+        assert chunk.text == text[chunk.start:chunk.end]
+        assert count_tokens(chunk.text) <= 120
+
+
+def test_paragraph_chunks_overlap():
+    # Each paragraph is too big to share with its neighbour, so the overlap
+    # has to come from inside the paragraph
+    text = "\n\n".join(" ".join(f"w{p}_{i}" for i in range(30)) + "." for p in range(8))
+    chunks = split_text(text, max_tokens=60, overlap_tokens=10)
+
+    assert len(chunks) > 2
+    _assert_overlapping(text, chunks, 10)
+
+
+def test_cjk_windows_overlap():
+    # No spaces or sentence ends: split into character windows
+    text = "知识库检索增强生成系统的分块测试" * 60
+    chunks = split_text(text, max_tokens=50, overlap_tokens=8)
+
+    assert len(chunks) > 2
+    _assert_overlapping(text, chunks, 8)
+
+
+def test_no_overlap_across_sections():
+    text = "# One\n\n" + "alpha beta gamma. " * 30 + "\n\n# Two\n\n" + "delta epsilon zeta. " * 30
+    chunks = split_text(text, max_tokens=40, overlap_tokens=10)
+
+    second = text.index("# Two")
+    starts = [chunk.start for chunk in chunks]
+    assert second in starts
+    assert all(chunk.end <= second for chunk in chunks if chunk.start < second)
+
+
+def test_zero_overlap():
+    text = "\n\n".join("word " * 80 for _ in range(4))
+    chunks = split_text(text, max_tokens=50, overlap_tokens=0)
+
+    assert all(prev.end <= nxt.start for prev, nxt in zip(chunks, chunks[1:]))
+
+
+def test_short_and_empty_text():
+    assert split_text("") == []
+    chunks = split_text("Just one line.", max_tokens=50, overlap_tokens=10)
+    assert len(chunks) == 1 and chunks[0].text == "Just one line."
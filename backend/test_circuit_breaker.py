@@ -0,0 +1,92 @@
+"""
+Tests for the embedding provider circuit breaker
+熔断器测试
+"""
+
+import pytest
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError, GuardedEmbeddings
+from embedders import HashedNgramEmbeddings
+
+
+class FlakyEmbeddings(HashedNgramEmbeddings):
+    """Local embeddings that fail while `down` is set"""
+
+    def __init__(self):
+        super().__init__(dim=16)
+        self.down = False
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("provider down")
+        return super().embed_documents(texts)
+
+
+def test_opens_after_threshold_then_half_open_trial_closes():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure(ConnectionError("down"))
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.reset_timeout = 0
+    assert breaker.state == "half_open"
+    breaker.before_call()
+    # Only one trial call at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+
+    assert breaker.state == "closed"
+    assert breaker.stats()["trips"] == 1 and breaker.stats()["rejected"] == 2
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    breaker.before_call()
+    breaker.record_failure(ConnectionError("down"))
+    assert breaker.state == "half_open"
+
+    breaker.before_call()
+    breaker.reset_timeout = 60
+    breaker.record_failure(ConnectionError("still down"))
+    assert breaker.state == "open"
+    assert breaker.last_error == "still down"
+
+
+def test_released_trial_admits_the_next_call():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure(ConnectionError("down"))
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+    breaker.record_failure(ConnectionError("down"))
+    breaker.record_success()
+    breaker.record_failure(ConnectionError("down"))
+    assert breaker.state == "closed"
+
+
+def test_guarded_embeddings_fail_fast_while_open():
+    provider = FlakyEmbeddings()
+    embeddings = GuardedEmbeddings(provider, CircuitBreaker("test", failure_threshold=1, reset_timeout=60))
+    assert embeddings.model == provider.model
+
+    provider.down = True
+    with pytest.raises(ConnectionError):
+        embeddings.embed_documents(["a"])
+    with pytest.raises(CircuitOpenError):
+        embeddings.embed_documents(["a"])
+    assert provider.calls == 1
+
+    provider.down = False
+    embeddings.breaker.reset_timeout = 0
+    assert len(embeddings.embed_documents(["a"])[0]) == 16
+    assert embeddings.breaker.state == "closed"
@@ -0,0 +1,45 @@
+"""
+Tests for the embedding backends
+嵌入后端测试
+"""
+
+import numpy as np
+import pytest
+
+from embedders import HashedNgramEmbeddings, create_embeddings
+
+
+def test_local_vectors_are_deterministic_and_normalized():
+    embeddings = HashedNgramEmbeddings(dim=64)
+    first = embeddings.embed_query("Break shot power")
+
+    assert first == HashedNgramEmbeddings(dim=64).embed_documents(["Break shot power"])[0]
+    assert len(first) == 64
+    assert np.linalg.norm(first) == pytest.approx(1.0)
+
+
+def test_similar_texts_are_closer():
+    embeddings = HashedNgramEmbeddings()
+    query, near, far = embeddings.embed_documents(["break shot power", "power of the break shot", "安全球 防守"])
+
+    assert np.dot(query, near) > np.dot(query, far)
+
+
+def test_create_embeddings_selects_the_backend():
+    assert isinstance(create_embeddings(backend="local"), HashedNgramEmbeddings)
+    with pytest.raises(ValueError):
+        create_embeddings(backend="openai")
+    with pytest.raises(ValueError):
+        create_embeddings(backend="word2vec")
+
+
+def test_kb_runs_offline_with_local_embeddings(kb):
+    from knowledge_base_agent import Post
+
+    kb.apply_changes([
+        Post(id="p1", title="Break", content="Break shot power and cue speed"),
+        Post(id="p2", title="Safety", content="Safety play and defensive position"),
+    ], [])
+
+    results = kb.search_posts("break shot", top_k=1, min_score=-1)
+    assert [r.post_id for r in results] == ["p1"] and not results[0].degraded
@@ -0,0 +1,65 @@
+"""
+Tests for query embedding micro-batching
+查询嵌入批处理测试
+"""
+
+import asyncio
+
+from embedding_batcher import QueryEmbeddingBatcher
+
+
+class RecordingEmbeddings:
+    """Deterministic embeddings that record every batch sent to the provider"""
+
+    def __init__(self):
+        self.batches = []
+
+    def embed_query(self, text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97)]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [self.embed_query(t) for t in texts]
+
+
+def test_concurrent_queries_are_embedded_in_one_batch():
+    provider = RecordingEmbeddings()
+    batcher = QueryEmbeddingBatcher(provider, window_ms=20, max_batch=32)
+    queries = ["break shot", "cue ball", "break shot", "英式台球"]
+
+    async def main():
+        return await asyncio.gather(*(batcher.embed(q) for q in queries))
+
+    vectors = asyncio.run(main())
+
+    assert vectors == [provider.embed_query(q) for q in queries]
+    # Identical queries in the same window share one input
+    assert provider.batches == [["break shot", "cue ball", "英式台球"]]
+    assert batcher.stats()["batches"] == 1 and batcher.stats()["queries"] == 4
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    provider = RecordingEmbeddings()
+    batcher = QueryEmbeddingBatcher(provider, window_ms=10000, max_batch=2)
+
+    async def main():
+        return await asyncio.wait_for(asyncio.gather(batcher.embed("a"), batcher.embed("b")), 5)
+
+    assert len(asyncio.run(main())) == 2
+    assert provider.batches == [["a", "b"]]
+
+
+def test_batch_error_reaches_every_waiter():
+    class Failing(RecordingEmbeddings):
+        async def aembed_documents(self, texts):
+            raise ConnectionError("provider down")
+
+    batcher = QueryEmbeddingBatcher(Failing(), window_ms=5, max_batch=32)
+
+    async def main():
+        return await asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True)
+
+    assert all(isinstance(r, ConnectionError) for r in asyncio.run(main()))
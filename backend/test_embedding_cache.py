@@ -0,0 +1,103 @@
+"""
+Tests for the embedding caches
+嵌入缓存测试
+"""
+
+from embedding_cache import CachedEmbeddings, EmbeddingCache, QueryEmbeddingCache, normalize_query
+
+
+class CountingEmbeddings:
+    """Deterministic embeddings that record every text sent to the provider"""
+
+    model = "counting"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), float(sum(map(ord, t)) % 97), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_vectors_survive_a_restart(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    provider = CountingEmbeddings()
+    first = CachedEmbeddings(provider, EmbeddingCache(path)).embed_documents(["alpha", "beta"])
+
+    # A new process opens the same file
+    provider = CountingEmbeddings()
+    cached = CachedEmbeddings(provider, EmbeddingCache(path))
+    second = cached.embed_documents(["beta", "alpha", "gamma"])
+
+    assert provider.calls == [["gamma"]]
+    assert second[:2] == [first[1], first[0]]
+    assert (cached.hits, cached.misses) == (2, 1)
+
+
+def test_duplicate_texts_are_embedded_once(tmp_path):
+    provider = CountingEmbeddings()
+    cached = CachedEmbeddings(provider, EmbeddingCache(str(tmp_path / "embeddings.sqlite3")))
+
+    vectors = cached.embed_documents(["same", "other", "same"])
+
+    assert provider.calls == [["same", "other"]]
+    assert vectors[0] == vectors[2]
+
+
+def test_models_do_not_share_vectors(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    CachedEmbeddings(CountingEmbeddings(), cache, model_name="model-a").embed_documents(["alpha"])
+
+    provider = CountingEmbeddings()
+    CachedEmbeddings(provider, cache, model_name="model-b").embed_documents(["alpha"])
+
+    assert provider.calls == [["alpha"]]
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_query_cache_entries_expire(monkeypatch):
+    import embedding_cache
+
+    clock = _Clock()
+    monkeypatch.setattr(embedding_cache, "time", clock)
+    cache = QueryEmbeddingCache(max_size=10, ttl=60)
+    cache.put("break shot", [1.0])
+
+    clock.now += 59
+    assert cache.get("break shot") == [1.0]
+    clock.now += 2
+    assert cache.get("break shot") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_query_cache_evicts_least_recently_used():
+    cache = QueryEmbeddingCache(max_size=2, ttl=60)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    cache.get("a")
+    cache.put("c", [3.0])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == [1.0] and cache.get("c") == [3.0]
+    assert cache.stats()["hits"] == 3
+
+
+def test_query_cache_can_be_disabled():
+    cache = QueryEmbeddingCache(max_size=0, ttl=60)
+    cache.put("a", [1.0])
+    assert cache.get("a") is None
+
+
+def test_queries_are_normalized():
+    assert normalize_query("  Break\tSHOT\n ") == "break shot"
+    assert normalize_query("ＡＢＣ　开球") == "abc 开球"
@@ -0,0 +1,79 @@
+"""
+Tests for the bulk embedding pipeline
+批量嵌入流水线测试
+"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from embedders import HashedNgramEmbeddings
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from embedding_pipeline import EmbeddingPipeline
+
+
+class CountingEmbeddings(HashedNgramEmbeddings):
+    """Local embeddings that record each batch and can fail the first few calls"""
+
+    def __init__(self, failures=0):
+        super().__init__(dim=32)
+        self.failures = failures
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("rate limited")
+            self.batches.append(list(texts))
+        return super().embed_documents(texts)
+
+
+def test_batches_dedupe_and_keep_input_order():
+    provider = CountingEmbeddings()
+    pipeline = EmbeddingPipeline(provider, batch_size=3, concurrency=2, max_retries=0)
+    texts = [f"text {i}" for i in range(8)] + ["text 0", "text 5"]
+    progress = []
+
+    vectors = pipeline.embed(texts, progress=lambda done, total: progress.append((done, total)))
+
+    assert vectors == HashedNgramEmbeddings(dim=32).embed_documents(texts)
+    assert sorted(len(batch) for batch in provider.batches) == [2, 3, 3]
+    assert sum(provider.batches, []).count("text 0") == 1
+    assert pipeline.stats()["batches"] == 3
+    assert progress[0] == (0, 8) and progress[-1] == (8, 8)
+
+
+def test_failed_batch_is_retried():
+    provider = CountingEmbeddings(failures=2)
+    pipeline = EmbeddingPipeline(provider, batch_size=10, concurrency=1, max_retries=2, backoff=0)
+
+    assert len(pipeline.embed(["a", "b"])) == 2
+    assert pipeline.retries == 2
+
+
+def test_gives_up_after_max_retries():
+    provider = CountingEmbeddings(failures=5)
+    pipeline = EmbeddingPipeline(provider, batch_size=10, concurrency=1, max_retries=1, backoff=0)
+
+    with pytest.raises(ConnectionError):
+        pipeline.embed(["a", "b"])
+    assert pipeline.stats()["error"] == "rate limited"
+
+
+def test_resumes_from_the_embedding_cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    provider = CountingEmbeddings()
+    texts = [f"text {i}" for i in range(6)]
+    EmbeddingPipeline(CachedEmbeddings(provider, cache), batch_size=2, max_retries=0).embed(texts[:4])
+
+    provider.batches.clear()
+    pipeline = EmbeddingPipeline(CachedEmbeddings(provider, cache), batch_size=2, max_retries=0)
+    vectors = pipeline.embed(texts)
+
+    assert pipeline.resumed == 4
+    assert provider.batches == [["text 4", "text 5"]]
+    # Cached vectors round-trip through float32
+    np.testing.assert_allclose(vectors, HashedNgramEmbeddings(dim=32).embed_documents(texts), atol=1e-6)
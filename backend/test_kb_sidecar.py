@@ -0,0 +1,139 @@
+"""
+Tests for the retrieval sidecar wire protocol
+检索 sidecar 协议测试
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from index_worker import IndexWorker
+from kb_sidecar import (
+    SidecarClient, SidecarIndexWorker, SidecarKnowledgeBase, SidecarServer, SidecarSync,
+    _pack_str, _unpack_str, decode_post, decode_results, decode_search,
+    encode_post, encode_results, encode_search,
+)
+from kb_sync import KnowledgeBaseSync
+from knowledge_base_agent import Post, SearchResult
+
+
+def test_search_request_round_trip():
+    assert decode_search(encode_search("台球 break", 5, "zh-CN", 0.25)) == ("台球 break", 5, "zh-CN", 0.25)
+    # No language and no min_score travel as empty / NaN and come back as None
+    assert decode_search(encode_search("q", 3, None)) == ("q", 3, None, None)
+
+
+def test_results_round_trip():
+    results = [
+        SearchResult(post_id="p1", title="开球", relevance_score=0.5, matched_content="…", reason="vector"),
+        SearchResult(post_id="p2", title="Chalk", relevance_score=0.125, matched_content="", reason="", degraded=True),
+    ]
+    assert decode_results(encode_results(results)) == results
+    assert decode_results(encode_results([])) == []
+
+
+def test_post_round_trip():
+    post = Post(id="p1", title="Break", content="内容 content", tags=["pool", "技巧"], language="en",
+                created_at="2024-01-01T00:00:00")
+    assert decode_post(encode_post(post)) == post
+    bare = Post(id="p2", title="t", content="c")
+    assert decode_post(encode_post(bare)) == bare
+
+
+def test_strings_are_length_prefixed():
+    buf = _pack_str("ab") + _pack_str(None) + _pack_str("台")
+    first, offset = _unpack_str(buf, 0)
+    second, offset = _unpack_str(buf, offset)
+    third, offset = _unpack_str(buf, offset)
+    assert (first, second, third) == ("ab", "", "台") and offset == len(buf)
+
+
+@pytest.fixture
+def sidecar(kb, tmp_path):
+    """A sidecar serving kb on a Unix socket, from a background event loop"""
+    worker = IndexWorker(kb)
+    path = str(tmp_path / "kb.sock")
+    server = SidecarServer(kb, worker, KnowledgeBaseSync(kb, worker, interval=0), path)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    serving = asyncio.run_coroutine_threadsafe(server.serve(), loop)
+    deadline = time.monotonic() + 5
+    while not os.path.exists(path):
+        assert time.monotonic() < deadline, "sidecar did not start"
+        time.sleep(0.01)
+    yield SidecarClient(path, timeout=10), worker
+
+    async def shutdown():
+        # Ends the server and its open connection handlers
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    serving.cancel()
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def _wait(worker, job):
+    deadline = time.monotonic() + 10
+    while worker.get_job(job.id).status in ("queued", "running"):
+        assert time.monotonic() < deadline, "index job did not finish"
+        time.sleep(0.01)
+    return worker.get_job(job.id)
+
+
+def test_index_and_search_through_the_sidecar(sidecar):
+    client, _ = sidecar
+    remote_kb, remote_worker = SidecarKnowledgeBase(client), SidecarIndexWorker(client)
+    post = Post(id="p1", title="Break shot", content="How to break in eight-ball pool", language="en")
+
+    job = remote_worker.submit_upsert(post)
+    assert job.kind == "upsert" and job.post_id == "p1"
+    assert _wait(remote_worker, job).status == "done"
+    assert [j.id for j in remote_worker.list_jobs()] == [job.id]
+
+    results = remote_kb.search_posts("break eight-ball", top_k=1, language="en", min_score=-1)
+    assert [r.post_id for r in results] == ["p1"]
+    assert remote_kb.stats()["posts"] == 1
+    assert remote_worker.stats()["jobs"] == {"done": 1}
+    assert SidecarSync(client).stats()["enabled"] is False
+
+    assert _wait(remote_worker, remote_worker.submit_delete("p1")).status == "done"
+    assert remote_kb.search_posts("break eight-ball", top_k=1, min_score=-1) == []
+
+
+def test_async_calls_reuse_connections(sidecar):
+    client, worker = sidecar
+    _wait(worker, worker.submit_upsert(Post(id="p1", title="Chalk", content="Chalk the cue tip", language="en")))
+    remote_kb = SidecarKnowledgeBase(client)
+
+    async def search():
+        return await asyncio.gather(*(remote_kb.asearch_posts("chalk", top_k=1, min_score=-1) for _ in range(3)))
+
+    async def run():
+        first = await search()
+        idle = len(client._idle)
+        second = await search()
+        reused = len(client._idle)
+        for _, writer in client._idle:
+            writer.close()
+        return first + second, idle, reused
+
+    results, idle, reused = asyncio.run(run())
+    assert all([r.post_id for r in batch] == ["p1"] for batch in results)
+    assert idle == 3 and reused == 3
+
+
+def test_errors_are_returned_to_the_caller(sidecar):
+    client, _ = sidecar
+    with pytest.raises(RuntimeError, match="Unknown opcode"):
+        client.call(99)
+    # The connection stays usable after an error response
+    assert SidecarIndexWorker(client).get_job("missing") is None
@@ -0,0 +1,103 @@
+"""
+Tests for cross-worker knowledge base synchronization
+跨进程知识库同步测试
+"""
+
+from datetime import datetime
+
+import database
+from database import Post as DBPost, bump_kb_version, get_kb_version
+from index_worker import IndexWorker
+from kb_sync import KnowledgeBaseSync
+
+
+def _add(db, post_id, title, content, language="en"):
+    db.add(DBPost(
+        id=post_id, title=title, content=content, tags="", language=language,
+        is_active=True, updated_at=datetime.utcnow(),
+    ))
+    db.commit()
+    bump_kb_version()
+
+
+def _sync(sync, worker, polls=5):
+    """Poll until the sync has caught up with the database epoch; returns posts queued"""
+    queued = 0
+    for _ in range(polls):
+        queued += sync.poll_once()
+        worker._queue.join()
+        if sync._pending is None and sync.epoch == get_kb_version():
+            return queued
+    raise AssertionError(f"sync did not catch up: epoch {sync.epoch}, database {get_kb_version()}")
+
+
+def test_syncs_new_changed_and_removed_posts(db, kb):
+    worker = IndexWorker(kb)
+    sync = KnowledgeBaseSync(kb, worker, interval=0)
+    _add(db, "p1", "Break shot", "How to break in eight-ball pool")
+    _add(db, "p2", "Chalk", "Chalk the cue tip before every shot")
+
+    assert _sync(sync, worker) == 2
+    assert sorted(kb.posts) == ["p1", "p2"]
+    assert kb.search_posts("break eight-ball", top_k=1, min_score=-1)[0].post_id == "p1"
+
+    db.get(DBPost, "p2").content = "Chalk the cue tip, then check your stance"
+    db.get(DBPost, "p2").updated_at = datetime.utcnow()
+    db.delete(db.get(DBPost, "p1"))
+    db.commit()
+    bump_kb_version()
+
+    # Only the edited and the removed post are queued; p1 is hard-deleted
+    assert _sync(sync, worker) == 2
+    assert sorted(kb.posts) == ["p2"]
+    assert "stance" in kb.posts["p2"].content
+    assert {r.post_id for r in kb.search_posts("break eight-ball", top_k=3, min_score=-1)} == {"p2"}
+
+
+def test_unchanged_posts_are_not_requeued(db, kb):
+    worker = IndexWorker(kb)
+    sync = KnowledgeBaseSync(kb, worker, interval=0)
+    _add(db, "p1", "Break shot", "How to break in eight-ball pool")
+    _sync(sync, worker)
+    version = kb.version
+
+    # An epoch bump without content changes (rows re-read in the lookback window)
+    bump_kb_version()
+    assert _sync(sync, worker) == 0
+    assert kb.version == version
+    assert sync.stats()["syncs"] == 1
+
+
+def test_deactivated_post_is_removed(db, kb):
+    worker = IndexWorker(kb)
+    sync = KnowledgeBaseSync(kb, worker, interval=0)
+    _add(db, "p1", "Break shot", "How to break in eight-ball pool")
+    _sync(sync, worker)
+
+    db.get(DBPost, "p1").is_active = False
+    db.commit()
+    bump_kb_version()
+
+    assert _sync(sync, worker) == 1
+    assert kb.posts == {}
+    assert kb.stats()["vectors"] == 0
+
+
+def test_keyword_only_mode_still_syncs_posts(db, kb):
+    # No embeddings: nothing can be vectorized, but posts and keyword search must follow
+    kb.embeddings = None
+    kb._schedule_index_retry = lambda: None
+    worker = IndexWorker(kb)
+    sync = KnowledgeBaseSync(kb, worker, interval=0)
+    _add(db, "p1", "Break shot", "How to break in eight-ball pool")
+
+    _sync(sync, worker)
+    assert sorted(kb.posts) == ["p1"]
+    results = kb.search_posts("break", top_k=1)
+    assert results[0].post_id == "p1" and results[0].degraded
+
+    db.delete(db.get(DBPost, "p1"))
+    db.commit()
+    bump_kb_version()
+    _sync(sync, worker)
+    assert kb.posts == {}
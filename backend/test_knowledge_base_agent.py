@@ -0,0 +1,190 @@
+"""
+Tests for incremental index updates of the knowledge base
+知识库增量索引测试
+"""
+
+from embedders import HashedNgramEmbeddings
+from knowledge_base_agent import KnowledgeBase, Post
+import vector_index
+
+
+def _post(n, text=None, language="en"):
+    return Post(id=f"p{n}", title=f"Post {n}", content=text or f"Topic number {n}: practice drill {n}", language=language)
+
+
+def _ids(kb, query, top_k=3, language=None):
+    return [r.post_id for r in kb.search_posts(query, top_k=top_k, language=language, min_score=-1)]
+
+
+def test_edits_tombstone_old_vectors(kb):
+    kb.apply_changes([_post(n) for n in range(10)], [])
+    store = kb.vector_stores["en"]
+    vectors = store.index.ntotal
+
+    kb.apply_changes([_post(3, "Jump shots with an elevated cue")], [])
+
+    store = kb.vector_stores["en"]
+    assert vector_index.tombstone_count(store) == 1
+    assert store.index.ntotal == vectors + 1
+    assert kb.stats()["vectors"] == 10
+    assert _ids(kb, "jump shots elevated cue", top_k=1) == ["p3"]
+    assert "p3" not in _ids(kb, "Topic number 3 practice drill 3", top_k=1)
+
+
+def test_partition_is_compacted_past_the_tombstone_ratio(kb, monkeypatch):
+    monkeypatch.setattr(vector_index, "COMPACT_RATIO", 0.2)
+    kb.apply_changes([_post(n) for n in range(10)], [])
+
+    kb.apply_changes([], ["p0", "p1"])
+    assert vector_index.tombstone_count(kb.vector_stores["en"]) == 2
+
+    # A third tombstone passes 20% of the partition and triggers a rebuild
+    kb.apply_changes([], ["p2"])
+    store = kb.vector_stores["en"]
+    assert vector_index.tombstone_count(store) == 0 and store.index.ntotal == 7
+    assert set(_ids(kb, "practice drill", top_k=10)) == {f"p{n}" for n in range(3, 10)}
+
+
+def test_languages_are_searched_separately(kb):
+    kb.apply_changes([_post(1, "Break shot power"), _post(2, "开球 力量 技巧", language="zh-CN")], [])
+
+    assert set(kb.vector_stores) == {"en", "zh-CN"}
+    assert _ids(kb, "break", top_k=5, language="en") == ["p1"]
+    assert _ids(kb, "开球", top_k=5, language="zh-CN") == ["p2"]
+
+
+def test_saved_index_keeps_tombstones(kb):
+    kb.apply_changes([_post(n) for n in range(10)], [])
+    kb.save_posts()
+    kb.apply_changes([_post(4, "Bank shots off the cushion")], [])
+    kb.save_posts()
+    kb.save_index()
+
+    reloaded = KnowledgeBase(use_mysql=False, embeddings=HashedNgramEmbeddings())
+
+    assert reloaded.stats()["vectors"] == 10
+    assert vector_index.tombstone_count(reloaded.vector_stores["en"]) == 1
+    assert _ids(reloaded, "bank shots cushion", top_k=1) == ["p4"]
+
+
+def _quantized(monkeypatch, kind="flat"):
+    monkeypatch.setattr(vector_index, "INDEX_TYPE", kind)
+    monkeypatch.setattr(vector_index, "QUANTIZATION", "int8")
+    monkeypatch.setattr(vector_index, "QUANTIZE_MIN_VECTORS", 10)
+
+
+def test_deleting_every_post_of_a_quantized_partition(kb, monkeypatch):
+    _quantized(monkeypatch)
+    kb.apply_changes([_post(n) for n in range(50)], [])
+    assert vector_index.index_spec(kb.vector_stores["en"].index) == ("flat", "int8")
+
+    kb.apply_changes([], [f"p{n}" for n in range(50)])
+
+    assert kb.stats()["vectors"] == 0
+    assert kb.search_posts("practice drill 3", min_score=-1) == []
+
+
+def test_compacting_a_quantized_partition_keeps_its_type(kb, monkeypatch):
+    _quantized(monkeypatch)
+    kb.apply_changes([_post(n) for n in range(50)], [])
+
+    # Below KB_QUANTIZE_MIN afterwards: the trained quantizer is reused
+    kb.apply_changes([], [f"p{n}" for n in range(45)])
+
+    store = kb.vector_stores["en"]
+    assert vector_index.tombstone_count(store) == 0
+    assert vector_index.index_spec(store.index) == ("flat", "int8")
+    assert _ids(kb, "Topic number 47: practice drill 47", top_k=1) == ["p47"]
+
+
+def test_saved_quantized_index_reconciles_removed_posts(kb, monkeypatch):
+    _quantized(monkeypatch, kind="hnsw")
+    kb.apply_changes([_post(n) for n in range(50)], [])
+    kb.save_posts()
+    kb.save_index()
+    kb.posts = {}
+    kb.save_posts()
+
+    reloaded = KnowledgeBase(use_mysql=False, embeddings=HashedNgramEmbeddings())
+
+    assert reloaded._post_hashes == {}
+    assert reloaded.stats()["vectors"] == 0
+    assert reloaded.search_posts("practice drill 3", min_score=-1) == []
+
+
+def _cosine(kb, query, text):
+    a, b = kb.embeddings.embed_query(query), kb.embeddings.embed_query(text)
+    return sum(x * y for x, y in zip(a, b))
+
+
+def test_quantized_scores_are_re_ranked_with_exact_vectors(kb, monkeypatch):
+    _quantized(monkeypatch)
+    kb.apply_changes([_post(n) for n in range(50)], [])
+
+    result = kb.search_posts("practice drill 7", top_k=1, min_score=-1)[0]
+
+    exact = _cosine(kb, "practice drill 7", f"Post 7. Topic number 7: practice drill 7")
+    assert result.post_id == "p7"
+    assert abs(result.relevance_score - exact) < 1e-5
+
+
+def test_min_score_drops_weak_matches(kb):
+    kb.apply_changes([_post(1, "Break shot power"), _post(2, "Safety play and defensive position")], [])
+    strong = _cosine(kb, "break shot power", "Post 1. Break shot power")
+    weak = _cosine(kb, "break shot power", "Post 2. Safety play and defensive position")
+    assert weak < strong
+
+    cutoff = (weak + strong) / 2
+    assert [r.post_id for r in kb.search_posts("break shot power", top_k=5, min_score=cutoff)] == ["p1"]
+    assert set(_ids(kb, "break shot power", top_k=5)) == {"p1", "p2"}
+
+
+def test_hybrid_keyword_matches_do_not_bypass_min_score(kb, monkeypatch):
+    import knowledge_base_agent
+
+    monkeypatch.setattr(knowledge_base_agent, "SEARCH_MODE", "hybrid")
+    kb.apply_changes([
+        _post(1, "Break shot power and cue speed"),
+        _post(2, "Drills for the break with the bridge hand kept still over a long session"),
+    ], [])
+    query = "break shot power"
+    cutoff = _cosine(kb, query, f"Post 1. Break shot power and cue speed") - 1e-6
+    assert _cosine(kb, query, f"Post 2. {kb.posts['p2'].content}") < cutoff
+
+    # p2 matches "break" by keyword but not the cosine cutoff
+    results = kb.search_posts(query, top_k=5, min_score=cutoff)
+    assert [r.post_id for r in results] == ["p1"]
+
+
+def test_hybrid_scores_stay_cosine_similarities(kb, monkeypatch):
+    import knowledge_base_agent
+
+    monkeypatch.setattr(knowledge_base_agent, "SEARCH_MODE", "hybrid")
+    kb.apply_changes([_post(n) for n in range(5)], [])
+
+    for result in kb.search_posts("practice drill 2", top_k=3, min_score=-1):
+        text = f"Post {result.post_id[1:]}. {kb.posts[result.post_id].content}"
+        assert abs(result.relevance_score - _cosine(kb, "practice drill 2", text)) < 1e-5
+
+    # Posts found only by keywords are scored the same way
+    vector = kb.embeddings.embed_query("practice drill 2")
+    expected = _cosine(kb, "practice drill 2", f"Post 4. {kb.posts['p4'].content}")
+    assert abs(kb._post_similarity(vector, "p4") - expected) < 1e-5
+
+
+def test_open_breaker_degrades_to_keyword_search(kb):
+    kb.apply_changes([_post(1, "Break shot power"), _post(2, "Safety play")], [])
+    breaker = kb.embedding_breaker
+    breaker.reset_timeout = 60
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure(RuntimeError("provider down"))
+
+    results = kb.search_posts("safety play", top_k=5, min_score=0.99)
+
+    assert [r.post_id for r in results] == ["p2"]
+    assert results[0].degraded
+    assert breaker.state == "open"
+
+    # Once the provider recovers, searches use the vectors again
+    breaker.record_success()
+    assert not kb.search_posts("safety play", top_k=5, min_score=-1)[0].degraded
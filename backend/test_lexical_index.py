@@ -0,0 +1,60 @@
+"""
+Tests for the BM25 keyword index and reciprocal rank fusion
+关键词索引与 RRF 融合测试
+"""
+
+import pytest
+
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+def test_rrf_first_in_every_list_scores_one():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["a", "c", "b"]], k=60)
+
+    assert fused[0] == (pytest.approx(1.0), "a")
+    assert {item for _, item in fused[1:]} == {"b", "c"}
+    assert all(0 < score <= 1.0 for score, _ in fused)
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    # "b" is second in both lists, "a" and "c" are first in one and missing from the other
+    fused = reciprocal_rank_fusion([["a", "b"], ["c", "b"]], k=60)
+
+    assert fused[0][1] == "b"
+    assert {item for _, item in fused} == {"a", "b", "c"}
+
+
+def test_rrf_empty():
+    assert reciprocal_rank_fusion([]) == []
+    assert reciprocal_rank_fusion([[], []]) == []
+
+
+def test_tokenize_words_and_cjk_bigrams():
+    assert tokenize("The Pool Cue") == ["pool", "cue"]
+    assert tokenize("台球杆") == ["台球", "球杆"]
+    assert tokenize("杆") == ["杆"]
+
+
+def test_bm25_ranks_and_filters_by_language():
+    index = LexicalIndex()
+    index.upsert("p1", "break shot technique for pool", "en")
+    index.upsert("p2", "pool table maintenance", "en")
+    index.upsert("p3", "break shot 开球技巧", "zh-CN")
+
+    # Both match every term; the shorter post ranks first
+    assert [post_id for post_id, _ in index.search("break shot", top_k=5)] == ["p1", "p3"]
+    assert [post_id for post_id, _ in index.search("break", top_k=5, language="en")] == ["p1"]
+    assert index.search("snooker", top_k=5) == []
+
+
+def test_bm25_upsert_replaces_and_remove_forgets():
+    index = LexicalIndex()
+    index.upsert("p1", "old words", "en")
+    index.upsert("p1", "new words", "en")
+
+    assert index.search("old", top_k=5) == []
+    assert [post_id for post_id, _ in index.search("new", top_k=5)] == ["p1"]
+
+    index.remove("p1")
+    assert len(index) == 0
+    assert index.search("new", top_k=5) == []
@@ -0,0 +1,124 @@
+"""
+Tests for translating agent events into server-sent events
+流式聊天 SSE 转换测试
+"""
+
+import asyncio
+import json
+
+from google.adk.events import Event
+from google.genai import types
+
+import main
+from main import ChatRequest, _stream_chat
+
+
+def _event(*parts, partial=False, role="model"):
+    return Event(
+        author="agent" if role == "model" else "user",
+        invocation_id="run",
+        partial=partial,
+        content=types.Content(role=role, parts=list(parts)),
+    )
+
+
+def _call():
+    return _event(types.Part(function_call=types.FunctionCall(name="search_knowledge_base", args={"query": "break"})))
+
+
+def _response(*post_ids):
+    results = [{"post_id": post_id, "title": f"Post {post_id}", "relevance_score": 0.5} for post_id in post_ids]
+    return _event(
+        types.Part(function_response=types.FunctionResponse(
+            name="search_knowledge_base", response={"results": results}
+        )),
+        role="user",
+    )
+
+
+def _run(events):
+    """Feed events through _stream_chat; returns (event name, data) pairs and whether the run was closed"""
+    closed = []
+
+    async def agent():
+        try:
+            for event in events:
+                if isinstance(event, Exception):
+                    raise event
+                yield event
+        finally:
+            closed.append(True)
+
+    async def collect():
+        request = ChatRequest(agent_name="knowledge_agent", message="How do I break?")
+        return [frame async for frame in _stream_chat(request, "session-1", agent())]
+
+    frames = []
+    for frame in asyncio.run(collect()):
+        assert frame.endswith("\n\n")
+        name, data = frame.strip().split("\n")
+        frames.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return frames, bool(closed)
+
+
+def test_streamed_run():
+    frames, closed = _run([
+        _call(),
+        _response("p1", "p2"),
+        _call(),
+        _response("p2", "p3"),
+        _event(types.Part(text="Hel"), partial=True),
+        _event(types.Part(text="lo"), partial=True),
+        # The complete event repeats the streamed text and is not sent again
+        _event(types.Part(text="Hello")),
+    ])
+
+    assert [name for name, _ in frames] == [
+        "tool", "tool", "references", "tool", "tool", "references", "delta", "delta", "done",
+    ]
+    assert frames[0][1] == {"name": "search_knowledge_base", "status": "started"}
+    assert frames[1][1] == {"name": "search_knowledge_base", "status": "finished"}
+    # References accumulate without duplicates
+    assert [ref["post_id"] for ref in frames[5][1]["references"]] == ["p1", "p2", "p3"]
+    assert "".join(data["text"] for name, data in frames if name == "delta") == "Hello"
+
+    done = frames[-1][1]
+    assert done["response"] == "Hello" and done["session_id"] == "session-1" and done["status"] == "success"
+    assert [ref["post_id"] for ref in done["references"]] == ["p1", "p2", "p3"]
+    assert closed
+
+
+def test_unstreamed_text_is_sent_as_one_delta():
+    frames, _ = _run([_event(types.Part(text="Whole answer"))])
+
+    assert frames[0] == ("delta", {"text": "Whole answer"})
+    assert frames[1][0] == "done" and frames[1][1]["response"] == "Whole answer"
+
+
+def test_thoughts_are_not_streamed():
+    frames, _ = _run([
+        _event(types.Part(text="thinking", thought=True), partial=True),
+        _event(types.Part(text="Answer"), partial=True),
+        _event(types.Part(text="Answer")),
+    ])
+
+    assert [data["text"] for name, data in frames if name == "delta"] == ["Answer"]
+
+
+def test_failed_run_ends_with_an_error_event():
+    frames, closed = _run([_event(types.Part(text="Par"), partial=True), RuntimeError("model unavailable")])
+
+    assert frames[0] == ("delta", {"text": "Par"})
+    assert frames[-1] == ("error", {"code": 500, "message": "Error running agent: model unavailable"})
+    assert "done" not in [name for name, _ in frames]
+    assert closed
+
+
+def test_no_free_chat_slot_is_a_503(monkeypatch):
+    monkeypatch.setattr(main, "_chat_slots", asyncio.Semaphore(0))
+    monkeypatch.setattr(main, "CHAT_QUEUE_TIMEOUT", 0.01)
+
+    frames, _ = _run([_event(types.Part(text="never sent"))])
+
+    assert [name for name, _ in frames] == ["error"]
+    assert frames[0][1]["code"] == 503
@@ -0,0 +1,132 @@
+"""
+Tests for the bounded chat session store
+会话存储淘汰测试
+"""
+
+import asyncio
+
+from google.adk.events import Event
+from google.genai import types
+
+import session_store
+from session_store import BoundedSessionService
+
+APP = "app"
+USER = "user"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _event(text: str, partial: bool = False) -> Event:
+    return Event(
+        author="user",
+        invocation_id="run",
+        partial=partial,
+        content=types.Content(role="user", parts=[types.Part(text=text)]),
+    )
+
+
+def _ids(service):
+    async def ids():
+        return sorted(s.id for s in (await service.list_sessions(app_name=APP, user_id=USER)).sessions)
+    return asyncio.run(ids())
+
+
+def test_idle_sessions_expire(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(session_store.time, "monotonic", clock)
+    service = BoundedSessionService(ttl=60, max_sessions=10, max_bytes=10**9, persist=False)
+
+    async def run():
+        await service.create_session(app_name=APP, user_id=USER, session_id="old")
+        clock.now += 50
+        await service.create_session(app_name=APP, user_id=USER, session_id="new")
+        clock.now += 20
+        # "old" has been idle for 70s, "new" for 20s
+        assert await service.get_session(app_name=APP, user_id=USER, session_id="new") is not None
+        return await service.get_session(app_name=APP, user_id=USER, session_id="old")
+
+    assert asyncio.run(run()) is None
+    assert service.stats()["evicted"]["ttl"] == 1
+    assert _ids(service) == ["new"]
+
+
+def test_least_recently_used_session_goes_first():
+    service = BoundedSessionService(ttl=0, max_sessions=2, max_bytes=10**9, persist=False)
+
+    async def run():
+        for session_id in ("a", "b"):
+            await service.create_session(app_name=APP, user_id=USER, session_id=session_id)
+        # Touching "a" makes "b" the least recently used
+        await service.get_session(app_name=APP, user_id=USER, session_id="a")
+        await service.create_session(app_name=APP, user_id=USER, session_id="c")
+
+    asyncio.run(run())
+    assert _ids(service) == ["a", "c"]
+    assert service.stats()["evicted"]["lru"] == 1
+
+
+def test_memory_cap_keeps_the_newest_session():
+    service = BoundedSessionService(ttl=0, max_sessions=10, max_bytes=500, persist=False)
+
+    async def run():
+        first = await service.create_session(app_name=APP, user_id=USER, session_id="a")
+        await service.append_event(first, _event("x" * 400))
+        second = await service.create_session(app_name=APP, user_id=USER, session_id="b")
+        await service.append_event(second, _event("y" * 400))
+        await service.get_session(app_name=APP, user_id=USER, session_id="b")
+
+    asyncio.run(run())
+    assert _ids(service) == ["b"]
+    assert service.stats()["evicted"]["memory"] == 1
+
+
+def test_partial_events_are_not_stored():
+    service = BoundedSessionService(ttl=0, max_sessions=10, max_bytes=10**9, persist=False)
+
+    async def run():
+        session = await service.create_session(app_name=APP, user_id=USER, session_id="s")
+        await service.append_event(session, _event("Hel", partial=True))
+        await service.append_event(session, _event("Hello"))
+        return await service.get_session(app_name=APP, user_id=USER, session_id="s")
+
+    session = asyncio.run(run())
+    assert [event.content.parts[0].text for event in session.events] == ["Hello"]
+
+
+def test_get_or_create_is_idempotent():
+    service = BoundedSessionService(ttl=0, max_sessions=10, max_bytes=10**9, persist=False)
+
+    async def run():
+        sessions = await asyncio.gather(*(
+            service.get_or_create_session(app_name=APP, user_id=USER, session_id="s") for _ in range(5)
+        ))
+        await service.append_event(sessions[0], _event("kept"))
+        again = await service.get_or_create_session(app_name=APP, user_id=USER, session_id="s")
+        return sessions, again
+
+    sessions, again = asyncio.run(run())
+    assert {session.id for session in sessions} == {"s"}
+    assert len(again.events) == 1
+    assert service.stats()["sessions"] == 1
+
+
+def test_evicted_session_is_restored_from_the_database(db):
+    service = BoundedSessionService(ttl=0, max_sessions=1, max_bytes=10**9, persist=True)
+
+    async def run():
+        first = await service.create_session(app_name=APP, user_id=USER, session_id="a", state={"k": "v"})
+        await service.append_event(first, _event("remember me"))
+        await service.create_session(app_name=APP, user_id=USER, session_id="b")
+        return await service.get_session(app_name=APP, user_id=USER, session_id="a")
+
+    restored = asyncio.run(run())
+    assert restored.state == {"k": "v"}
+    assert [event.content.parts[0].text for event in restored.events] == ["remember me"]
+    assert service.stats()["persisted"] >= 1 and service.stats()["restored"] == 1
@@ -0,0 +1,62 @@
+"""
+Tests for single-flight search coalescing
+单飞请求合并测试
+"""
+
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    runs = []
+
+    async def compute():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", compute) for _ in range(5)), flight.do("other", compute))
+
+    assert asyncio.run(main()) == ["result"] * 6
+    assert len(runs) == 2
+    assert flight.stats() == {"in_flight": 0, "calls": 6, "executions": 2, "coalesced": 4}
+
+
+def test_errors_are_shared_and_not_cached():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        results = await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        # A finished call is not reused
+        with pytest.raises(ValueError):
+            await flight.do("key", fail)
+
+    asyncio.run(main())
+    assert flight.executions == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_call():
+    flight = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        return 42
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("key", compute))
+        second = asyncio.ensure_future(flight.do("key", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == 42
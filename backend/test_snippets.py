@@ -0,0 +1,65 @@
+"""
+Tests for query-focused snippet extraction
+摘要片段提取测试
+"""
+
+from snippets import extract_snippet, query_terms
+
+FILLER = "Warm up with a few easy shots before the session starts. " * 8
+
+
+def test_short_content_is_returned_whole():
+    assert extract_snippet("Break shot power", "break") == "Break shot power"
+
+
+def test_english_window_covers_the_query_terms():
+    content = FILLER + "The stun shot stops the cue ball dead on contact. " + FILLER
+
+    snippet = extract_snippet(content, "how to play a stun shot", max_length=120)
+
+    assert "stun shot stops the cue ball" in snippet
+    assert snippet.startswith("...") and snippet.endswith("...")
+    assert len(snippet) <= 120 + 6
+
+
+def test_snippet_starts_at_a_sentence():
+    content = FILLER + "Chalk the tip before every stun shot. " + FILLER
+
+    snippet = extract_snippet(content, "stun shot", max_length=120)
+
+    assert snippet.startswith("...Chalk the tip before every stun shot.")
+
+
+def test_chinese_window_uses_character_bigrams():
+    filler = "练习前先做热身，保持节奏。" * 20
+    content = filler + "低杆的关键是击打母球下方并且出杆要送杆。" + filler
+
+    snippet = extract_snippet(content, "怎么打低杆", max_length=60)
+
+    assert "低杆的关键" in snippet
+    assert len(snippet) <= 60 + 6
+
+
+def test_chinese_query_terms():
+    assert {"低杆", "低", "杆"} <= query_terms("低杆")
+    assert query_terms("how to play the break") == {"play", "break"}
+
+
+def test_matched_chunk_span_is_searched_first():
+    first = "Draw shot: hit below centre. " * 3
+    second = "The draw shot needs a smooth follow through. " * 3
+    content = first + FILLER + second
+    span = (content.index(second), len(content))
+
+    snippet = extract_snippet(content, "draw shot", max_length=80, span=span)
+
+    assert snippet.startswith("...The draw shot needs a smooth follow through.")
+
+
+def test_no_overlap_falls_back_to_the_chunk_start():
+    content = FILLER + "Position play is about planning ahead. " + FILLER
+    span = (len(FILLER), len(content))
+
+    snippet = extract_snippet(content, "zzz", max_length=80, span=span)
+
+    assert snippet.startswith("...Position play")
@@ -0,0 +1,191 @@
+"""
+Tests for FAISS index types, quantization and partition rebuilds
+向量索引类型、量化与重建测试
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import pytest
+
+import vector_index
+from vector_index import (
+    index_spec, live_count, needs_compaction, new_vector_store, rebuild_vector_store,
+    remove_documents, search_store, target_index_spec, tombstone_count,
+)
+
+DIM = 32
+
+
+def _vectors(count, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _store(count, spec=None, seed=0):
+    vectors = _vectors(count, seed)
+    ids = [f"d{n}" for n in range(count)]
+    store = new_vector_store(
+        None, [f"text {n}" for n in range(count)], vectors.tolist(), [{"n": n} for n in range(count)], ids, spec=spec
+    )
+    return store, vectors
+
+
+@lru_cache(maxsize=None)
+def _built(spec):
+    """One store per spec for the module (PQ training is slow)"""
+    return _store(400, spec)
+
+
+def _copy(store):
+    """Writable copy of a cached store"""
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+
+    docstore = InMemoryDocstore({
+        doc_id: store.docstore.search(doc_id) for doc_id in store.index_to_docstore_id.values()
+    })
+    return vector_index.wrap_index(None, faiss.clone_index(store.index), docstore, dict(store.index_to_docstore_id))
+
+
+def _nearest(store, vector, k=1):
+    return [doc.page_content for doc, _ in search_store(store, vector.tolist(), k)]
+
+
+@pytest.mark.parametrize("spec", [("flat", "none"), ("hnsw", "none"), ("ivf", "none")])
+def test_index_types_find_stored_vectors(spec):
+    store, vectors = _store(400, spec)
+
+    assert index_spec(store.index) == spec
+    for n in (0, 123, 399):
+        assert _nearest(store, vectors[n]) == [f"text {n}"]
+
+
+def test_scores_are_cosine_similarities():
+    store, vectors = _store(50)
+    (_, score), = search_store(store, vectors[7].tolist(), 1)
+    assert score == pytest.approx(1.0, abs=1e-5)
+
+
+def test_auto_mode_moves_up_by_size(monkeypatch):
+    monkeypatch.setattr(vector_index, "INDEX_TYPE", "auto")
+    monkeypatch.setattr(vector_index, "HNSW_MIN_VECTORS", 100)
+    monkeypatch.setattr(vector_index, "IVF_MIN_VECTORS", 300)
+    small, _ = _store(50)
+    assert index_spec(small.index) == ("flat", "none") and target_index_spec(small.index) is None
+
+    medium, _ = _store(150, ("flat", "none"))
+    assert target_index_spec(medium.index) == ("hnsw", "none")
+    large, _ = _store(350, ("hnsw", "none"))
+    assert target_index_spec(large.index) == ("ivf", "none")
+    # Never back down: a shrinking partition keeps its index type
+    shrunk, _ = _store(150, ("ivf", "none"))
+    assert target_index_spec(shrunk.index) is None
+
+
+def test_rebuild_changes_type_without_losing_documents():
+    store, vectors = _store(200, ("flat", "none"))
+    rebuilt = rebuild_vector_store(store, drop_ids=["d5"], spec=("hnsw", "none"))
+
+    assert index_spec(rebuilt.index) == ("hnsw", "none")
+    assert live_count(rebuilt) == 199
+    assert _nearest(rebuilt, vectors[6]) == ["text 6"]
+    assert "text 5" not in _nearest(rebuilt, vectors[5], k=5)
+    # The source store is not modified
+    assert live_count(store) == 200
+
+
+@pytest.mark.parametrize("spec", [("flat", "none"), ("hnsw", "none"), ("ivf", "none")])
+def test_removed_documents_are_tombstoned_then_compacted(spec, monkeypatch):
+    monkeypatch.setattr(vector_index, "COMPACT_RATIO", 0.2)
+    store, vectors = _store(400, spec)
+
+    remove_documents(store, [f"d{n}" for n in range(50)])
+    assert tombstone_count(store) == 50 and live_count(store) == 350
+    assert not needs_compaction(store)
+    assert "text 3" not in _nearest(store, vectors[3], k=5)
+    assert len(search_store(store, vectors[3].tolist(), 5)) == 5
+
+    remove_documents(store, [f"d{n}" for n in range(50, 100)])
+    assert needs_compaction(store)
+    compacted = rebuild_vector_store(store)
+    assert index_spec(compacted.index) == spec
+    assert tombstone_count(compacted) == 0 and compacted.index.ntotal == 300
+    assert _nearest(compacted, vectors[250]) == ["text 250"]
+
+
+QUANTIZED = [("flat", "int8"), ("hnsw", "int8"), ("ivf", "int8"), ("flat", "pq"), ("hnsw", "pq"), ("ivf", "pq")]
+
+
+@pytest.mark.parametrize("spec", QUANTIZED)
+def test_quantized_indexes_find_stored_vectors(spec):
+    store, vectors = _built(spec)
+
+    assert index_spec(store.index) == spec and vector_index.is_quantized(store.index)
+    for n in (0, 123, 399):
+        # Compressed codes only approximate the vectors
+        assert f"text {n}" in _nearest(store, vectors[n], k=5)
+    hits = vector_index.cosine_scores(store.index, search_store(store, vectors[0].tolist(), 1))
+    assert -1.0 <= hits[0][1] <= 1.01
+
+
+def test_quantization_is_chosen_by_size(monkeypatch):
+    monkeypatch.setattr(vector_index, "QUANTIZATION", "pq")
+    monkeypatch.setattr(vector_index, "QUANTIZE_MIN_VECTORS", 100)
+    assert vector_index.choose_quantization(50) == "none"
+    # Too few points for PQ codebooks: int8 instead
+    assert vector_index.choose_quantization(500) == "int8"
+    assert vector_index.choose_quantization(256 * 39) == "pq"
+
+
+def test_rebuild_uses_exact_vectors():
+    store, vectors = _store(300, ("flat", "int8"))
+    requested = []
+
+    def exact_vectors(texts):
+        requested.extend(texts)
+        return [vectors[int(text.split()[1])].tolist() for text in texts]
+
+    rebuilt = rebuild_vector_store(store, spec=("hnsw", "int8"), exact_vectors=exact_vectors)
+
+    assert len(requested) == 300
+    assert index_spec(rebuilt.index) == ("hnsw", "int8")
+    assert "text 42" in _nearest(rebuilt, vectors[42], k=3)
+
+
+@pytest.mark.parametrize("spec", QUANTIZED)
+def test_compacting_to_empty_gives_a_flat_partition(spec):
+    store, vectors = _built(spec)
+    store = _copy(store)
+    remove_documents(store, [f"d{n}" for n in range(400)])
+
+    compacted = rebuild_vector_store(store)
+
+    assert index_spec(compacted.index) == ("flat", "none")
+    assert live_count(compacted) == 0 and compacted.index.ntotal == 0
+    assert search_store(compacted, vectors[0].tolist(), 3) == []
+
+
+@pytest.mark.parametrize("spec", QUANTIZED)
+def test_compaction_reuses_trained_codebooks(spec):
+    store, vectors = _built(spec)
+    store = _copy(store)
+    # Far fewer vectors left than PQ or IVF training would need
+    remove_documents(store, [f"d{n}" for n in range(380)])
+
+    compacted = rebuild_vector_store(store)
+
+    assert index_spec(compacted.index) == spec
+    assert live_count(compacted) == 20 and tombstone_count(compacted) == 0
+    assert "text 390" in _nearest(compacted, vectors[390], k=5)
+
+
+def test_untrainable_spec_falls_back_by_size():
+    store, _ = _store(100)
+
+    rebuilt = rebuild_vector_store(store, spec=("flat", "pq"))
+
+    # 100 vectors cannot train 256 PQ centroids
+    assert index_spec(rebuilt.index) == vector_index.choose_index_spec(100)
+    assert live_count(rebuilt) == 100
@@ -0,0 +1,430 @@
+"""
+FAISS index types for the knowledge base partitions
+
+Each language partition uses one of:
+- flat: exact search, cost grows linearly with the partition
+- hnsw: graph index, fast high-recall search (efSearch trades recall for latency)
+- ivf:  inverted lists over trained centroids (nprobe trades recall for latency)
+
+All indexes store L2-normalized vectors and search by inner product, so
+scores are cosine similarities that can be compared across queries and
+cut off with a threshold.
+
+KB_INDEX_TYPE=auto (default) picks by partition size: flat below
+KB_INDEX_HNSW_MIN vectors, hnsw up to KB_INDEX_IVF_MIN, ivf beyond. A
+partition that grows past a threshold is rebuilt from its stored vectors,
+so no re-embedding is needed.
+
+Vectors can also be stored compressed (KB_INDEX_QUANTIZATION): int8
+scalar quantization (4x smaller than float32) or product quantization
+codes (up to 32x smaller). Exact float vectors stay available in the
+on-disk embedding cache, which is used to re-rank the top candidates and
+to rebuild partitions without compounding quantization error.
+
+Removed documents are tombstoned: they leave the docstore and ID map but
+their vectors stay in the FAISS index (HNSW cannot remove vectors and IVF
+removal breaks LangChain's position map), and searches skip them. A
+partition is compacted by a rebuild once tombstones pass
+KB_INDEX_COMPACT_RATIO of its vectors.
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import math
+import os
+import warnings
+
+import numpy as np
+
+
+# ==================== Configuration ====================
+
+INDEX_TYPE = os.getenv("KB_INDEX_TYPE", "auto").lower()
+HNSW_MIN_VECTORS = int(os.getenv("KB_INDEX_HNSW_MIN", "20000"))
+IVF_MIN_VECTORS = int(os.getenv("KB_INDEX_IVF_MIN", "1000000"))
+
+HNSW_M = int(os.getenv("KB_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("KB_HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("KB_HNSW_EF_SEARCH", "64"))
+# 0 = 4 * sqrt(vectors), capped so every centroid gets enough training points
+IVF_NLIST = int(os.getenv("KB_IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("KB_IVF_NPROBE", "32"))
+
+# Vector storage: none (float32), int8 or pq
+QUANTIZATION = os.getenv("KB_INDEX_QUANTIZATION", "none").lower()
+# Partitions smaller than this stay float32 (quantizers need training data)
+QUANTIZE_MIN_VECTORS = int(os.getenv("KB_QUANTIZE_MIN", "10000"))
+# PQ sub-quantizers of one byte each; 0 = dimension / 8 (32x smaller than float32)
+PQ_M = int(os.getenv("KB_PQ_M", "0"))
+# Candidates re-ranked with exact vectors = top_k * factor (0 disables re-ranking)
+RERANK_FACTOR = int(os.getenv("KB_RERANK_FACTOR", "4"))
+# Share of tombstoned vectors at which a partition is compacted
+COMPACT_RATIO = float(os.getenv("KB_INDEX_COMPACT_RATIO", "0.2"))
+
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+QUANTIZATIONS = ("none", "int8", "pq")
+# Training points per centroid FAISS asks for (IVF lists, PQ codebooks)
+_POINTS_PER_CENTROID = 39
+_PQ_CENTROIDS = 256
+
+# (index type, quantization)
+IndexSpec = Tuple[str, str]
+
+
+def index_config() -> Dict:
+    """Index settings, for stats"""
+    return {
+        "type": INDEX_TYPE,
+        "hnsw_min": HNSW_MIN_VECTORS,
+        "ivf_min": IVF_MIN_VECTORS,
+        "hnsw_m": HNSW_M,
+        "hnsw_ef_construction": HNSW_EF_CONSTRUCTION,
+        "hnsw_ef_search": HNSW_EF_SEARCH,
+        "ivf_nlist": IVF_NLIST,
+        "ivf_nprobe": IVF_NPROBE,
+        "quantization": QUANTIZATION,
+        "quantize_min": QUANTIZE_MIN_VECTORS,
+        "pq_m": PQ_M,
+        "rerank_factor": RERANK_FACTOR,
+        "compact_ratio": COMPACT_RATIO,
+    }
+
+
+def choose_index_type(count: int) -> str:
+    """Index type for a partition of the given size"""
+    if INDEX_TYPE in INDEX_TYPES:
+        return INDEX_TYPE
+    if count >= IVF_MIN_VECTORS:
+        return "ivf"
+    if count >= HNSW_MIN_VECTORS:
+        return "hnsw"
+    return "flat"
+
+
+def choose_quantization(count: int) -> str:
+    """Vector storage for a partition of the given size"""
+    if QUANTIZATION not in QUANTIZATIONS or count < QUANTIZE_MIN_VECTORS:
+        return "none"
+    if QUANTIZATION == "pq" and count < _PQ_CENTROIDS * _POINTS_PER_CENTROID:
+        # Too few points to train PQ codebooks well
+        return "int8"
+    return QUANTIZATION
+
+
+def choose_index_spec(count: int) -> IndexSpec:
+    return choose_index_type(count), choose_quantization(count)
+
+
+def index_type(index) -> str:
+    """Type of an existing FAISS index ("flat", "hnsw" or "ivf")"""
+    import faiss
+
+    if faiss.try_extract_index_ivf(index) is not None:
+        return "ivf"
+    if isinstance(faiss.downcast_index(index), faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def index_quantization(index) -> str:
+    """Vector storage of an existing FAISS index ("none", "int8" or "pq")"""
+    import faiss
+
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "int8"
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return "none"
+
+
+def index_spec(index) -> IndexSpec:
+    return index_type(index), index_quantization(index)
+
+
+def target_index_spec(index) -> Optional[IndexSpec]:
+    """
+    Spec a partition should be rebuilt into, or None to keep it
+
+    Forced settings apply immediately. In auto mode a partition only moves
+    up (flat -> hnsw -> ivf, float32 -> quantized), so deleting a few posts
+    near a threshold does not trigger rebuilds back and forth.
+    """
+    current = index_spec(index)
+    kind, quantization = current
+    wanted_kind, wanted_quantization = choose_index_spec(index.ntotal)
+
+    if INDEX_TYPE in INDEX_TYPES or INDEX_TYPES.index(wanted_kind) > INDEX_TYPES.index(kind):
+        kind = wanted_kind
+    if QUANTIZATION not in QUANTIZATIONS or QUANTIZATION == "none" or wanted_quantization != "none":
+        quantization = wanted_quantization
+
+    return (kind, quantization) if (kind, quantization) != current else None
+
+
+def live_count(store) -> int:
+    """Number of searchable (not tombstoned) documents in a vector store"""
+    return len(store.index_to_docstore_id)
+
+
+def tombstone_count(store) -> int:
+    """Number of removed vectors still held by the FAISS index"""
+    return store.index.ntotal - len(store.index_to_docstore_id)
+
+
+def needs_compaction(store) -> bool:
+    """Whether tombstones take up enough of a partition to rebuild it"""
+    return store.index.ntotal > 0 and tombstone_count(store) > COMPACT_RATIO * store.index.ntotal
+
+
+def is_quantized(index) -> bool:
+    return index_quantization(index) != "none"
+
+
+def cosine_scores(index, hits: List[Tuple]) -> List[Tuple]:
+    """
+    (doc, score) hits from an index with scores as cosine similarities
+
+    FAISS has no inner-product HNSW over PQ codes, so those indexes are
+    built with L2; on unit vectors squared L2 is 2 - 2 * cosine, which
+    ranks identically.
+    """
+    import faiss
+
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return hits
+    return [(doc, 1.0 - float(score) / 2.0) for doc, score in hits]
+
+
+# ==================== Reading and writing ====================
+
+def search_store(store, vector: List[float], k: int) -> List[Tuple]:
+    """
+    (doc, score) hits of the k nearest live documents of a vector store
+
+    Over-fetches by the share of tombstoned vectors and skips them, widening
+    the search while tombstones near the query leave fewer than k, so up to
+    k live documents come back. Scores are raw index scores (see cosine_scores).
+    """
+    import faiss
+
+    live = live_count(store)
+    k = min(k, live)
+    if k <= 0:
+        return []
+    total = store.index.ntotal
+    fetch = min(total, math.ceil(k * total / live))
+    query = np.array([vector], dtype=np.float32)
+    faiss.normalize_L2(query)
+    while True:
+        scores, positions = store.index.search(query, fetch)
+        hits = []
+        for score, position in zip(scores[0], positions[0]):
+            doc_id = store.index_to_docstore_id.get(int(position))
+            if doc_id is None:
+                # -1 (not enough results) or a tombstone
+                continue
+            hits.append((store.docstore.search(doc_id), float(score)))
+            if len(hits) == k:
+                return hits
+        if fetch >= total:
+            return hits
+        fetch = min(total, fetch * 2)
+
+
+def add_documents(store, texts: List[str], vectors: List[List[float]], metadatas: List[Dict], ids: List[str]):
+    """
+    Append documents to a vector store in place
+
+    Unlike FAISS.add_embeddings, new positions start at the index size rather
+    than the ID map size, which is smaller once documents are tombstoned.
+    """
+    from langchain_core.documents import Document
+
+    start = store.index.ntotal
+    store.index.add(_normalized(vectors))
+    store.docstore.add({
+        doc_id: Document(page_content=text, metadata=metadata)
+        for doc_id, text, metadata in zip(ids, texts, metadatas)
+    })
+    store.index_to_docstore_id.update({start + n: doc_id for n, doc_id in enumerate(ids)})
+
+
+def remove_documents(store, ids: Iterable[str]):
+    """Tombstone documents of a vector store in place; their vectors stay until compaction"""
+    drop = set(ids)
+    positions = [pos for pos, doc_id in store.index_to_docstore_id.items() if doc_id in drop]
+    removed = [store.index_to_docstore_id.pop(pos) for pos in positions]
+    if removed:
+        store.docstore.delete(removed)
+
+
+# ==================== Building ====================
+
+def wrap_index(embedding_function, index, docstore, index_to_docstore_id: Dict[int, str]):
+    """LangChain FAISS vector store over a cosine (normalized inner product) index"""
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.vectorstores.utils import DistanceStrategy
+
+    with warnings.catch_warnings():
+        # LangChain warns that normalize_L2 is unusual with inner product;
+        # here it is what turns inner product into cosine similarity
+        warnings.simplefilter("ignore")
+        return FAISS(
+            embedding_function=embedding_function,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+            normalize_L2=True,
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+        )
+
+
+def _pq_m(dim: int) -> int:
+    """Number of PQ sub-quantizers; must divide the dimension"""
+    m = min(PQ_M or max(1, dim // 8), dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def _trainable(spec: IndexSpec, count: int) -> bool:
+    """Whether count vectors are enough to train an index of spec"""
+    kind, quantization = spec
+    if quantization == "pq":
+        return count >= _PQ_CENTROIDS
+    if quantization == "int8" or kind == "ivf":
+        return count > 0
+    return True
+
+
+def create_index(spec: IndexSpec, dim: int, vectors: np.ndarray):
+    """
+    Create an empty FAISS index for spec, trained on vectors if needed
+
+    With too few vectors to train spec (e.g. a partition compacted down to
+    a handful of documents), the spec for that many vectors is used instead,
+    and flat float32 if even that needs more.
+    """
+    import faiss
+
+    if not _trainable(spec, len(vectors)):
+        spec = choose_index_spec(len(vectors))
+        if not _trainable(spec, len(vectors)):
+            spec = ("flat", "none")
+    kind, quantization = spec
+    codes = {"int8": "SQ8", "pq": f"PQ{_pq_m(dim)}"}.get(quantization, "Flat")
+    if kind == "hnsw":
+        description = f"HNSW{HNSW_M}" if codes == "Flat" else f"HNSW{HNSW_M},{codes}"
+    elif kind == "ivf":
+        count = len(vectors)
+        nlist = IVF_NLIST or int(4 * math.sqrt(max(count, 1)))
+        nlist = max(1, min(nlist, count // _POINTS_PER_CENTROID))
+        description = f"IVF{nlist},{codes}"
+    else:
+        description = codes
+
+    index = faiss.index_factory(dim, description, faiss.METRIC_INNER_PRODUCT)
+    if kind == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        index.train(_normalized(vectors))
+    tune_index(index)
+    return index
+
+
+def _normalized(vectors) -> np.ndarray:
+    """Contiguous float32 copy of vectors scaled to unit length"""
+    import faiss
+
+    array = np.array(vectors, dtype=np.float32, order="C")
+    if len(array):
+        faiss.normalize_L2(array)
+    return array
+
+
+def tune_index(index):
+    """Apply the search-time knobs (efSearch / nprobe) to an index"""
+    import faiss
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(IVF_NPROBE, ivf.nlist)
+        return
+    hnsw = faiss.downcast_index(index)
+    if isinstance(hnsw, faiss.IndexHNSW):
+        hnsw.hnsw.efSearch = HNSW_EF_SEARCH
+
+
+def new_vector_store(embedding_function, texts: List[str], vectors: List[List[float]], metadatas: List[Dict],
+                     ids: List[str], spec: Optional[IndexSpec] = None):
+    """LangChain FAISS vector store over precomputed vectors, using the configured index type"""
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+
+    array = np.asarray(vectors, dtype=np.float32)
+    index = create_index(spec or choose_index_spec(len(array)), array.shape[1], array)
+    store = wrap_index(embedding_function, index, InMemoryDocstore(), {})
+    # add_embeddings normalizes the vectors (normalize_L2=True)
+    store.add_embeddings(list(zip(texts, array.tolist())), metadatas=metadatas, ids=ids)
+    return store
+
+
+def _stored_vectors(index) -> np.ndarray:
+    """All vectors of an index, in position order (decoded if quantized)"""
+    import faiss
+
+    if faiss.try_extract_index_ivf(index) is not None:
+        # IVF needs a direct map to reconstruct; build it on a copy
+        index = faiss.clone_index(index)
+        faiss.extract_index_ivf(index).make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def rebuild_vector_store(store, drop_ids: Iterable[str] = (), spec: Optional[IndexSpec] = None,
+                         exact_vectors: Optional[Callable[[List[str]], List[Optional[List[float]]]]] = None):
+    """
+    New vector store with the same documents minus drop_ids, optionally with another spec
+
+    Tombstoned vectors are dropped, so this also compacts a partition.
+    Vectors come from exact_vectors(page contents) when it can supply all of
+    them (so quantization error does not build up over rebuilds), otherwise
+    they are read back from the index. Nothing is re-embedded and the
+    source store is not modified. A partition left empty becomes flat.
+    """
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    import faiss
+
+    drop = set(drop_ids)
+    keep = [(pos, doc_id) for pos, doc_id in sorted(store.index_to_docstore_id.items()) if doc_id not in drop]
+    docs = {doc_id: store.docstore.search(doc_id) for _, doc_id in keep}
+
+    vectors = None
+    if exact_vectors is not None and keep and is_quantized(store.index):
+        found = exact_vectors([docs[doc_id].page_content for _, doc_id in keep])
+        if all(v is not None for v in found):
+            vectors = np.asarray(found, dtype=np.float32)
+    if vectors is None:
+        vectors = _stored_vectors(store.index)[[pos for pos, _ in keep]]
+
+    current = index_spec(store.index)
+    spec = spec or current
+    if not keep:
+        # Nothing left to search or to train on
+        index = create_index(("flat", "none"), store.index.d, vectors)
+    elif spec == current:
+        # Reuse the trained centroids and codebooks
+        index = faiss.clone_index(store.index)
+        index.reset()
+    else:
+        index = create_index(spec, store.index.d, vectors)
+    tune_index(index)
+    if len(vectors):
+        index.add(_normalized(vectors))
+
+    return wrap_index(
+        store.embedding_function,
+        index,
+        InMemoryDocstore(docs),
+        {n: doc_id for n, (_, doc_id) in enumerate(keep)},
+    )
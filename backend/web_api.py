@@ -8,7 +8,7 @@ from typing import List, Optional
 
 from database import get_db, Post
 from models import R, PostResponse, PostListResponse, SearchRequest, SearchResponse
-from knowledge_base_agent import search_knowledge_base, _knowledge_base
+from knowledge_base_agent import asearch_knowledge_base, _knowledge_base
 
 router = APIRouter(prefix="/api/web", tags=["Web"])
 
@@ -74,8 +74,9 @@ async def get_post(post_id: str, db: Session = Depends(get_db)):
 async def search_posts(search_request: SearchRequest):
     """Search posts using RAG (public access), optionally filtered by language"""
     try:
-        result = search_knowledge_base(
-            search_request.query, search_request.top_k, language=search_request.language
+        result = await asearch_knowledge_base(
+            search_request.query, search_request.top_k,
+            language=search_request.language, min_score=search_request.min_score
         )
         return R.ok(result)
     except Exception as e:
@@ -87,10 +88,11 @@ async def search_posts_get(
     query: str = Query(..., min_length=1),
     top_k: int = Query(3, ge=1, le=20),
     language: Optional[str] = Query(None),
+    min_score: Optional[float] = Query(None, ge=-1, le=1),
 ):
     """Search posts using RAG (GET method, public access), optionally filtered by language"""
     try:
-        result = search_knowledge_base(query, top_k, language=language)
+        result = await asearch_knowledge_base(query, top_k, language=language, min_score=min_score)
         return R.ok(result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
@@ -1,8 +1,10 @@
 import request from './request'
 
-export function chatWithAgent(message, { agentName = 'knowledge', postId, language } = {}) {
+export function chatWithAgent(message, { agentName = 'knowledge', postId, language, sessionId } = {}) {
   const data = { agent_name: agentName, message }
   if (postId) data.post_id = postId
   if (language) data.language = language
+  // Continue the conversation the server returned for the previous message
+  if (sessionId) data.session_id = sessionId
   return request.post('/api/chat', data)
 }